@@ -202,6 +202,13 @@ class InventoryDifferences(NamedTuple):
 class InventoryModel(InventoryBase):
     def __init__(self):
         self.nodes: Dict[UUID, InventoryNodeBase] = {}
+        # parent_id -> {node_id: node} for every node in the model, whether or not
+        # the parent itself is. Lets us find a container's children without a full scan.
+        self._children: Dict[Optional[UUID], Dict[UUID, InventoryNodeBase]] = {}
+        # Subsets of `nodes` by kind, kept in `nodes` order so queries don't need a full scan
+        self._containers: Dict[UUID, InventoryContainerBase] = {}
+        self._items: Dict[UUID, InventoryNodeBase] = {}
+        self._dirty_categories: Dict[UUID, InventoryCategory] = {}
         self.root: Optional[InventoryContainerBase] = None
         self.any_dirty = asyncio.Event()
 
@@ -246,21 +253,15 @@ class InventoryModel(InventoryBase):
 
     @property
     def all_containers(self) -> Iterable[InventoryContainerBase]:
-        for node in self.nodes.values():
-            if isinstance(node, InventoryContainerBase):
-                yield node
+        return tuple(self._containers.values())
 
     @property
     def dirty_categories(self) -> Iterable[InventoryCategory]:
-        for node in self.nodes.values():
-            if isinstance(node, InventoryCategory) and node.version == InventoryCategory.VERSION_NONE:
-                yield node
+        return tuple(self._dirty_categories.values())
 
     @property
     def all_items(self) -> Iterable[InventoryItem]:
-        for node in self.nodes.values():
-            if not isinstance(node, InventoryContainerBase):
-                yield node  # type: ignore
+        return tuple(self._items.values())  # type: ignore
 
     def __eq__(self, other):
         if not isinstance(other, InventoryModel):
@@ -279,9 +280,14 @@ class InventoryModel(InventoryBase):
             raise KeyError(f"{node.node_id} already exists in the inventory model")
 
         self.nodes[node.node_id] = node
+        self._children.setdefault(node.parent_id, {})[node.node_id] = node
         if isinstance(node, InventoryContainerBase):
+            self._containers[node.node_id] = node
             if node.parent_id == UUID.ZERO:
                 self.root = node
+            self._update_dirty(node)
+        else:
+            self._items[node.node_id] = node
         node.model = weakref.proxy(self)
         return node
 
@@ -316,10 +322,41 @@ class InventoryModel(InventoryBase):
         if isinstance(node, InventoryContainerBase) and not single_only:
             for child in node.children:
                 unlinked.extend(self.unlink(child))
-        self.nodes.pop(node.node_id, None)
+        if self.nodes.pop(node.node_id, None) is not None:
+            self._unindex_child(node, node.parent_id)
+            self._containers.pop(node.node_id, None)
+            self._items.pop(node.node_id, None)
+            self._dirty_categories.pop(node.node_id, None)
         node.model = None
         return unlinked
 
+    def get_children(self, parent_id: Optional[UUID]) -> Sequence[InventoryNodeBase]:
+        return tuple(self._children.get(parent_id, {}).values())
+
+    def _unindex_child(self, node: InventoryNodeBase, parent_id: Optional[UUID]):
+        siblings = self._children.get(parent_id)
+        if siblings is None:
+            return
+        siblings.pop(node.node_id, None)
+        if not siblings:
+            del self._children[parent_id]
+
+    def _update_dirty(self, node: InventoryNodeBase):
+        if isinstance(node, InventoryCategory) and node.version == InventoryCategory.VERSION_NONE:
+            self._dirty_categories[node.node_id] = node
+        else:
+            self._dirty_categories.pop(node.node_id, None)
+
+    def _handle_node_attr_changed(self, node: InventoryNodeBase, key: str, old_val: Any):
+        # Might be a stale copy of a node that's in the model, only the real one is indexed.
+        if self.nodes.get(node.node_id) is not node:
+            return
+        if key == "parent_id":
+            self._unindex_child(node, old_val)
+            self._children.setdefault(node.parent_id, {})[node.node_id] = node
+        elif key == "version":
+            self._update_dirty(node)
+
     def get_differences(self, other: InventoryModel) -> InventoryDifferences:
         # Includes modified things with the same ID
         changed_in_other = []
@@ -347,7 +384,7 @@ class InventoryModel(InventoryBase):
         )
 
     def flag_if_dirty(self):
-        if any(self.dirty_categories):
+        if self._dirty_categories:
             self.any_dirty.set()
 
     def __getitem__(self, item: UUID) -> InventoryNodeBase:
@@ -429,6 +466,8 @@ class _HasBaseNodeAttrs(abc.ABC):
 @dataclasses.dataclass
 class InventoryNodeBase(InventoryBase, _HasBaseNodeAttrs):
     ID_ATTR: ClassVar[str]
+    # Attributes that the model indexes on, and needs to know about changes to
+    MODEL_INDEXED_ATTRS: ClassVar[FrozenSet[str]] = frozenset({"parent_id"})
 
     parent_id: Optional[UUID] = schema_field(SchemaUUID)
 
@@ -436,6 +475,16 @@ class InventoryNodeBase(InventoryBase, _HasBaseNodeAttrs):
         default=None, init=False, hash=False, compare=False, repr=False
     )
 
+    def __setattr__(self, key, value):
+        if key not in self.MODEL_INDEXED_ATTRS:
+            return super().__setattr__(key, value)
+        old_val = self.__dict__.get(key)
+        super().__setattr__(key, value)
+        # Keep the model's indices in sync no matter how the node got changed
+        model = self.__dict__.get("model")
+        if model is not None and old_val != value:
+            model._handle_node_attr_changed(self, key, old_val)
+
     @classmethod
     def get_field_names(cls) -> Set[str]:
         return set(cls._get_fields_dict().keys()) - {"model"}
@@ -480,27 +529,27 @@ class InventoryContainerBase(InventoryNodeBase):
 
     @property
     def children(self) -> Sequence[InventoryNodeBase]:
-        return tuple(
-            x for x in self.model.nodes.values()
-            if x.parent_id == self.node_id
-        )
+        return self.model.get_children(self.node_id)
 
     @property
     def descendents(self) -> List[InventoryNodeBase]:
         new_children: List[InventoryNodeBase] = [self]
         descendents = []
+        seen_ids = set()
         while new_children:
             to_check = new_children[:]
             new_children.clear()
             for obj in to_check:
                 if isinstance(obj, InventoryContainerBase):
                     for child in obj.children:
-                        if child in descendents:
+                        if child.node_id in seen_ids:
                             continue
+                        seen_ids.add(child.node_id)
                         new_children.append(child)
                         descendents.append(child)
                 else:
-                    if obj not in descendents:
+                    if obj.node_id not in seen_ids:
+                        seen_ids.add(obj.node_id)
                         descendents.append(obj)
         return descendents
 
@@ -554,6 +603,7 @@ class InventoryCategory(InventoryContainerBase):
     # AIS calls this something else...
     ID_ATTR_AIS: ClassVar[str] = "category_id"
     SCHEMA_NAME: ClassVar[str] = "inv_category"
+    MODEL_INDEXED_ATTRS: ClassVar[FrozenSet[str]] = frozenset({"parent_id", "version"})
     VERSION_NONE: ClassVar[int] = -1
 
     cat_id: UUID = schema_field(SchemaUUID)
@@ -1,5 +1,8 @@
+import base64
+import binascii
 import calendar
 import datetime
+import re
 import struct
 import typing
 import uuid
@@ -8,7 +11,7 @@ import zlib
 from llsd import *
 # So we can directly reference the original wrapper funcs where necessary
 import llsd as base_llsd
-from llsd.base import is_string, is_unicode
+from llsd.base import is_string, is_unicode, _parse_datestr, LLSDParseError
 
 from hippolyzer.lib.base.datatypes import *
 
@@ -167,6 +170,162 @@ class HippoLLSDBinaryParser(base_llsd.serde_binary.LLSDBinaryParser):
             pass
         return bytes_val
 
+    def parse_many(self, buffer: bytes) -> typing.Iterator[typing.Any]:
+        """Parse a stream of concatenated binary LLSD values, optionally newline-delimited"""
+        self._buffer = buffer
+        self._index = 0
+        if any(buffer.startswith(x) for x in _BINARY_HEADERS):
+            self._index = buffer.index(b"\n") + 1
+        self._keep_binary = True
+        while self._index < len(buffer):
+            if buffer[self._index] in b"\r\n":
+                self._index += 1
+                continue
+            try:
+                yield self._parse()
+            except struct.error as exc:
+                self._error(exc)
+
+
+# Matches a single notation token, along with any separators before it.
+# Each alternative has exactly one named group so `lastgroup` tells us which matched.
+_NOTATION_TOKEN_RE = re.compile(rb"""
+    [\s,]*
+    (?:
+        (?P<open_map>{)
+        |(?P<open_array>\[)
+        |(?P<close>[}\]])
+        |'(?P<sq_key>(?:[^'\\]|\\.)*)'\s*:
+        |"(?P<dq_key>(?:[^"\\]|\\.)*)"\s*:
+        |'(?P<sq_str>(?:[^'\\]|\\.)*)'
+        |"(?P<dq_str>(?:[^"\\]|\\.)*)"
+        |i(?P<int>[-+]?\d+)
+        |u(?P<uuid>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})
+        |r(?P<real>[-+]?(?:(?:\d+(?:\.\d*)?|\d*\.\d+)(?:[eE][-+]?\d+)?|inf|nan))
+        |(?P<undef>!)
+        |(?P<true>1|TRUE|true|[Tt]\b)
+        |(?P<false>0|FALSE|false|[Ff]\b)
+        |d"(?P<date>[^"]*)"
+        |l"(?P<uri>(?:[^"\\]|\\.)*)"
+        |b64"(?P<b64>[^"]*)"
+        |b16"(?P<b16>[^"]*)"
+        |(?P<sized>[sb]\(\d+\))
+    )
+""", re.VERBOSE | re.DOTALL)
+_NOTATION_KEY_SEP_RE = re.compile(rb"\s*:")
+_NOTATION_ESCAPE_RE = re.compile(rb"\\(x[0-9a-fA-F]{2}|.)", re.DOTALL)
+_NOTATION_ESCAPES = {b"a": b"\a", b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v"}
+
+
+def _unescape_notation_match(match: re.Match) -> bytes:
+    escaped = match.group(1)
+    if len(escaped) == 3:
+        return bytes((int(escaped[1:], 16),))
+    return _NOTATION_ESCAPES.get(escaped, escaped)
+
+
+def _unescape_notation(val: bytes) -> str:
+    if b"\\" in val:
+        val = _NOTATION_ESCAPE_RE.sub(_unescape_notation_match, val)
+    return val.decode("utf8")
+
+
+_NOTATION_SCALAR_CONVERTERS: typing.Dict[str, typing.Callable[[bytes], typing.Any]] = {
+    "sq_str": _unescape_notation,
+    "dq_str": _unescape_notation,
+    "int": int,
+    # Much cheaper than letting `UUID()` parse the hex itself
+    "uuid": lambda x: uuid.UUID(int=int(x.replace(b"-", b""), 16)),
+    "real": float,
+    "undef": lambda _: None,
+    "true": lambda _: True,
+    "false": lambda _: False,
+    "date": lambda x: _parse_datestr(x.decode("utf8")),
+    "uri": lambda x: uri(_unescape_notation(x)),
+    "b64": lambda x: binary(base64.b64decode(x)),
+    "b16": lambda x: binary(base64.b16decode(x)),
+}
+
+
+def parse_notation_fast(data: bytes) -> typing.Any:
+    """
+    Parse notation LLSD a whole token at a time rather than a byte at a time
+
+    Gives the same results as `parse_notation()` in under half the time, which
+    matters for things like line-delimited inventory caches.
+    """
+    if data == b"":
+        return False
+    match_token = _NOTATION_TOKEN_RE.match
+    converters = _NOTATION_SCALAR_CONVERTERS
+    # Containers we're currently inside of, and the key we're filling in if it's a map
+    stack: typing.List[typing.Union[dict, list]] = []
+    key_stack: typing.List[typing.Optional[str]] = []
+    pos = 0
+    while True:
+        match = match_token(data, pos)
+        if not match:
+            raise LLSDParseError(f"Invalid notation token at byte {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == "open_map" or kind == "open_array":
+            if stack and type(stack[-1]) is dict and key_stack[-1] is None:
+                raise LLSDParseError(f"Invalid map key at byte {match.start(kind)}")
+            stack.append({} if kind == "open_map" else [])
+            key_stack.append(None)
+            continue
+        elif kind == "sq_key" or kind == "dq_key":
+            if not stack or type(stack[-1]) is not dict or key_stack[-1] is not None:
+                raise LLSDParseError(f"Unexpected map key at byte {match.start(kind)}")
+            key_stack[-1] = _unescape_notation(match.group(kind))
+            continue
+        elif kind == "close":
+            if not stack:
+                raise LLSDParseError(f"Unexpected close token at byte {match.start(kind)}")
+            expected = b"}" if type(stack[-1]) is dict else b"]"
+            if match.group(kind) != expected or key_stack[-1] is not None:
+                raise LLSDParseError(f"Invalid close token at byte {match.start(kind)}")
+            key_stack.pop()
+            val = stack.pop()
+        elif kind == "sized":
+            size_start = match.start(kind) + 2
+            size = int(data[size_start:pos - 1])
+            delim = data[pos:pos + 1]
+            end = pos + 1 + size
+            if delim not in (b"'", b'"') or data[end:end + 1] != delim:
+                raise LLSDParseError(f"Invalid sized token at byte {match.start(kind)}")
+            val = data[pos + 1:end]
+            pos = end + 1
+            if data[size_start - 2] == 0x73:  # s
+                val = val.decode("utf8")
+                # Sized strings can be map keys too
+                if stack and type(stack[-1]) is dict and key_stack[-1] is None:
+                    sep_match = _NOTATION_KEY_SEP_RE.match(data, pos)
+                    if not sep_match:
+                        raise LLSDParseError(f"Missing separator at byte {pos}")
+                    pos = sep_match.end()
+                    key_stack[-1] = val
+                    continue
+            else:
+                val = binary(val)
+        else:
+            try:
+                val = converters[kind](match.group(kind))
+            except (ValueError, binascii.Error) as exc:
+                raise LLSDParseError(f"{exc} at byte {match.start(kind)}")
+
+        if not stack:
+            return val
+        container = stack[-1]
+        if type(container) is dict:
+            key = key_stack[-1]
+            if key is None:
+                raise LLSDParseError(f"Invalid map key at byte {pos}")
+            container[key] = val
+            key_stack[-1] = None
+        else:
+            container.append(val)
+
 
 # Python uses one, C++ uses the other, and everyone's unhappy.
 _BINARY_HEADERS = (b'<? LLSD/Binary ?>', b'<?llsd/binary?>')
@@ -5,7 +5,10 @@ import asyncio
 import copy
 import dataclasses
 import datetime as dt
+import heapq
+import itertools
 import logging
+import time
 from collections import deque
 from typing import *
 from typing import Optional
@@ -17,9 +20,14 @@ from .msgtypes import PacketFlags
 from .udpserializer import UDPMessageSerializer
 
 
+# Same as LL's MTUBYTES, pending ACKs won't be tacked onto a message if they'd push it past this.
+MTU_BYTES = 1200
+
+
 @dataclasses.dataclass
 class ReliableResendInfo:
-    last_resent: dt.datetime
+    # In `time.monotonic()` time
+    last_resent: float
     message: Message
     completed: asyncio.Future = dataclasses.field(default_factory=asyncio.Future)
     tries_left: int = 10
@@ -31,30 +39,82 @@ class Circuit:
         near_host: Optional[ADDR_TUPLE],
         far_host: ADDR_TUPLE,
         transport: Optional[AbstractUDPTransport] = None,
+        reliable_window: int = 1_000,
+        batch_sends: bool = False,
+        coalesce_acks: bool = False,
     ):
         self.near_host: Optional[ADDR_TUPLE] = near_host
         self.host: ADDR_TUPLE = far_host
-        self.is_alive = True
+        self._is_alive = True
         self.transport = transport
         self.serializer = UDPMessageSerializer()
         self.last_packet_at = dt.datetime.now()
         self.packet_id_base = 0
         self.unacked_reliable: Dict[Tuple[Direction, int], ReliableResendInfo] = {}
         self.resend_every: float = 3.0
-        # Reliable messages that we've already seen and handled, for resend suppression
-        self.seen_reliable: deque[int] = deque(maxlen=1_000)
+        # Heap of (last_resent, tiebreaker, resend_info) for unacked reliable messages.
+        # Entries for messages that were acked or resent since being pushed are stale
+        # and get skipped once they bubble up to the top.
+        self._resend_queue: List[Tuple[float, int, ReliableResendInfo]] = []
+        self._resend_counter = itertools.count()
+        # Timer for when the oldest entry in `_resend_queue` comes due, only set while
+        # there's something that might need resending.
+        self._resend_handle: Optional[asyncio.TimerHandle] = None
+        self._resend_due_at: float = 0.0
+        # Reliable messages that we've already seen and handled, for resend suppression.
+        # The set mirrors the deque so membership checks don't need a scan.
+        self.seen_reliable: deque[int] = deque(maxlen=reliable_window)
+        self._seen_reliable_set: Set[int] = set()
+        # If set, datagrams are queued up and handed to the transport together
+        # on the next event loop tick rather than being sent immediately.
+        self.batch_sends = batch_sends
+        self._pending_packets: List[Tuple[UDPPacket, AbstractUDPTransport]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        # If set, ACKs are held onto and tacked onto the next message going the same
+        # direction, or sent in a single PacketAck once `ack_flush_delay` elapses.
+        self.coalesce_acks = coalesce_acks
+        self.ack_flush_delay: float = 0.1
+        self._pending_acks: Dict[Direction, List[int]] = {Direction.OUT: [], Direction.IN: []}
+        self._ack_flush_handle: Optional[asyncio.TimerHandle] = None
+        # Message that `prepare_message()` already serialized, and what it serialized to
+        self._prepared_datagram: Optional[Tuple[Message, bytes]] = None
 
-    def _send_prepared_message(self, message: Message, transport=None):
+    def _serialize_prepared_message(self, message: Message) -> bytes:
+        # `prepare_message()` may have already had to serialize it to figure out how many ACKs fit
+        prepared = self._prepared_datagram
+        self._prepared_datagram = None
+        if prepared is not None and prepared[0] is message:
+            return prepared[1]
         try:
-            serialized = self.serializer.serialize(message)
+            return self.serializer.serialize(message)
         except:
             logging.exception(f"Failed to serialize: {message.to_dict()!r}")
             raise
+
+    def _send_prepared_message(self, message: Message, transport=None):
+        serialized = self._serialize_prepared_message(message)
         return self.send_datagram(serialized, message.direction, transport=transport)
 
+    @property
+    def is_alive(self) -> bool:
+        return self._is_alive
+
+    @is_alive.setter
+    def is_alive(self, val: bool):
+        self._is_alive = val
+        # Resends only go out while the circuit is alive, pick them back up if it comes back.
+        if val:
+            self._schedule_resend()
+        else:
+            self._cancel_resend_timer()
+
     def disconnect(self):
+        # Anything we already said we sent should still go out
+        self.flush_datagrams()
+        self._clear_pending_acks()
         self.packet_id_base = 0
         self.unacked_reliable.clear()
+        self._resend_queue.clear()
         self.is_alive = False
 
     def send_datagram(self, data: bytes, direction: Direction, transport=None):
@@ -64,18 +124,32 @@ class Circuit:
             src_addr, dst_addr = self.near_host, self.host
 
         packet = UDPPacket(src_addr, dst_addr, data, direction)
-        (transport or self.transport).send_packet(packet)
+        transport = transport or self.transport
+        if self.batch_sends:
+            self._pending_packets.append((packet, transport))
+            if self._flush_handle is None:
+                loop = asyncio.get_event_loop_policy().get_event_loop()
+                self._flush_handle = loop.call_soon(self.flush_datagrams)
+        else:
+            transport.send_packet(packet)
         return packet
 
+    def flush_datagrams(self):
+        """Send any datagrams queued up while batching sends"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending_packets = self._pending_packets, []
+        # Keep ordering intact, only batching together consecutive packets for the same transport
+        for transport, group in itertools.groupby(pending, key=lambda x: x[1]):
+            transport.send_packets([packet for packet, _ in group])
+
     def prepare_message(self, message: Message):
         if message.finalized:
             raise RuntimeError(f"Trying to re-send finalized {message!r}")
         message.packet_id = self.packet_id_base
         self.packet_id_base += 1
-        if message.acks:
-            message.send_flags |= PacketFlags.ACK
-        else:
-            message.send_flags &= ~PacketFlags.ACK
+        self._finalize_acks(message)
         # If it was queued, it's not anymore
         message.queued = False
         message.finalized = True
@@ -85,10 +159,12 @@ class Circuit:
         if self.prepare_message(message):
             # If the message originates from us then we're responsible for resends.
             if message.reliable and message.synthetic and not transport:
-                self.unacked_reliable[(message.direction, message.packet_id)] = ReliableResendInfo(
-                    last_resent=dt.datetime.now(),
+                resend_info = ReliableResendInfo(
+                    last_resent=time.monotonic(),
                     message=message,
                 )
+                self.unacked_reliable[(message.direction, message.packet_id)] = resend_info
+                self._queue_resend(resend_info)
             return self._send_prepared_message(message, transport)
 
     def send_reliable(self, message: Message, transport=None) -> asyncio.Future:
@@ -108,12 +184,56 @@ class Circuit:
             if resend_info:
                 resend_info.completed.set_result(None)
 
+    def _queue_resend(self, resend_info: ReliableResendInfo):
+        heapq.heappush(self._resend_queue, (resend_info.last_resent, next(self._resend_counter), resend_info))
+        self._schedule_resend()
+
+    def _is_resend_stale(self, last_resent: float, resend_info: ReliableResendInfo) -> bool:
+        msg = resend_info.message
+        # Already acked, or there's a newer queue entry for it
+        if self.unacked_reliable.get((msg.direction, msg.packet_id)) is not resend_info:
+            return True
+        return resend_info.last_resent != last_resent
+
+    def _schedule_resend(self):
+        """Make sure `resend_unacked()` gets called when the oldest pending resend comes due"""
+        queue = self._resend_queue
+        while queue and self._is_resend_stale(queue[0][0], queue[0][2]):
+            heapq.heappop(queue)
+        if not queue or not self.is_alive:
+            self._cancel_resend_timer()
+            return
+        due_at = queue[0][0] + self.resend_every
+        if self._resend_handle is not None:
+            if self._resend_due_at <= due_at:
+                return
+            self._resend_handle.cancel()
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+        self._resend_due_at = due_at
+        self._resend_handle = loop.call_later(max(0.0, due_at - time.monotonic()), self._handle_resend_timer)
+
+    def _cancel_resend_timer(self):
+        if self._resend_handle is not None:
+            self._resend_handle.cancel()
+            self._resend_handle = None
+
+    def _handle_resend_timer(self):
+        self._resend_handle = None
+        if self.is_alive:
+            self.resend_unacked()
+
     def resend_unacked(self):
-        for resend_info in list(self.unacked_reliable.values()):
-            # Not time to attempt a resend yet
-            if dt.datetime.now() - resend_info.last_resent < dt.timedelta(seconds=self.resend_every):
+        # Everything last sent before this is due for a resend. Since `resend_every` is
+        # the same for every message, the queue is also ordered by when resends are due.
+        resend_before = time.monotonic() - self.resend_every
+        due: List[ReliableResendInfo] = []
+        while self._resend_queue and self._resend_queue[0][0] <= resend_before:
+            last_resent, _, resend_info = heapq.heappop(self._resend_queue)
+            if self._is_resend_stale(last_resent, resend_info):
                 continue
+            due.append(resend_info)
 
+        for resend_info in due:
             msg = copy.copy(resend_info.message)
             resend_info.tries_left -= 1
             # We were on our last try and we never received an ack
@@ -122,23 +242,79 @@ class Circuit:
                 del self.unacked_reliable[(msg.direction, msg.packet_id)]
                 resend_info.completed.set_exception(TimeoutError("Exceeded resend limit"))
                 continue
-            resend_info.last_resent = dt.datetime.now()
+            resend_info.last_resent = time.monotonic()
+            self._queue_resend(resend_info)
             msg.send_flags |= PacketFlags.RESENT
             self._send_prepared_message(msg)
+        self._schedule_resend()
 
     def send_acks(self, to_ack: Sequence[int], direction=Direction.OUT, packet_id=None):
         logging.debug("%r acking %r" % (direction, to_ack))
-        # TODO: maybe tack this onto `.acks` for next message?
+        # If we were asked to use a specific packet ID then the PacketAck has to go out now,
+        # it's filling a hole in the packet ID sequence.
+        if self.coalesce_acks and packet_id is None:
+            self._pending_acks[direction].extend(to_ack)
+            if self._ack_flush_handle is None:
+                loop = asyncio.get_event_loop_policy().get_event_loop()
+                self._ack_flush_handle = loop.call_later(self.ack_flush_delay, self.flush_acks)
+            return
         message = Message('PacketAck', *[Block('Packets', ID=x) for x in to_ack])
         message.packet_id = packet_id
         message.direction = direction
         self.send(message)
 
+    def _finalize_acks(self, message: Message):
+        """Attach any pending ACKs that fit to `message` and set its ACK flag to match"""
+        pending = self._pending_acks[message.direction]
+        if not pending:
+            if message.acks:
+                message.send_flags |= PacketFlags.ACK
+            else:
+                message.send_flags &= ~PacketFlags.ACK
+            return
+        # Only attach as many as will fit without pushing the datagram past the MTU.
+        # The ACK count in the packet trailer is a single byte, so that's a limit too.
+        # Serialize without the trailer so we can tack it on after and not have to re-serialize.
+        message.send_flags &= ~PacketFlags.ACK
+        serialized = self.serializer.serialize(message)
+        max_acks = min(0xFF, (MTU_BYTES - len(serialized) - 1) // 4)
+        num_to_attach = min(len(pending), max_acks - len(message.acks))
+        if num_to_attach > 0:
+            message.acks = (*message.acks, *pending[:num_to_attach])
+            del pending[:num_to_attach]
+        if message.acks:
+            message.send_flags |= PacketFlags.ACK
+        self._prepared_datagram = (message, self.serializer.append_acks(serialized, message.acks))
+
+    def flush_acks(self):
+        """Send any ACKs that are still pending in as few PacketAcks as possible"""
+        if self._ack_flush_handle is not None:
+            self._ack_flush_handle.cancel()
+            self._ack_flush_handle = None
+        for direction, pending in self._pending_acks.items():
+            # `Packets` is a variable block, can't have more than 255 of them
+            while pending:
+                to_ack, pending[:] = pending[:0xFF], pending[0xFF:]
+                message = Message('PacketAck', *[Block('Packets', ID=x) for x in to_ack])
+                message.direction = direction
+                self.send(message)
+
+    def _clear_pending_acks(self):
+        if self._ack_flush_handle is not None:
+            self._ack_flush_handle.cancel()
+            self._ack_flush_handle = None
+        for pending in self._pending_acks.values():
+            pending.clear()
+
     def track_reliable(self, packet_id: int) -> bool:
         """Tracks a reliable packet, returning if it's a new message"""
-        if packet_id in self.seen_reliable:
+        if packet_id in self._seen_reliable_set:
             return False
+        if len(self.seen_reliable) == self.seen_reliable.maxlen:
+            # Oldest ID is about to fall off the end of the deque
+            self._seen_reliable_set.discard(self.seen_reliable[0])
         self.seen_reliable.append(packet_id)
+        self._seen_reliable_set.add(packet_id)
         return True
 
     def __repr__(self):
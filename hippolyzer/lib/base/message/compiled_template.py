@@ -0,0 +1,426 @@
+"""
+Specialized per-template codecs for the UDP message (de)serializers.
+
+The generic (de)serializers walk the template and dispatch on each variable's
+type for every packet. These precompute that work once per template, merging
+runs of fixed-size variables into a single `struct.Struct` and only handling
+variable-length fields individually.
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+import uuid
+from logging import getLogger
+from typing import *
+
+from hippolyzer.lib.base import serialization as se
+from hippolyzer.lib.base.datatypes import JankStringyBytes, Quaternion, RawBytes, TupleCoord, UUID, Vector3, Vector4
+from .data_packer import TemplateDataPacker
+from .message import Block, Message, MsgBlockList
+from .msgtypes import MsgBlockType, MsgType
+from .template import MessageTemplate, MessageTemplateBlock, MessageTemplateVariable
+
+LOG = getLogger('message.compiled_template')
+
+# Takes the flat tuple of unpacked values and the index of the var's first value
+_VAL_CONVERTER = Callable[[Tuple, int], Any]
+
+
+def _swap_u16(vals, idx):
+    # IP ports are the only big-endian vars in message bodies
+    val = vals[idx]
+    return ((val & 0xFF) << 8) | (val >> 8)
+
+
+def _make_coord_converter(typ: Type, num_elems: int) -> _VAL_CONVERTER:
+    if num_elems == 3:
+        return lambda vals, idx: typ(vals[idx], vals[idx + 1], vals[idx + 2])
+    return lambda vals, idx: typ(*vals[idx:idx + num_elems])
+
+
+# (struct format, number of values, converter or None if the value is used as-is)
+_FIXED_SPECS: Dict[MsgType, Tuple[str, int, Optional[_VAL_CONVERTER]]] = {
+    MsgType.MVT_S8: ("b", 1, None),
+    MsgType.MVT_U8: ("B", 1, None),
+    MsgType.MVT_BOOL: ("B", 1, None),
+    MsgType.MVT_U16: ("H", 1, None),
+    MsgType.MVT_U32: ("I", 1, None),
+    MsgType.MVT_U64: ("Q", 1, None),
+    MsgType.MVT_S16: ("h", 1, None),
+    MsgType.MVT_S32: ("i", 1, None),
+    MsgType.MVT_S64: ("q", 1, None),
+    MsgType.MVT_F32: ("f", 1, None),
+    MsgType.MVT_F64: ("d", 1, None),
+    MsgType.MVT_IP_PORT: ("H", 1, _swap_u16),
+    MsgType.MVT_IP_ADDR: ("4s", 1, lambda vals, idx: socket.inet_ntoa(vals[idx])),
+    MsgType.MVT_LLUUID: ("16s", 1, lambda vals, idx: UUID(bytes=vals[idx])),
+    MsgType.MVT_LLVector3: ("3f", 3, _make_coord_converter(Vector3, 3)),
+    MsgType.MVT_LLVector3d: ("3d", 3, _make_coord_converter(Vector3, 3)),
+    MsgType.MVT_LLVector4: ("4f", 4, _make_coord_converter(Vector4, 4)),
+    MsgType.MVT_LLQuaternion: ("3f", 3, _make_coord_converter(Quaternion, 3)),
+}
+
+_pack_bytes = TemplateDataPacker.PACKERS[MsgType.MVT_VARIABLE]
+
+_LEN_STRUCTS = {
+    1: struct.Struct("<B"),
+    2: struct.Struct("<H"),
+    4: struct.Struct("<I"),
+}
+
+
+def make_bytes_finisher(tmpl_variable: MessageTemplateVariable) -> Callable[[bytes], Any]:
+    """
+    Get a function that guesses whether a FIXED or VARIABLE var is really a string
+
+    Must be kept in sync with the rules the template var uses for guessing.
+    """
+    if tmpl_variable.probably_binary:
+        return bytes
+
+    if tmpl_variable.probably_text:
+        def _finish_text(data: bytes):
+            # If it has a null terminator, let's try to decode it first.
+            # We don't want to do this if there isn't one, because that may change
+            # the meaning of the data.
+            if data.endswith(b"\x00"):
+                try:
+                    return data.decode("utf8").rstrip("\x00")
+                except UnicodeDecodeError:
+                    pass
+            # Failed, return jank stringy bytes
+            return JankStringyBytes(data)
+        return _finish_text
+
+    # No idea if this should be bytes or a string... make an object that's sort of both.
+    return JankStringyBytes
+
+
+class _FixedRun(NamedTuple):
+    struct: struct.Struct
+    # (var name, index of first value, converter)
+    fields: Tuple[Tuple[str, int, Optional[_VAL_CONVERTER]], ...]
+
+
+class _VariableField(NamedTuple):
+    name: str
+    len_struct: struct.Struct
+    finisher: Callable[[bytes], Any]
+
+
+class CompiledBlockDecoder:
+    __slots__ = ("name", "block_type", "number", "steps")
+
+    def __init__(self, tmpl_block: MessageTemplateBlock):
+        self.name = tmpl_block.name
+        self.block_type = tmpl_block.block_type
+        self.number = tmpl_block.number
+        self.steps: List[Union[_FixedRun, _VariableField]] = []
+
+        run_fmt = ""
+        run_fields = []
+        run_vals = 0
+
+        def _flush_run():
+            nonlocal run_fmt, run_fields, run_vals
+            if run_fields:
+                self.steps.append(_FixedRun(struct.Struct("<" + run_fmt), tuple(run_fields)))
+            run_fmt = ""
+            run_fields = []
+            run_vals = 0
+
+        for tmpl_var in tmpl_block.variables:
+            if tmpl_var.type == MsgType.MVT_VARIABLE:
+                _flush_run()
+                self.steps.append(_VariableField(
+                    tmpl_var.name,
+                    _LEN_STRUCTS[tmpl_var.size],
+                    make_bytes_finisher(tmpl_var),
+                ))
+                continue
+
+            if tmpl_var.type == MsgType.MVT_FIXED:
+                fmt, num_vals = f"{tmpl_var.size}s", 1
+                finisher = make_bytes_finisher(tmpl_var)
+
+                def converter(vals, idx, _finisher=finisher):
+                    return _finisher(vals[idx])
+            else:
+                fmt, num_vals, converter = _FIXED_SPECS[tmpl_var.type]
+            run_fields.append((tmpl_var.name, run_vals, converter))
+            run_fmt += fmt
+            run_vals += num_vals
+        _flush_run()
+
+    def decode(self, buf, pos: int, block: Block) -> int:
+        block_vars = block.vars
+        buf_len = len(buf)
+        for step in self.steps:
+            if step.__class__ is _FixedRun:
+                run_struct = step.struct
+                end_pos = pos + run_struct.size
+                if end_pos > buf_len:
+                    raise ValueError(f"{buf_len - pos} bytes left, needed {run_struct.size}")
+                vals = run_struct.unpack_from(buf, pos)
+                pos = end_pos
+                for name, idx, converter in step.fields:
+                    if converter is None:
+                        block_vars[name] = vals[idx]
+                    else:
+                        block_vars[name] = converter(vals, idx)
+            else:
+                len_struct = step.len_struct
+                end_pos = pos + len_struct.size
+                if end_pos > buf_len:
+                    raise ValueError(f"{buf_len - pos} bytes left, needed {len_struct.size}")
+                data_size = len_struct.unpack_from(buf, pos)[0]
+                pos = end_pos
+                end_pos = pos + data_size
+                if end_pos > buf_len:
+                    raise ValueError(f"{buf_len - pos} bytes left, needed {data_size}")
+                block_vars[step.name] = step.finisher(bytes(buf[pos:end_pos]))
+                pos = end_pos
+        return pos
+
+
+class CompiledTemplateDecoder:
+    """Decoder for the blocks of a single message template"""
+    __slots__ = ("name", "blocks")
+
+    def __init__(self, template: MessageTemplate):
+        self.name = template.name
+        self.blocks = tuple(CompiledBlockDecoder(b) for b in template.blocks)
+
+    @classmethod
+    def for_template(cls, template: MessageTemplate) -> CompiledTemplateDecoder:
+        """Get the decoder for `template`, compiling it if this is the first use"""
+        decoder = template.compiled_decoder
+        if decoder is None:
+            decoder = cls(template)
+            template.compiled_decoder = decoder
+        return decoder
+
+    def decode(self, msg: Message, buf, pos: int) -> int:
+        """
+        Decode the blocks of `msg` from `buf`, starting at `pos`
+
+        Returns the position of the end of the last read block.
+        """
+        msg_name = msg.name
+        msg_blocks = msg.blocks
+        buf_len = len(buf)
+        for block_decoder in self.blocks:
+            # EOF?
+            if pos >= buf_len:
+                # Seems like even some "Single" blocks are optional?
+                LOG.debug("Data ended before block %s, bailing out" % block_decoder.name)
+                break
+
+            block_type = block_decoder.block_type
+            if block_type == MsgBlockType.MBT_SINGLE:
+                repeat_count = 1
+            elif block_type == MsgBlockType.MBT_MULTIPLE:
+                repeat_count = block_decoder.number
+            elif block_type == MsgBlockType.MBT_VARIABLE:
+                repeat_count = buf[pos]
+                pos += 1
+            else:
+                raise ValueError("ERROR: Unknown block type: %s in %s packet." %
+                                 (str(block_type), msg_name))
+
+            block_name = block_decoder.name
+            # Track that we _saw_ this block at least.
+            block_list = msg_blocks.setdefault(block_name, MsgBlockList())
+            for _ in range(repeat_count):
+                block = Block(block_name)
+                block.message_name = msg_name
+                block_list.append(block)
+                try:
+                    pos = block_decoder.decode(buf, pos, block)
+                except:
+                    LOG.exception(f"Raised while parsing block {msg_name}.{block_name}")
+                    raise
+        return pos
+
+
+# Appends the packable form of a var's value to the list of args for a `struct.Struct`
+_VAL_APPENDER = Callable[[List, Any], None]
+
+
+def _append_uuid(args: List, val):
+    args.append(val.bytes if isinstance(val, uuid.UUID) else UUID(val).bytes)
+
+
+def _append_swapped_u16(args: List, val):
+    if not 0 <= val <= 0xFFFF:
+        raise ValueError(f"Port {val!r} out of range")
+    args.append(((val & 0xFF) << 8) | (val >> 8))
+
+
+def _append_vec3(args: List, val):
+    x, y, z = val
+    args += (x, y, z)
+
+
+def _append_vec4(args: List, val):
+    x, y, z, w = val
+    args += (x, y, z, w)
+
+
+def _append_quat(args: List, val):
+    # We don't actually need to send W
+    if isinstance(val, TupleCoord):
+        val = val.data()
+    x, y, z = val[:3]
+    args += (x, y, z)
+
+
+# (struct format, appender or None if the value may be packed as-is)
+_FIXED_PACK_SPECS: Dict[MsgType, Tuple[str, Optional[_VAL_APPENDER]]] = {
+    MsgType.MVT_S8: ("b", None),
+    MsgType.MVT_U8: ("B", None),
+    MsgType.MVT_BOOL: ("B", None),
+    MsgType.MVT_U16: ("H", None),
+    MsgType.MVT_U32: ("I", None),
+    MsgType.MVT_U64: ("Q", None),
+    MsgType.MVT_S16: ("h", None),
+    MsgType.MVT_S32: ("i", None),
+    MsgType.MVT_S64: ("q", None),
+    MsgType.MVT_F32: ("f", None),
+    MsgType.MVT_F64: ("d", None),
+    MsgType.MVT_IP_PORT: ("H", _append_swapped_u16),
+    MsgType.MVT_IP_ADDR: ("4s", lambda args, val: args.append(socket.inet_aton(val))),
+    MsgType.MVT_LLUUID: ("16s", _append_uuid),
+    MsgType.MVT_LLVector3: ("3f", _append_vec3),
+    MsgType.MVT_LLVector3d: ("3d", _append_vec3),
+    MsgType.MVT_LLVector4: ("4f", _append_vec4),
+    MsgType.MVT_LLQuaternion: ("3f", _append_quat),
+}
+
+
+class _PackedRun(NamedTuple):
+    struct: struct.Struct
+    # (var name, appender)
+    fields: Tuple[Tuple[str, Optional[_VAL_APPENDER]], ...]
+
+
+class _PackedBytesField(NamedTuple):
+    name: str
+    # None for MVT_FIXED, which has no length prefix
+    len_struct: Optional[struct.Struct]
+
+
+class CompiledBlockEncoder:
+    __slots__ = ("name", "steps")
+
+    def __init__(self, tmpl_block: MessageTemplateBlock):
+        self.name = tmpl_block.name
+        self.steps: List[Union[_PackedRun, _PackedBytesField]] = []
+
+        run_fmt = ""
+        run_fields = []
+
+        for tmpl_var in tmpl_block.variables:
+            if tmpl_var.type in (MsgType.MVT_VARIABLE, MsgType.MVT_FIXED):
+                # Length of the packed bytes for fixed vars isn't enforced,
+                # so these can't be part of a struct.
+                if run_fields:
+                    self.steps.append(_PackedRun(struct.Struct("<" + run_fmt), tuple(run_fields)))
+                    run_fmt = ""
+                    run_fields = []
+                len_struct = None
+                if tmpl_var.type == MsgType.MVT_VARIABLE:
+                    len_struct = _LEN_STRUCTS[tmpl_var.size]
+                self.steps.append(_PackedBytesField(tmpl_var.name, len_struct))
+                continue
+
+            fmt, appender = _FIXED_PACK_SPECS[tmpl_var.type]
+            run_fields.append((tmpl_var.name, appender))
+            run_fmt += fmt
+        if run_fields:
+            self.steps.append(_PackedRun(struct.Struct("<" + run_fmt), tuple(run_fields)))
+
+    def encode(self, writer: se.BufferWriter, block_list: MsgBlockList) -> bool:
+        """
+        Write the packed vars of every block in `block_list` to `writer`
+
+        Returns `False` without writing anything if any of the blocks need the
+        special handling the generic serializer does, like `RawBytes` vars or
+        filling missing vars.
+        """
+        try:
+            buf = self._pack(block_list)
+        except (struct.error, ValueError, TypeError):
+            # Let the generic serializer raise a more specific error for the bad var
+            return False
+        if buf is None:
+            return False
+        writer.write_bytes(buf)
+        return True
+
+    def _pack(self, block_list: MsgBlockList) -> Optional[bytearray]:
+        pack_bytes = _pack_bytes
+        # (struct or None for raw bytes, struct args or bytes)
+        chunks = []
+        size = 0
+        for block in block_list:
+            if block.fill_missing:
+                return None
+            block_vars = block.vars
+            for step in self.steps:
+                if step.__class__ is _PackedRun:
+                    args = []
+                    for name, appender in step.fields:
+                        val = block_vars.get(name)
+                        if val is None or isinstance(val, RawBytes):
+                            return None
+                        if appender is None:
+                            args.append(val)
+                        else:
+                            appender(args, val)
+                    chunks.append((step.struct, args))
+                    size += step.struct.size
+                else:
+                    val = block_vars.get(step.name)
+                    if val is None or isinstance(val, RawBytes):
+                        return None
+                    packed = pack_bytes(val)
+                    len_struct = step.len_struct
+                    if len_struct is not None:
+                        chunks.append((len_struct, (len(packed),)))
+                        size += len_struct.size
+                    chunks.append((None, packed))
+                    size += len(packed)
+
+        # Pack everything into a single preallocated buffer
+        buf = bytearray(size)
+        pos = 0
+        for chunk_struct, chunk in chunks:
+            if chunk_struct is None:
+                end_pos = pos + len(chunk)
+                buf[pos:end_pos] = chunk
+                pos = end_pos
+            else:
+                chunk_struct.pack_into(buf, pos, *chunk)
+                pos += chunk_struct.size
+        return buf
+
+
+class CompiledTemplateEncoder:
+    """Encoder for the blocks of a single message template"""
+    __slots__ = ("name", "blocks")
+
+    def __init__(self, template: MessageTemplate):
+        self.name = template.name
+        self.blocks: Dict[str, CompiledBlockEncoder] = {b.name: CompiledBlockEncoder(b) for b in template.blocks}
+
+    @classmethod
+    def for_template(cls, template: MessageTemplate) -> CompiledTemplateEncoder:
+        """Get the encoder for `template`, compiling it if this is the first use"""
+        encoder = template.compiled_encoder
+        if encoder is None:
+            encoder = cls(template)
+            template.compiled_encoder = encoder
+        return encoder
@@ -39,12 +39,17 @@ from hippolyzer.lib.base.network.transport import Direction, ADDR_TUPLE
 BLOCK_DICT = Dict[str, "MsgBlockList"]
 VAR_TYPE = Union[TupleCoord, bytes, str, float, int, Tuple, UUID]
 
+# Var values of these types can be shared between copies of a block.
+# Note that `TupleCoord`s are mutable, so aren't included.
+_IMMUTABLE_VAR_TYPES = (bytes, str, int, float, UUID, type(None))
+
 _TEMPLATES_MTIME = os.stat(templates.__file__).st_mtime
 
 
 def maybe_reload_templates():
     # Templates may be modified at runtime during development, check
     # if they've changed since startup and reload if they have.
+    # Not cheap enough to call per-message, callers should do it periodically.
     global _TEMPLATES_MTIME
     templates_mtime = os.stat(templates.__file__).st_mtime
 
@@ -133,6 +138,25 @@ class Block:
     def items(self):
         return self.vars.items()
 
+    def copy(self) -> Block:
+        """
+        Make a copy of this block that can be mutated independently of the original
+
+        Much cheaper than a `deepcopy()`, only var values that may be mutated in-place are copied.
+        """
+        new_block = self.__class__.__new__(self.__class__)
+        new_block.name = self.name
+        new_block.size = self.size
+        new_block.message_name = self.message_name
+        new_block.fill_missing = self.fill_missing
+        new_block.vars = {
+            k: v if isinstance(v, _IMMUTABLE_VAR_TYPES) else copy.deepcopy(v) for k, v in self.vars.items()
+        }
+        # Cached deserialized values are already copied on the way out of `deserialize_var()`
+        # unless the caller promised not to mutate them, so they can be shared.
+        new_block._ser_cache = self._ser_cache.copy()
+        return new_block
+
     def finalize(self):
         # Stupid hack around the fact that blocks don't know how to
         # invoke field-specific serializers until they're added to a message.
@@ -191,9 +215,6 @@ class Message:
                  "direction", "meta", "synthetic", "dropped", "sender", "unknown_message")
 
     def __init__(self, name, *args, packet_id=None, flags=0, acks=None, direction=None):
-        # TODO: Do this on a timer or something.
-        maybe_reload_templates()
-
         self.name = name
         self.send_flags = flags
         self.packet_id: Optional[int] = packet_id  # aka, sequence number
@@ -390,7 +411,7 @@ class Message:
         return f"{self.__class__.__name__}({self._args_repr(pretty=pretty)})"
 
     def take(self):
-        message_copy = copy.deepcopy(self)
+        message_copy = self._copy_for_take()
 
         # Set the queued flag so the original will be dropped and acks will be sent
         if not self.finalized:
@@ -405,6 +426,31 @@ class Message:
         message_copy.queued = False
         return message_copy
 
+    def _copy_for_take(self) -> Message:
+        message_copy = self.__class__.__new__(self.__class__)
+        # `__slots__` only has the slots of the most-derived class, subclasses may add their own.
+        for klass in self.__class__.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            for attr in slots:
+                if attr in ("__dict__", "__weakref__") or not hasattr(self, attr):
+                    continue
+                setattr(message_copy, attr, getattr(self, attr))
+        # Subclasses without `__slots__` keep their attributes in a `__dict__` instead
+        if hasattr(self, "__dict__"):
+            message_copy.__dict__.update(self.__dict__)
+        message_copy.meta = copy.deepcopy(self.meta)
+        if self.raw_body and self.deserializer and self.deserializer():
+            # Still unparsed, the copy can just lazily parse the (immutable) raw body itself.
+            message_copy._blocks = {}
+        else:
+            message_copy._blocks = {
+                name: MsgBlockList(block.copy() for block in block_list)
+                for name, block_list in self._blocks.items()
+            }
+        return message_copy
+
     def to_summary(self):
         string = ""
         for block_name, block_list in self.blocks.items():
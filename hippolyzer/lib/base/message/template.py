@@ -118,6 +118,9 @@ class MessageTemplate:
         self.trusted = False
         self.deprecation = None
         self.encoding = None
+        # Lazily-built codecs specialized for this template
+        self.compiled_decoder = None
+        self.compiled_encoder = None
 
     def add_block(self, block: MessageTemplateBlock):
         self.block_map[block.name] = block
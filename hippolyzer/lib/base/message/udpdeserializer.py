@@ -19,15 +19,17 @@ along with this program; if not, write to the Free Software Foundation,
 Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 import io
+import itertools
 from typing import *
 import weakref
 from logging import getLogger
 
 from hippolyzer.lib.base.datatypes import JankStringyBytes
 from hippolyzer.lib.base.settings import Settings
-from .template import MessageTemplateVariable
+from .template import MessageTemplate, MessageTemplateVariable
 from .template_dict import DEFAULT_TEMPLATE_DICT
 from .msgtypes import MsgType, MsgBlockType, PacketLayout
+from .compiled_template import CompiledTemplateDecoder
 from .data_packer import TemplateDataPacker
 from .message import Message, Block
 
@@ -168,6 +170,20 @@ class UDPMessageDeserializer:
         current_template = self.template_dict.get_template_by_name(msg.name)
         reader.seek(current_template.get_msg_freq_num_len() + msg.offset)
 
+        if self.settings.ENABLE_COMPILED_MESSAGE_DECODERS:
+            decoder = CompiledTemplateDecoder.for_template(current_template)
+            reader.seek(decoder.decode(msg, raw_body, reader.tell()))
+        else:
+            self._parse_blocks(msg, current_template, reader)
+
+        if not msg.blocks and current_template.blocks:
+            raise exc.MessageDeserializationError("message", "message is empty")
+
+        if len(reader):
+            LOG.warning(f"Left {len(reader)} bytes unread past end of {msg.name} message, "
+                        f"is your message template up to date? {reader.read_bytes(len(reader))!r}")
+
+    def _parse_blocks(self, msg: Message, current_template: MessageTemplate, reader: se.BufferReader):
         for tmpl_block in current_template.blocks:
             # EOF?
             if not len(reader):
@@ -204,13 +220,6 @@ class UDPMessageDeserializer:
                         LOG.exception(f"Raised while parsing var in {context_str}")
                         raise
 
-        if not msg.blocks and current_template.blocks:
-            raise exc.MessageDeserializationError("message", "message is empty")
-
-        if len(reader):
-            LOG.warning(f"Left {len(reader)} bytes unread past end of {msg.name} message, "
-                        f"is your message template up to date? {reader.read_bytes(len(reader))!r}")
-
     def _parse_var(self, reader: se.BufferReader, tmpl_variable: MessageTemplateVariable):
         data_size = tmpl_variable.size
         if tmpl_variable.type == MsgType.MVT_VARIABLE:
@@ -251,30 +260,42 @@ class UDPMessageDeserializer:
 
     @staticmethod
     def zero_code_expand(msg_buf: bytes):
-        decode_buf = bytearray()
-        in_zero = False
-        for c in msg_buf:
+        # Each zero in the input is followed by one of these parts
+        parts = msg_buf.split(b"\x00")
+        decode_buf = bytearray(parts[0])
+        num_zeros = 0
+        for part in itertools.islice(parts, 1, None):
             # Well beyond what the viewer allows zerocoding to expand to
             if len(decode_buf) > 0x3000:
                 raise ValueError("Unreasonably large zerocoded message")
-
-            if c == 0x00:
-                # Always have to write the zero in case we're the last byte
-                decode_buf.append(0x00)
-                # zerocoding continuation. ironically the canonical compressor
-                # will never use these, but they're valid.
-                if in_zero:
-                    decode_buf.extend(b"\x00" * 255)
-                in_zero = True
+            num_zeros += 1
+            # Empty part means the zero was followed by another zero or the end of the message
+            if not part:
+                continue
+            # First byte of the part is the number of zeros to write
+            if num_zeros == 1:
+                decode_buf += _ZEROS[part[0]]
             else:
-                # This byte is the number of zeros to write
-                if in_zero:
-                    # The initial zero was already written
-                    zero_count = c - 1
-                    decode_buf.extend(b"\x00" * zero_count)
-                    in_zero = False
-                # Regular character
-                else:
-                    decode_buf.append(c)
-
+                # zerocoding continuation. ironically the canonical compressor
+                # will never use these, but they're valid. Each extra zero adds 255 more zeros.
+                decode_buf += bytes((num_zeros - 1) * 256 + part[0])
+            # Regular characters
+            decode_buf += part[1:]
+            num_zeros = 0
+
+        if num_zeros:
+            # Always have to write the zero in case we're the last byte
+            decode_buf += bytes((num_zeros - 1) * 256 + 1)
+            last_added = 256 if num_zeros > 1 else 1
+        elif len(parts) > 1 and len(parts[-1]) == 1:
+            # Last byte was a zero count
+            last_added = parts[-1][0] - 1
+        else:
+            last_added = 1
+        # The size limit applies to the output before the final input byte was handled
+        if msg_buf and len(decode_buf) - last_added > 0x3000:
+            raise ValueError("Unreasonably large zerocoded message")
         return decode_buf
+
+
+_ZEROS = tuple(bytes(i) for i in range(256))
@@ -19,12 +19,14 @@ along with this program; if not, write to the Free Software Foundation,
 Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 import copy
+import re
 from typing import *
 from logging import getLogger
 
+from .compiled_template import CompiledTemplateEncoder
 from .data_packer import TemplateDataPacker
 from .message import Message, MsgBlockList
-from .msgtypes import MsgType, MsgBlockType
+from .msgtypes import MsgType, MsgBlockType, PacketFlags
 from .template import MessageTemplateVariable, MessageTemplateBlock
 from .template_dict import TemplateDictionary, DEFAULT_TEMPLATE_DICT
 from hippolyzer.lib.base import exc
@@ -71,6 +73,7 @@ class UDPMessageSerializer:
             body_writer = se.BufferWriter("<")
             body_writer.write_bytes(current_template.freq_num_bytes)
             body_writer.write_bytes(msg.extra)
+            encoder = CompiledTemplateEncoder.for_template(current_template)
 
             # We're going to pop off keys as we go, so shallow copy the dict.
             blocks = copy.copy(msg.blocks)
@@ -94,10 +97,10 @@ class UDPMessageSerializer:
                     # Normally we wouldn't even put these to match SL behavior, but in this case we need the
                     # empty blocks so the decoder will decode these as the correct block type.
                     for missing_block in missing_blocks:
-                        self._serialize_block_list(body_writer, missing_block, MsgBlockList())
+                        self._serialize_block_list(body_writer, missing_block, MsgBlockList(), encoder)
                     missing_blocks.clear()
 
-                self._serialize_block_list(body_writer, tmpl_block, block_list)
+                self._serialize_block_list(body_writer, tmpl_block, block_list, encoder)
             if blocks:
                 raise KeyError(f"Unexpected {tuple(blocks.keys())!r} blocks in {msg.name}")
 
@@ -113,8 +116,22 @@ class UDPMessageSerializer:
             writer.write(se.U8, len(msg.acks))
         return writer.copy_buffer()
 
+    @staticmethod
+    def append_acks(serialized: bytes, acks: Sequence[int]) -> bytes:
+        """Add an ACK trailer to a message that was serialized without one"""
+        if not acks:
+            return serialized
+        writer = se.BufferWriter("!")
+        writer.write(se.U8, serialized[0] | PacketFlags.ACK)
+        writer.write_bytes(serialized[1:])
+        # ACKs are always written in reverse order
+        for ack in reversed(acks):
+            writer.write(se.U32, ack)
+        writer.write(se.U8, len(acks))
+        return writer.copy_buffer()
+
     def _serialize_block_list(self, writer: se.BufferWriter, tmpl_block: MessageTemplateBlock,
-                              block_list: MsgBlockList):
+                              block_list: MsgBlockList, encoder: CompiledTemplateEncoder):
         block_count = len(block_list)
         # Multiple block type means there is a static number of blocks
         if tmpl_block.block_type == MsgBlockType.MBT_MULTIPLE:
@@ -125,6 +142,10 @@ class UDPMessageSerializer:
         if tmpl_block.block_type == MsgBlockType.MBT_VARIABLE:
             writer.write(se.U8, block_count)
 
+        # Use the specialized encoder unless some blocks need special handling
+        if encoder.blocks[tmpl_block.name].encode(writer, block_list):
+            return
+
         for block in block_list:
             for template_var in tmpl_block.variables:
                 var_data = block.vars.get(template_var.name)
@@ -160,29 +181,16 @@ class UDPMessageSerializer:
 
     @staticmethod
     def zero_code_compress(data: bytes):
-        compressed_buff = bytearray()
-        zero_count = 0
-
-        def _terminate_zeros():
-            nonlocal zero_count
-            if zero_count:
-                compressed_buff.append(zero_count)
-                zero_count = 0
-
-        for char in data:
-            if char == 0x00:
-                zero_count += 1
-                if zero_count == 1:
-                    compressed_buff.append(0x00)
-                # Terminate zeros before we need to use the wrap case,
-                # the official encoder doesn't use it and it isn't handled
-                # correctly on any decoder other than LL's.
-                elif zero_count == 255:
-                    _terminate_zeros()
-            else:
-                _terminate_zeros()
-                compressed_buff.append(char)
+        # Terminate zero runs before we need to use the wrap case,
+        # the official encoder doesn't use it and it isn't handled
+        # correctly on any decoder other than LL's.
+        return bytearray(_ZERO_RUN_RE.sub(_replace_zero_run, data))
+
+
+# Runs of up to 255 zeros get replaced with a zero followed by the run length
+_ZERO_RUN_RE = re.compile(b"\x00{1,255}")
+_ZERO_RUN_REPLACEMENTS = tuple(b"\x00" + bytes((i,)) for i in range(256))
 
-        _terminate_zeros()
 
-        return compressed_buff
+def _replace_zero_run(match: re.Match) -> bytes:
+    return _ZERO_RUN_REPLACEMENTS[match.end() - match.start()]
@@ -1,8 +1,10 @@
+import asyncio
 import ctypes
 import multiprocessing
 import os
 import sys
 import time
+from typing import Optional
 
 SYNCHRONIZE = 0x100000
 
@@ -46,3 +48,34 @@ class ParentProcessWatcher:
                     return True
                 self._win_last_pid_check = time.time()
         return False
+
+
+async def wait_for_queue(mp_queue: multiprocessing.Queue, timeout: Optional[float] = None) -> bool:
+    """
+    Wait for `mp_queue` to have something in it without busy-polling
+
+    The queue's underlying pipe is registered with the event loop so we get woken
+    up as soon as a producer's feeder thread writes to it. Returns whether the
+    queue became readable before `timeout` elapsed.
+    """
+    loop = asyncio.get_running_loop()
+    # No public way to get at this, but it's the pipe every `put()` ends up writing to.
+    fd = mp_queue._reader.fileno()  # noqa
+    readable = loop.create_future()
+
+    def _on_readable():
+        if not readable.done():
+            readable.set_result(None)
+
+    try:
+        loop.add_reader(fd, _on_readable)
+    except NotImplementedError:
+        # Proactor loops on Windows can't watch pipe handles, fall back to polling.
+        await asyncio.sleep(0.001)
+        return not mp_queue.empty()
+    try:
+        await asyncio.wait((readable,), timeout=timeout)
+    finally:
+        loop.remove_reader(fd)
+        readable.cancel()
+    return readable.done() and not readable.cancelled()
@@ -57,6 +57,11 @@ class AbstractUDPTransport(abc.ABC):
     def send_packet(self, packet: UDPPacket) -> None:
         pass
 
+    def send_packets(self, packets: Sequence[UDPPacket]) -> None:
+        """Send a batch of packets, transports that can do better than one at a time should override"""
+        for packet in packets:
+            self.send_packet(packet)
+
     @abc.abstractmethod
     def close(self) -> None:
         pass
@@ -72,5 +77,12 @@ class SocketUDPTransport(AbstractUDPTransport):
             raise ValueError(f"{self.__class__.__name__} can only send outbound packets")
         self.transport.sendto(packet.data, packet.dst_addr)
 
+    def send_packets(self, packets: Sequence[UDPPacket]) -> None:
+        if not all(packet.outgoing for packet in packets):
+            raise ValueError(f"{self.__class__.__name__} can only send outbound packets")
+        sendto = self.transport.sendto
+        for packet in packets:
+            sendto(packet.data, packet.dst_addr)
+
     def close(self) -> None:
         self.transport.close()
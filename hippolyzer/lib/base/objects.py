@@ -89,6 +89,8 @@ class Object(recordclass.RecordClass, use_weakref=True):  # type: ignore
     ChildIDs: Optional[List[int]] = None
     # Same as parent, contains weakref proxies.
     Children: Optional[List[Object]] = None
+    # Raw bytes of the expensive vars from the last full ObjectUpdate, if tracked
+    RawUpdateVars: Optional[Dict[str, bytes]] = None
 
     FootCollisionPlane: Optional[Vector4] = None
     Position: Optional[Vector3] = None
@@ -194,6 +196,7 @@ class Object(recordclass.RecordClass, use_weakref=True):  # type: ignore
         val = recordclass.asdict(self)
         del val["Children"]
         del val["Parent"]
+        del val["RawUpdateVars"]
         return val
 
     @property
@@ -231,28 +234,63 @@ def handle_to_global_pos(handle: int) -> Vector3:
     return Vector3(handle >> 32, handle & 0xFFffFFff)
 
 
-def normalize_object_update(block: Block, handle: int):
+# Vars in ObjectUpdate blocks that are expensive to deserialize, but that usually
+# get resent unchanged. Their raw bytes can be compared with the last update's instead.
+OBJECT_UPDATE_RAW_VARS = ("ObjectData", "TextureEntry", "NameValue", "TextureAnim", "ExtraParams", "PSBlock")
+
+
+def normalize_object_update(block: Block, handle: int, prev_raw_vars: Optional[Dict[str, bytes]] = None):
+    """
+    Turn an ObjectUpdate block into a dict of Object properties
+
+    If `prev_raw_vars` is given then any of `OBJECT_UPDATE_RAW_VARS` that are byte-for-byte
+    identical to the previous update's are left out rather than deserialized, and the
+    raw vars for this update are included under "RawUpdateVars".
+    """
+    raw_vars = {}
+    unchanged_vars = set()
+    if prev_raw_vars is not None:
+        for var_name in OBJECT_UPDATE_RAW_VARS:
+            raw_val = block[var_name]
+            if not isinstance(raw_val, bytes):
+                continue
+            raw_vars[var_name] = raw_val
+            if prev_raw_vars.get(var_name) == raw_val:
+                unchanged_vars.add(var_name)
+
     object_data = {
         "RegionHandle": handle,
-        "FootCollisionPlane": None,
         "SoundFlags": block["Flags"],
         "SoundGain": block["Gain"],
         "SoundRadius": block["Radius"],
         **dict(block.items()),
-        "TextureEntry": block.deserialize_var("TextureEntry", make_copy=False),
-        "NameValue": block.deserialize_var("NameValue", make_copy=False),
-        "TextureAnim": block.deserialize_var("TextureAnim", make_copy=False),
-        "ExtraParams": block.deserialize_var("ExtraParams", make_copy=False) or {},
         "ClickAction": block.deserialize_var("ClickAction", make_copy=False),
-        "PSBlock": block.deserialize_var("PSBlock", make_copy=False).value,
         "UpdateFlags": block.deserialize_var("UpdateFlags", make_copy=False),
         "State": block.deserialize_var("State", make_copy=False),
-        **block.deserialize_var("ObjectData", make_copy=False).value,
     }
+    for var_name in unchanged_vars:
+        del object_data[var_name]
+    if "TextureEntry" not in unchanged_vars:
+        object_data["TextureEntry"] = block.deserialize_var("TextureEntry", make_copy=False)
+        # Empty == not updated
+        if not object_data["TextureEntry"]:
+            object_data.pop("TextureEntry")
+    if "NameValue" not in unchanged_vars:
+        object_data["NameValue"] = block.deserialize_var("NameValue", make_copy=False)
+    if "TextureAnim" not in unchanged_vars:
+        object_data["TextureAnim"] = block.deserialize_var("TextureAnim", make_copy=False)
+    if "ExtraParams" not in unchanged_vars:
+        object_data["ExtraParams"] = block.deserialize_var("ExtraParams", make_copy=False) or {}
+    if "PSBlock" not in unchanged_vars:
+        object_data["PSBlock"] = block.deserialize_var("PSBlock", make_copy=False).value
+    if "ObjectData" not in unchanged_vars:
+        object_data["FootCollisionPlane"] = None
+        object_data.update(block.deserialize_var("ObjectData", make_copy=False).value)
+        del object_data["ObjectData"]
+    if prev_raw_vars is not None:
+        object_data["RawUpdateVars"] = raw_vars
+
     object_data["LocalID"] = object_data.pop("ID")
-    # Empty == not updated
-    if not object_data["TextureEntry"]:
-        object_data.pop("TextureEntry")
     # OwnerID is only set in this packet if a sound is playing. Don't allow
     # ObjectUpdates to clobber _real_ OwnerIDs we had from ObjectProperties
     # with a null UUID.
@@ -261,7 +299,6 @@ def normalize_object_update(block: Block, handle: int):
     del object_data["Flags"]
     del object_data["Gain"]
     del object_data["Radius"]
-    del object_data["ObjectData"]
     return object_data
 
 
@@ -56,6 +56,14 @@ class SettingDescriptor(Generic[_T]):
 class Settings:
     ENABLE_DEFERRED_PACKET_PARSING: bool = SettingDescriptor(True)
     ALLOW_UNKNOWN_MESSAGES: bool = SettingDescriptor(True)
+    # Use per-template specialized decoders rather than walking the template for every message
+    ENABLE_COMPILED_MESSAGE_DECODERS: bool = SettingDescriptor(False)
+    # Queue outgoing UDP datagrams and send them together once per event loop tick
+    BATCH_UDP_SENDS: bool = SettingDescriptor(False)
+    # Piggyback outgoing ACKs on other messages, or send them in one PacketAck after a short delay
+    COALESCE_ACKS: bool = SettingDescriptor(False)
+    # Skip deserializing ObjectUpdate vars whose raw bytes match the object's last ObjectUpdate
+    LAZY_OBJECT_UPDATES: bool = SettingDescriptor(False)
 
     def __init__(self):
         self._settings: Dict[str, Any] = {}
@@ -54,6 +54,8 @@ class ClientSettings(Settings):
     """Automatically request all parcel details when connecting to a region"""
     AUTO_REQUEST_MATERIALS: bool = SettingDescriptor(True)
     """Automatically request all materials when connecting to a region"""
+    RELIABLE_DEDUP_WINDOW: int = SettingDescriptor(1_000)
+    """How many of the most recent reliable packet IDs to remember per circuit for resend suppression"""
 
 
 class HippoCapsClient(CapsClient):
@@ -359,7 +361,14 @@ class HippoClientSession(BaseClientSession):
             if region.circuit_addr == circuit_addr:
                 valid_circuit = False
                 if not region.circuit or not region.circuit.is_alive:
-                    region.circuit = Circuit(("127.0.0.1", 0), circuit_addr, self.transport)
+                    region.circuit = Circuit(
+                        ("127.0.0.1", 0),
+                        circuit_addr,
+                        self.transport,
+                        reliable_window=self.session_manager.settings.RELIABLE_DEDUP_WINDOW,
+                        batch_sends=self.session_manager.settings.BATCH_UDP_SENDS,
+                        coalesce_acks=self.session_manager.settings.COALESCE_ACKS,
+                    )
                     region.circuit.is_alive = False
                     valid_circuit = True
                 if region.circuit and region.circuit.is_alive:
@@ -564,7 +573,6 @@ class HippoClient(BaseClientSessionManager):
         self.http_session: Optional[aiohttp.ClientSession] = aiohttp.ClientSession(trust_env=True)
         self.session: Optional[HippoClientSession] = None
         self.settings = ClientSettings()
-        self._resend_task: Optional[asyncio.Task] = None
 
     @property
     def main_region(self) -> Optional[HippoClientRegion]:
@@ -675,7 +683,6 @@ class HippoClient(BaseClientSessionManager):
         self.session = HippoClientSession.from_login_data(login_data, self)
 
         self.session.transport, self.session.protocol = await self._create_transport()
-        self._resend_task = create_logged_task(self._attempt_resends(), "Circuit Resend")
         self.session.message_handler.subscribe("AgentDataUpdate", self._handle_agent_data_update)
         self.session.message_handler.subscribe("AgentGroupDataUpdate", self._handle_agent_group_data_update)
 
@@ -687,10 +694,6 @@ class HippoClient(BaseClientSessionManager):
     def logout(self):
         if not self.session:
             return
-        if self._resend_task:
-            self._resend_task.cancel()
-            self._resend_task = None
-
         if self.main_circuit and self.main_circuit.is_alive:
             # Don't need to send reliably, there's a good chance the server won't ACK anyway.
             self.main_circuit.send(
@@ -832,16 +835,6 @@ class HippoClient(BaseClientSessionManager):
             return avatar.Object.Rotation
         return None
 
-    async def _attempt_resends(self):
-        while True:
-            if self.session is None:
-                break
-            for region in self.session.regions:
-                if not region.circuit.is_alive:
-                    continue
-                region.circuit.resend_unacked()
-            await asyncio.sleep(0.5)
-
     def _handle_agent_data_update(self, msg: Message):
         self.session.active_group = msg["AgentData"]["ActiveGroupID"]
 
@@ -1,18 +1,27 @@
 from __future__ import annotations
 
 import asyncio
+import calendar
+import concurrent.futures
 import dataclasses
+import datetime as dt
+import enum
 import gzip
 import itertools
 import logging
+import math
+import mmap
+import os
+import struct
 from pathlib import Path
-from typing import Union, List, Tuple, Set, Sequence, Dict, TYPE_CHECKING
+from typing import Any, Iterable, Union, List, Optional, Tuple, Set, Sequence, Dict, TYPE_CHECKING
 
 from hippolyzer.lib.base import llsd
 from hippolyzer.lib.base.datatypes import UUID
-from hippolyzer.lib.base.inventory import InventoryModel, InventoryCategory, InventoryItem, InventoryNodeBase
+from hippolyzer.lib.base.inventory import InventoryModel, InventoryCategory, InventoryItem, InventoryNodeBase, \
+    InventoryPermissions, InventorySaleInfo
 from hippolyzer.lib.base.message.message import Message, Block
-from hippolyzer.lib.base.templates import AssetType, FolderType, InventoryType, Permissions
+from hippolyzer.lib.base.templates import AssetType, FolderType, InventoryType, Permissions, SaleType
 from hippolyzer.lib.base.templates import WearableType
 
 if TYPE_CHECKING:
@@ -32,7 +41,228 @@ def _get_node_id(node_or_id: InventoryNodeBase | UUID) -> UUID:
     return node_or_id.node_id
 
 
+def _nodes_from_cache_llsd(node_llsds: Iterable[Any]) -> Tuple[List[InventoryCategory], List[InventoryItem]]:
+    categories: List[InventoryCategory] = []
+    items: List[InventoryItem] = []
+    for node_llsd in node_llsds:
+        if InventoryCategory.ID_ATTR in node_llsd:
+            if (cat_node := InventoryCategory.from_llsd(node_llsd)) is not None:
+                categories.append(cat_node)
+        elif InventoryItem.ID_ATTR in node_llsd:
+            if (item_node := InventoryItem.from_llsd(node_llsd)) is not None:
+                items.append(item_node)
+        else:
+            LOG.warning(f"Unknown node type in inv cache: {node_llsd!r}")
+    return categories, items
+
+
+def _parse_cache_lines(lines: Sequence[bytes]) -> Tuple[List[InventoryCategory], List[InventoryItem]]:
+    """Parse a chunk of a line-delimited notation inventory cache, may be run in a worker process"""
+    return _nodes_from_cache_llsd(llsd.parse_notation_fast(line) for line in lines if line)
+
+
+def _check_cache_header(header: Any):
+    if not isinstance(header, dict) or header.get('inv_cache_version') not in (2, 3):
+        raise ValueError(f"Unknown cache version: {header!r}")
+
+
+# Snapshots are a header, then fixed-size category and item records, then a table of
+# the strings and binary LLSD blobs that the records point into. All little-endian.
+_SNAPSHOT_MAGIC = b"HIPPOINV"
+# Magic, version, agent ID, category count, item count, string table size
+_SNAPSHOT_HEADER = struct.Struct("<8sI16sIII")
+# Present fields, cat_id, parent_id, owner_id, type, pref_type, version, name, metadata
+_SNAPSHOT_CATEGORY = struct.Struct("<H16s16s16shhiIIII")
+# Present fields, item_id, parent_id, permission masks, creator_id, owner_id, last_owner_id,
+# group_id, is_owner_group, asset_id, shadow_id, type, inv_type, flags, sale_type, sale_price,
+# name, desc, metadata, thumbnail, creation_date
+_SNAPSHOT_ITEM = struct.Struct("<H16s16s5I16s16s16s16si16s16shhIbiIIIIIIIIq")
+# String table (offset, length) for a field that's `None`
+_SNAPSHOT_NO_REF = (0xFFffFFff, 0)
+_ZERO_UUID_BYTES = UUID.ZERO.bytes
+
+
+class _SnapshotField(enum.IntFlag):
+    """Which of a snapshot record's optional fields are actually present"""
+    PARENT_ID = enum.auto()
+    OWNER_ID = enum.auto()
+    ASSET_ID = enum.auto()
+    SHADOW_ID = enum.auto()
+    TYPE = enum.auto()
+    INV_TYPE = enum.auto()
+    FLAGS = enum.auto()
+    SALE_INFO = enum.auto()
+    IS_OWNER_GROUP = enum.auto()
+    CREATION_DATE = enum.auto()
+
+
+class _SnapshotStringTableWriter:
+    def __init__(self):
+        # Names like "Object" show up a lot, only store each value once.
+        self._offsets: Dict[bytes, int] = {}
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, val: Optional[bytes]) -> Tuple[int, int]:
+        if val is None:
+            return _SNAPSHOT_NO_REF
+        offset = self._offsets.get(val)
+        if offset is None:
+            offset = self._offsets[val] = self.size
+            self._chunks.append(val)
+            self.size += len(val)
+        return offset, len(val)
+
+    def add_str(self, val: Optional[str]) -> Tuple[int, int]:
+        return self.add(None if val is None else val.encode("utf8"))
+
+    def add_llsd(self, val: Any) -> Tuple[int, int]:
+        return self.add(None if val is None else llsd.format_binary(val, with_header=False))
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+class _SnapshotStringTableReader:
+    def __init__(self, buf: memoryview):
+        self._buf = buf
+        self._strs: Dict[Tuple[int, int], str] = {}
+
+    def get(self, offset: int, length: int) -> Optional[bytes]:
+        if offset == _SNAPSHOT_NO_REF[0]:
+            return None
+        if offset + length > len(self._buf):
+            raise ValueError(f"String table reference {offset}+{length} is out of bounds")
+        return self._buf[offset:offset + length].tobytes()
+
+    def get_str(self, offset: int, length: int) -> Optional[str]:
+        key = (offset, length)
+        val = self._strs.get(key)
+        if val is None:
+            raw_val = self.get(offset, length)
+            if raw_val is None:
+                return None
+            val = self._strs[key] = raw_val.decode("utf8")
+        return val
+
+    def get_llsd(self, offset: int, length: int) -> Any:
+        raw_val = self.get(offset, length)
+        if raw_val is None:
+            return None
+        return llsd.HippoLLSDBinaryParser().parse(raw_val)
+
+
+def _uuid_bytes(val: Optional[UUID]) -> bytes:
+    return _ZERO_UUID_BYTES if val is None else val.bytes
+
+
+def _pack_snapshot_category(cat: InventoryCategory, strings: _SnapshotStringTableWriter) -> bytes:
+    fields = _SnapshotField(0)
+    if cat.parent_id is not None:
+        fields |= _SnapshotField.PARENT_ID
+    if cat.owner_id is not None:
+        fields |= _SnapshotField.OWNER_ID
+    return _SNAPSHOT_CATEGORY.pack(
+        fields, cat.cat_id.bytes, _uuid_bytes(cat.parent_id), _uuid_bytes(cat.owner_id),
+        cat.type, cat.pref_type, cat.version, *strings.add_str(cat.name), *strings.add_llsd(cat.metadata),
+    )
+
+
+def _unpack_snapshot_category(record: Tuple, strings: _SnapshotStringTableReader) -> InventoryCategory:
+    (fields, cat_id, parent_id, owner_id, asset_type, pref_type, version,
+     name_offset, name_len, metadata_offset, metadata_len) = record
+    return InventoryCategory(
+        cat_id=UUID(bytes=cat_id),
+        parent_id=UUID(bytes=parent_id) if fields & _SnapshotField.PARENT_ID else None,
+        type=AssetType(asset_type),
+        pref_type=FolderType(pref_type),
+        name=strings.get_str(name_offset, name_len),
+        owner_id=UUID(bytes=owner_id) if fields & _SnapshotField.OWNER_ID else None,
+        version=version,
+        metadata=strings.get_llsd(metadata_offset, metadata_len),
+    )
+
+
+def _pack_snapshot_item(item: InventoryItem, strings: _SnapshotStringTableWriter) -> bytes:
+    fields = _SnapshotField(0)
+    for field, val in (
+        (_SnapshotField.PARENT_ID, item.parent_id),
+        (_SnapshotField.ASSET_ID, item.asset_id),
+        (_SnapshotField.SHADOW_ID, item.shadow_id),
+        (_SnapshotField.TYPE, item.type),
+        (_SnapshotField.INV_TYPE, item.inv_type),
+        (_SnapshotField.FLAGS, item.flags),
+        (_SnapshotField.SALE_INFO, item.sale_info),
+        (_SnapshotField.IS_OWNER_GROUP, item.permissions.is_owner_group),
+        (_SnapshotField.CREATION_DATE, item.creation_date),
+    ):
+        if val is not None:
+            fields |= field
+    perms = item.permissions
+    sale_info = item.sale_info or InventorySaleInfo.make_default()
+    creation_date = 0
+    if item.creation_date is not None:
+        creation_date = calendar.timegm(item.creation_date.utctimetuple())
+    return _SNAPSHOT_ITEM.pack(
+        fields, item.item_id.bytes, _uuid_bytes(item.parent_id),
+        # Masks may have come from LLSD as S32s, always store them as U32s.
+        *(mask & 0xFFffFFff for mask in (
+            perms.base_mask, perms.owner_mask, perms.group_mask, perms.everyone_mask, perms.next_owner_mask
+        )),
+        perms.creator_id.bytes, perms.owner_id.bytes, perms.last_owner_id.bytes, perms.group_id.bytes,
+        perms.is_owner_group or 0, _uuid_bytes(item.asset_id), _uuid_bytes(item.shadow_id),
+        item.type or 0, item.inv_type or 0, (item.flags or 0) & 0xFFffFFff,
+        sale_info.sale_type, sale_info.sale_price,
+        *strings.add_str(item.name), *strings.add_str(item.desc),
+        *strings.add_llsd(item.metadata), *strings.add_llsd(item.thumbnail),
+        creation_date,
+    )
+
+
+def _unpack_snapshot_item(record: Tuple, strings: _SnapshotStringTableReader) -> InventoryItem:
+    (fields, item_id, parent_id, base_mask, owner_mask, group_mask, everyone_mask, next_owner_mask,
+     creator_id, owner_id, last_owner_id, group_id, is_owner_group, asset_id, shadow_id,
+     asset_type, inv_type, flags, sale_type, sale_price, name_offset, name_len, desc_offset, desc_len,
+     metadata_offset, metadata_len, thumbnail_offset, thumbnail_len, creation_date) = record
+    sale_info = None
+    if fields & _SnapshotField.SALE_INFO:
+        sale_info = InventorySaleInfo(sale_type=SaleType(sale_type), sale_price=sale_price)
+    return InventoryItem(
+        item_id=UUID(bytes=item_id),
+        parent_id=UUID(bytes=parent_id) if fields & _SnapshotField.PARENT_ID else None,
+        permissions=InventoryPermissions(
+            base_mask=base_mask,
+            owner_mask=owner_mask,
+            group_mask=group_mask,
+            everyone_mask=everyone_mask,
+            next_owner_mask=next_owner_mask,
+            creator_id=UUID(bytes=creator_id),
+            owner_id=UUID(bytes=owner_id),
+            last_owner_id=UUID(bytes=last_owner_id),
+            group_id=UUID(bytes=group_id),
+            is_owner_group=is_owner_group if fields & _SnapshotField.IS_OWNER_GROUP else None,
+        ),
+        asset_id=UUID(bytes=asset_id) if fields & _SnapshotField.ASSET_ID else None,
+        shadow_id=UUID(bytes=shadow_id) if fields & _SnapshotField.SHADOW_ID else None,
+        type=AssetType(asset_type) if fields & _SnapshotField.TYPE else None,
+        inv_type=InventoryType(inv_type) if fields & _SnapshotField.INV_TYPE else None,
+        flags=flags if fields & _SnapshotField.FLAGS else None,
+        sale_info=sale_info,
+        name=strings.get_str(name_offset, name_len),
+        desc=strings.get_str(desc_offset, desc_len),
+        metadata=strings.get_llsd(metadata_offset, metadata_len),
+        thumbnail=strings.get_llsd(thumbnail_offset, thumbnail_len),
+        creation_date=(
+            dt.datetime.fromtimestamp(creation_date, dt.timezone.utc)
+            if fields & _SnapshotField.CREATION_DATE else None
+        ),
+    )
+
+
 class InventoryManager:
+    # Bump whenever the snapshot record layout changes
+    SNAPSHOT_VERSION = 1
+
     def __init__(self, session: BaseClientSession):
         self._session = session
         self.model: InventoryModel = InventoryModel()
@@ -61,7 +291,7 @@ class InventoryManager:
                 owner_id=self._session.agent_id,
             ))
 
-    def load_cache(self, path: Union[str, Path]):
+    def load_cache(self, path: Union[str, Path], parse_workers: int = 1):
         # Per indra, rough flow for loading inv on login is:
         # 1. Look at inventory skeleton from login response
         # 2. Pre-populate model with categories from the skeleton, including their versions
@@ -74,13 +304,19 @@ class InventoryManager:
         #
         # By the time you call this function call, you should have already loaded the inventory skeleton
         # into the model set its inventory category versions to VERSION_NONE.
+        #
+        # Parsing can take a while for large inventories, `parse_workers` > 1 will spread
+        # it across that many worker processes.
 
+        LOG.info(f"Parsing inv cache at {path}")
+        cached_categories, cached_items = self._parse_cache(path, parse_workers=parse_workers)
+        LOG.info(f"Done parsing inv cache at {path}")
+        self._load_cached_nodes(cached_categories, cached_items)
+
+    def _load_cached_nodes(self, cached_categories: List[InventoryCategory], cached_items: List[InventoryItem]):
         skel_cats: List[dict] = self._session.login_data['inventory-skeleton']
         # UUID -> version map for inventory skeleton
         skel_versions = {UUID(cat["folder_id"]): cat["version"] for cat in skel_cats}
-        LOG.info(f"Parsing inv cache at {path}")
-        cached_categories, cached_items = self._parse_cache(path)
-        LOG.info(f"Done parsing inv cache at {path}")
         loaded_cat_ids: Set[UUID] = set()
 
         for cached_cat in cached_categories:
@@ -110,33 +346,109 @@ class InventoryManager:
 
         self.model.flag_if_dirty()
 
-    def _parse_cache(self, path: Union[str, Path]) -> Tuple[List[InventoryCategory], List[InventoryItem]]:
-        """Warning, may be incredibly slow due to llsd.parse_notation() behavior"""
-        categories: List[InventoryCategory] = []
-        items: List[InventoryItem] = []
+    def save_snapshot(self, path: Union[str, Path]):
+        """
+        Write the inventory model out to a snapshot that can be loaded with `load_snapshot()`
+
+        Much cheaper to load than the viewer's inventory cache since it's mostly
+        fixed-size records that don't need any LLSD parsing.
+        """
+        strings = _SnapshotStringTableWriter()
+        categories = [x for x in self.model.all_containers if isinstance(x, InventoryCategory)]
+        items = [x for x in self.model.all_items if isinstance(x, InventoryItem)]
+        records = [_pack_snapshot_category(x, strings) for x in categories]
+        records.extend(_pack_snapshot_item(x, strings) for x in items)
+
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, self._session.agent_id.bytes,
+                len(categories), len(items), strings.size,
+            ))
+            f.writelines(records)
+            f.write(strings.to_bytes())
+        # Don't leave a truncated snapshot around if we die mid-write
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: Union[str, Path]):
+        """
+        Load a snapshot written by `save_snapshot()`
+
+        Same rules as `load_cache()`, only categories whose versions match the inventory
+        skeleton are used, anything else will still need to be fetched.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _SNAPSHOT_HEADER.size:
+                raise ValueError(f"{path} is too short to be an inventory snapshot")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as snapshot_buf, \
+                    memoryview(snapshot_buf) as snapshot_view:
+                categories, items = self._parse_snapshot(path, snapshot_view)
+        self._load_cached_nodes(categories, items)
+
+    def _parse_snapshot(
+            self,
+            path: Union[str, Path],
+            buf: memoryview,
+    ) -> Tuple[List[InventoryCategory], List[InventoryItem]]:
+        magic, version, agent_id, num_categories, num_items, strings_size = _SNAPSHOT_HEADER.unpack_from(buf)
+        if magic != _SNAPSHOT_MAGIC or version != self.SNAPSHOT_VERSION:
+            raise ValueError(f"Unknown snapshot version in {path}")
+        agent_id = UUID(bytes=agent_id)
+        if agent_id != self._session.agent_id:
+            raise ValueError(f"Snapshot in {path} is for {agent_id}, not {self._session.agent_id}")
+        items_start = _SNAPSHOT_HEADER.size + num_categories * _SNAPSHOT_CATEGORY.size
+        strings_start = items_start + num_items * _SNAPSHOT_ITEM.size
+        if strings_start + strings_size != len(buf):
+            raise ValueError(f"Snapshot in {path} is truncated or corrupt")
+
+        with buf[strings_start:] as strings_buf:
+            strings = _SnapshotStringTableReader(strings_buf)
+            with buf[_SNAPSHOT_HEADER.size:items_start] as categories_buf:
+                categories = [
+                    _unpack_snapshot_category(x, strings) for x in _SNAPSHOT_CATEGORY.iter_unpack(categories_buf)
+                ]
+            with buf[items_start:strings_start] as items_buf:
+                items = [_unpack_snapshot_item(x, strings) for x in _SNAPSHOT_ITEM.iter_unpack(items_buf)]
+        return categories, items
+
+    def _parse_cache(
+            self,
+            path: Union[str, Path],
+            parse_workers: int = 1,
+    ) -> Tuple[List[InventoryCategory], List[InventoryItem]]:
         # Parse our cached items and categories out of the compressed inventory cache
-        first_line = True
         with gzip.open(path, "rb") as f:
-            # Line-delimited LLSD notation!
-            for line in f.readlines():
-                # TODO: Parsing of invcache is dominated by `parse_notation()`. It's stupidly inefficient.
-                # TODO: sniff out binary LLSD invcaches
-                node_llsd = llsd.parse_notation(line)
-                if first_line:
-                    # First line is the file header
-                    first_line = False
-                    if node_llsd['inv_cache_version'] not in (2, 3):
-                        raise ValueError(f"Unknown cache version: {node_llsd!r}")
-                    continue
-
-                if InventoryCategory.ID_ATTR in node_llsd:
-                    if (cat_node := InventoryCategory.from_llsd(node_llsd)) is not None:
-                        categories.append(cat_node)
-                elif InventoryItem.ID_ATTR in node_llsd:
-                    if (item_node := InventoryItem.from_llsd(node_llsd)) is not None:
-                        items.append(item_node)
-                else:
-                    LOG.warning(f"Unknown node type in inv cache: {node_llsd!r}")
+            data = f.read()
+        if not data:
+            return [], []
+
+        # Binary LLSD either has a header, or starts with a map whose big-endian entry count
+        # follows the "{". The header map is tiny, so the count's first byte will be zero.
+        if data.startswith(b"<?") or data.startswith(b"{\x00"):
+            node_llsd_iter = llsd.HippoLLSDBinaryParser().parse_many(data)
+            # First entry is the file header
+            _check_cache_header(next(node_llsd_iter, None))
+            return _nodes_from_cache_llsd(node_llsd_iter)
+
+        # Line-delimited LLSD notation!
+        lines = data.splitlines()
+        del data
+        _check_cache_header(llsd.parse_notation_fast(lines[0]) if lines else None)
+        lines = lines[1:]
+        if parse_workers <= 1:
+            return _parse_cache_lines(lines)
+
+        # Every line is independent, so we can shard them across processes. Parsed nodes
+        # come back pickled, parent-less and without a model.
+        categories: List[InventoryCategory] = []
+        items: List[InventoryItem] = []
+        shard_size = max(math.ceil(len(lines) / parse_workers), 1)
+        shards = [lines[i:i + shard_size] for i in range(0, len(lines), shard_size)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers) as executor:
+            for shard_categories, shard_items in executor.map(_parse_cache_lines, shards):
+                categories.extend(shard_categories)
+                items.extend(shard_items)
         return categories, items
 
     def _handle_bulk_update_inventory(self, msg: Message):
@@ -531,24 +843,49 @@ class InventoryManager:
 
         return self.process_fetch_descendents_response(data)
 
-    async def complete_inventory(self) -> int:
+    async def complete_inventory(self, batch_size: int = 50, max_in_flight: int = 4) -> int:
         """
         Fetch all folders recursively until inventory is complete.
 
-        Stops when no dirty folders remain, or when the set of dirty
-        folders stops changing (indicating unfetchable folders).
+        Dirty folders are requested `batch_size` at a time with up to `max_in_flight`
+        requests outstanding. Subfolders of a fetched folder that still need fetching
+        are queued as soon as its response comes in, rather than after the whole level.
+        Each folder is only requested once, so unfetchable folders don't stall completion.
         """
         total = 0
-        prev_dirty_ids: set[UUID] = set()
-        while True:
-            dirty = list(self.model.dirty_categories)
-            dirty_ids = {cat.cat_id for cat in dirty}
-            if not dirty_ids or dirty_ids == prev_dirty_ids:
-                # We stopped making progress, give up
-                break
-            prev_dirty_ids = dirty_ids
-            LOG.info(f"Fetching {len(dirty)} dirty inventory folders")
-            fetched = await self.fetch_folders(dirty)
-            total += len(fetched)
+        # Categories we knew about before starting, anything else was discovered
+        # through a fetch and we haven't seen its contents yet.
+        known_ids: Set[UUID] = {node.node_id for node in self.model.all_containers}
+        requested_ids: Set[UUID] = set()
+        pending: List[UUID] = []
+        in_flight: Set[asyncio.Task] = set()
+
+        def _queue_fetch(cats: Iterable[InventoryNodeBase]):
+            for cat in cats:
+                if not isinstance(cat, InventoryCategory) or cat.cat_id in requested_ids:
+                    continue
+                if cat.version == InventoryCategory.VERSION_NONE or cat.cat_id not in known_ids:
+                    requested_ids.add(cat.cat_id)
+                    pending.append(cat.cat_id)
+
+        _queue_fetch(self.model.dirty_categories)
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < max_in_flight:
+                    batch, pending[:] = pending[:batch_size], pending[batch_size:]
+                    LOG.info(f"Fetching {len(batch)} inventory folders")
+                    in_flight.add(asyncio.create_task(self.fetch_folders(batch)))
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    fetched = task.result()
+                    total += len(fetched)
+                    for cat in fetched:
+                        _queue_fetch(self.model.get_children(cat.cat_id))
+                if not pending and not in_flight:
+                    # Might have had more folders flagged dirty while we were fetching
+                    _queue_fetch(self.model.dirty_categories)
+        finally:
+            for task in in_flight:
+                task.cancel()
         self.model.any_dirty.clear()
         return total
@@ -7,6 +7,7 @@ from __future__ import annotations
 import asyncio
 import collections
 import enum
+import functools
 import itertools
 import logging
 import math
@@ -49,6 +50,8 @@ class ObjectUpdateType(enum.IntEnum):
     KILL = enum.auto()
     ANIMATIONS = enum.auto()
     APPEARANCE = enum.auto()
+    # All object updates caused by a single message
+    BATCH = enum.auto()
 
 
 class ClientObjectManager:
@@ -281,33 +284,53 @@ class ObjectEvent:
         return self.update_type
 
 
+class ObjectBatchEvent:
+    """Every object update event caused by handling a single message"""
+    __slots__ = ("events", "message")
+
+    events: List[ObjectEvent]
+    message: Optional[Message]
+
+    def __init__(self, events: List[ObjectEvent], msg: Optional[Message]):
+        self.events = events
+        self.message = msg
+
+    @property
+    def name(self) -> ObjectUpdateType:
+        return ObjectUpdateType.BATCH
+
+
 class ClientWorldObjectManager:
     """Manages Objects for a session's whole world"""
     def __init__(self, session: BaseClientSession, settings: Settings, name_cache: Optional[NameCache]):
         self._session: BaseClientSession = session
         self._settings = settings
         self.name_cache = name_cache or NameCache()
-        self.events: MessageHandler[ObjectEvent, ObjectUpdateType] = MessageHandler(take_by_default=False)
+        self.events: MessageHandler[ObjectEvent | ObjectBatchEvent, ObjectUpdateType] = \
+            MessageHandler(take_by_default=False)
+        # Update events for the message currently being handled, if any
+        self._pending_batch: Optional[List[ObjectEvent]] = None
         self._fullid_lookup: Dict[UUID, Object] = {}
         self._avatars: Dict[UUID, Avatar] = {}
         self._avatar_objects: Dict[UUID, Object] = {}
         self._region_managers: Dict[int, ClientObjectManager] = {}
         message_handler = self._session.message_handler
-        message_handler.subscribe("ObjectUpdate", self._handle_object_update)
+        message_handler.subscribe("ObjectUpdate",
+                                  self._batching_events(self._handle_object_update))
         message_handler.subscribe("ImprovedTerseObjectUpdate",
-                                  self._handle_terse_object_update)
+                                  self._batching_events(self._handle_terse_object_update))
         message_handler.subscribe("ObjectUpdateCompressed",
-                                  self._handle_object_update_compressed)
+                                  self._batching_events(self._handle_object_update_compressed))
         message_handler.subscribe("ObjectUpdateCached",
-                                  self._handle_object_update_cached)
+                                  self._batching_events(self._handle_object_update_cached))
         message_handler.subscribe("CoarseLocationUpdate",
                                   self._handle_coarse_location_update)
         message_handler.subscribe("KillObject",
                                   self._handle_kill_object)
         message_handler.subscribe("ObjectProperties",
-                                  self._handle_object_properties_generic)
+                                  self._batching_events(self._handle_object_properties_generic))
         message_handler.subscribe("ObjectPropertiesFamily",
-                                  self._handle_object_properties_generic)
+                                  self._batching_events(self._handle_object_properties_generic))
         message_handler.subscribe("AvatarAnimation",
                                   self._handle_animation_message)
         message_handler.subscribe("ObjectAnimation",
@@ -315,6 +338,21 @@ class ClientWorldObjectManager:
         message_handler.subscribe("AvatarAppearance",
                                   self._handle_avatar_appearance_message)
 
+    def _batching_events(self, handler: Callable[[Message], None]) -> Callable[[Message], None]:
+        """Wrap a message handler so that the object updates it causes get dispatched together"""
+        @functools.wraps(handler)
+        def _wrapper(msg: Message):
+            if self._pending_batch is not None:
+                return handler(msg)
+            self._pending_batch = []
+            try:
+                handler(msg)
+            finally:
+                batch, self._pending_batch = self._pending_batch, None
+                if batch:
+                    self._dispatch_object_batch(batch, msg)
+        return _wrapper
+
     def lookup_fullid(self, full_id: UUID) -> Optional[Object]:
         return self._fullid_lookup.get(full_id, None)
 
@@ -323,7 +361,7 @@ class ClientWorldObjectManager:
         return self._fullid_lookup.values()
 
     def lookup_avatar(self, full_id: UUID) -> Optional[Avatar]:
-        return {a.FullID: a for a in self.all_avatars}.get(full_id, None)
+        return self._avatars.get(full_id, None)
 
     @property
     def all_avatars(self) -> Iterable[Avatar]:
@@ -439,7 +477,12 @@ class ClientWorldObjectManager:
             old_region_state.track_object(obj)
             actually_updated_props |= {"LocalID"}
 
+        raw_update_vars = new_properties.pop("RawUpdateVars", None)
         actually_updated_props |= obj.update_properties(new_properties)
+        # Only full ObjectUpdates have raw vars, other kinds of updates may have changed
+        # the values they decode to, so the old ones can't be trusted anymore.
+        if update_type == ObjectUpdateType.UPDATE:
+            obj.RawUpdateVars = raw_update_vars
 
         if new_region_handle != old_region_handle:
             # Region just changed to this region, we should have untracked it before
@@ -452,9 +495,9 @@ class ClientWorldObjectManager:
                 LOG.warning(f"Tried to move object {obj!r} to unknown region {new_region_handle}")
 
             if obj.PCode == PCode.AVATAR:
-                # `Avatar` instances are handled separately. Update all Avatar objects,
+                # `Avatar` instances are handled separately. Update the Avatar object,
                 # so we can deal with the RegionHandle change.
-                self._rebuild_avatar_objects()
+                self._update_avatars((obj.FullID,))
         elif new_parent_id != old_parent_id:
             # Parent ID changed, but we're in the same region
             new_region_state.handle_object_reparented(obj, old_parent_id=old_parent_id)
@@ -467,7 +510,7 @@ class ClientWorldObjectManager:
         self._fullid_lookup[obj.FullID] = obj
         if obj.PCode == PCode.AVATAR:
             self._avatar_objects[obj.FullID] = obj
-            self._rebuild_avatar_objects()
+            self._update_avatars((obj.FullID,))
         self._run_object_update_hooks(obj, set(obj.to_dict().keys()), ObjectUpdateType.UPDATE, msg)
 
     def _kill_object_by_local_id(self, region_state: RegionObjectsState, local_id: int):
@@ -505,14 +548,19 @@ class ClientWorldObjectManager:
             self._fullid_lookup.pop(obj.FullID, None)
             if obj.PCode == PCode.AVATAR:
                 self._avatar_objects.pop(obj.FullID, None)
-                self._rebuild_avatar_objects()
+                self._update_avatars((obj.FullID,))
 
     def _handle_object_update(self, msg: Message):
         seen_locals = []
         handle = msg["RegionData"]["RegionHandle"]
         region_state = self._get_region_state(handle)
+        lazy_updates = self._settings.LAZY_OBJECT_UPDATES
         for block in msg['ObjectData']:
-            object_data = normalize_object_update(block, handle)
+            prev_raw_vars = None
+            if lazy_updates:
+                existing_obj = self.lookup_fullid(block["FullID"])
+                prev_raw_vars = (existing_obj and existing_obj.RawUpdateVars) or {}
+            object_data = normalize_object_update(block, handle, prev_raw_vars)
             seen_locals.append(object_data["LocalID"])
             if region_state is None:
                 LOG.warning(f"Got ObjectUpdate for unknown region {handle}: {object_data!r}")
@@ -648,7 +696,6 @@ class ClientWorldObjectManager:
         # Have to look up region based on sender, handle not sent in this message
         region = self._session.region_by_circuit_addr(message.sender)
         region_state = region.objects.state
-        region_state.coarse_locations.clear()
 
         coarse_locations: Dict[UUID, Vector3] = {}
         for agent_block, location_block in zip(message["AgentData"], message["Location"]):
@@ -663,8 +710,15 @@ class ClientWorldObjectManager:
                 Z=z * 4 if z != 255 else math.inf,
             )
 
-        region_state.coarse_locations.update(coarse_locations)
-        self._rebuild_avatar_objects()
+        # Only avatars that moved, appeared or disappeared need their details updated
+        old_coarse_locations = region_state.coarse_locations
+        changed_keys = {
+            av_key for av_key in old_coarse_locations.keys() | coarse_locations.keys()
+            if old_coarse_locations.get(av_key) != coarse_locations.get(av_key)
+        }
+        old_coarse_locations.clear()
+        old_coarse_locations.update(coarse_locations)
+        self._update_avatars(changed_keys)
 
     def _handle_animation_message(self, message: Message):
         sender_id = message["Sender"]["ID"]
@@ -741,30 +795,51 @@ class ClientWorldObjectManager:
         if obj.PCode == PCode.AVATAR and "NameValue" in updated_props:
             if obj.NameValue:
                 self.name_cache.update(obj.FullID, obj.NameValue.to_dict())
-        self.events.handle(ObjectEvent(obj, updated_props, update_type))
+        event = ObjectEvent(obj, updated_props, update_type)
+        self.events.handle(event)
+        if self._pending_batch is not None:
+            self._pending_batch.append(event)
+        else:
+            self._dispatch_object_batch([event], msg)
+
+    def _dispatch_object_batch(self, events: List[ObjectEvent], msg: Optional[Message]):
+        self.events.handle(ObjectBatchEvent(events, msg))
 
     def _run_kill_object_hooks(self, obj: Object):
         self.events.handle(ObjectEvent(obj, set(), ObjectUpdateType.KILL))
 
     def _rebuild_avatar_objects(self):
-        # Get all avatars known through coarse locations and which region the location was in
-        coarse_locations: Dict[UUID, Tuple[int, Vector3]] = {}
+        """Recompute every avatar, only needed when whole regions come and go"""
+        av_keys = set(self._avatars.keys()) | set(self._avatar_objects.keys())
+        for region in self._region_managers.values():
+            av_keys.update(region.state.coarse_locations.keys())
+        self._update_avatars(av_keys)
+
+    def _lookup_coarse_location(self, av_key: UUID) -> Optional[Tuple[int, Vector3]]:
+        """Get an avatar's coarse location and the handle of the region it was in, if any"""
+        coarse_pair = None
         for region_handle, region in self._region_managers.items():
-            for av_key, location in region.state.coarse_locations.items():
-                coarse_locations[av_key] = (region_handle, location)
-
-        # Merge together avatars known through coarse locations or objects, with details for both
-        current_av_details: Dict[UUID, Tuple[Optional[Tuple[int, Vector3]], Optional[Object]]] = {}
-        for av_key in set(coarse_locations.keys()) | set(self._avatar_objects.keys()):
-            details = (coarse_locations.get(av_key), self._avatar_objects.get(av_key))
-            current_av_details[av_key] = details
-
-        # Look for changes in avatars we're already tracking
-        for existing_key in tuple(self._avatars.keys()):
-            av = self._avatars[existing_key]
-            if existing_key in current_av_details:
+            location = region.state.coarse_locations.get(av_key)
+            if location is not None:
+                coarse_pair = (region_handle, location)
+        return coarse_pair
+
+    def _update_avatars(self, av_keys: Iterable[UUID]):
+        """Merge together avatar details from coarse locations and objects for the given avatars"""
+        for av_key in av_keys:
+            coarse_pair = self._lookup_coarse_location(av_key)
+            av_obj = self._avatar_objects.get(av_key)
+            av = self._avatars.get(av_key)
+
+            if av is not None:
+                if coarse_pair is None and av_obj is None:
+                    # Avatar isn't in coarse locations or objects, it's gone.
+                    self._avatars.pop(av_key, None)
+                    av.Object = None
+                    av.CoarseLocation = None
+                    av.Valid = False
+                    continue
                 # This avatar this exists, update it.
-                coarse_pair, av_obj = current_av_details[existing_key]
                 av.Object = av_obj
                 if coarse_pair:
                     coarse_handle, coarse_location = coarse_pair
@@ -774,20 +849,12 @@ class ClientWorldObjectManager:
                     if av.CoarseLocation.Z != math.inf:
                         av.GuessedZ = None
                 if av_obj:
-                    av.Object = av_obj
                     av.RegionHandle = av_obj.RegionHandle
-            else:
-                # Avatar isn't in coarse locations or objects, it's gone.
-                self._avatars.pop(existing_key, None)
-                av.Object = None
-                av.CoarseLocation = None
-                av.Valid = False
-
-        # Check for any new avatars
-        for av_key, (coarse_pair, av_obj) in current_av_details.items():
-            if av_key in self._avatars:
-                # Already handled in the update step above
                 continue
+
+            if coarse_pair is None and av_obj is None:
+                continue
+            # New avatar
             region_handle = None
             coarse_location = None
             if coarse_pair:
@@ -822,13 +889,16 @@ class RegionObjectsState:
         self.localid_lookup: Dict[int, Object] = {}
         self.coarse_locations: Dict[UUID, Vector3] = {}
         self.materials: MATERIAL_MAP_TYPE = {}
-        self._object_futures: Dict[Tuple[int, int], List[asyncio.Future]] = {}
-        self._orphans: Dict[int, List[int]] = collections.defaultdict(list)
+        # local_id -> update_type -> futures
+        self._object_futures: Dict[int, Dict[ObjectUpdateType, List[asyncio.Future]]] = {}
+        # parent_id -> orphaned child IDs, dicts are used as ordered sets.
+        self._orphans: Dict[int, Dict[int, None]] = collections.defaultdict(dict)
 
     def clear(self):
         """Called by the owning ObjectManager when it knows the region is going away"""
-        for fut in tuple(itertools.chain(*self._object_futures.values())):
-            fut.cancel()
+        for local_futs in tuple(self._object_futures.values()):
+            for fut in tuple(itertools.chain(*local_futs.values())):
+                fut.cancel()
         self._object_futures.clear()
         self._orphans.clear()
         self.coarse_locations.clear()
@@ -865,17 +935,17 @@ class RegionObjectsState:
         Can happen due to the object being killed, or due to it moving to another region
         """
         former_child_ids = obj.ChildIDs[:]
+        # Every child is getting unlinked, so clear the lists in one go rather than
+        # removing children one at a time.
+        obj.ChildIDs.clear()
+        obj.Children.clear()
         for child_id in former_child_ids:
             child_obj = self.localid_lookup.get(child_id)
             assert child_obj is not None
-            self._unparent_object(child_obj, child_obj.ParentID)
-
-        # Place any remaining unkilled children in the orphanage
-        for child_id in former_child_ids:
+            child_obj.Parent = None
+            # Place any remaining unkilled children in the orphanage
             self._track_orphan(child_id, obj.LocalID)
 
-        assert not obj.ChildIDs
-
         # Make sure the parent knows we went away
         self._unparent_object(obj, obj.ParentID)
         # Object doesn't belong to this region anymore and won't receive
@@ -889,7 +959,8 @@ class RegionObjectsState:
         if obj.ParentID:
             parent = self.localid_lookup.get(obj.ParentID)
             if parent is not None:
-                assert obj.LocalID not in parent.ChildIDs
+                # Anything in a ChildIDs list has its Parent set, so this means it isn't already in one.
+                assert obj.Parent is None
                 # Link order is never explicitly passed to clients, so we have to do
                 # some nasty guesswork based on order of received initial ObjectUpdates
                 # Note that this is broken in the viewer as well, and there doesn't seem
@@ -914,8 +985,7 @@ class RegionObjectsState:
 
             old_parent = self.localid_lookup.get(old_parent_id)
             if old_parent:
-                if obj.LocalID in old_parent.ChildIDs:
-                    idx = old_parent.ChildIDs.index(obj.LocalID)
+                if (idx := self._find_child_idx(old_parent, obj.LocalID)) is not None:
                     del old_parent.ChildIDs[idx]
                     del old_parent.Children[idx]
                 else:
@@ -925,6 +995,17 @@ class RegionObjectsState:
             else:
                 LOG.debug(f"Changing parent of {obj.LocalID}, but couldn't find old parent")
 
+    @staticmethod
+    def _find_child_idx(parent: Object, local_id: int) -> Optional[int]:
+        child_ids = parent.ChildIDs
+        # Killing a linkset removes children back-to-front, so that's the fast path
+        if child_ids and child_ids[-1] == local_id:
+            return len(child_ids) - 1
+        try:
+            return child_ids.index(local_id)
+        except ValueError:
+            return None
+
     def handle_object_reparented(self, obj: Object, old_parent_id: int):
         """Recreate any links to ancestor Objects for obj due to parent changes"""
         self._unparent_object(obj, old_parent_id)
@@ -933,48 +1014,56 @@ class RegionObjectsState:
 
     def collect_orphans(self, parent_localid: int) -> Sequence[int]:
         """Take ownership of any orphan IDs belonging to parent_localid"""
-        return self._orphans.pop(parent_localid, [])
+        return list(self._orphans.pop(parent_localid, {}))
 
     def _track_orphan(self, local_id: int, parent_id: int):
         if len(self._orphans) > 100:
             LOG.warning(f"Orphaned object dict is getting large: {len(self._orphans)}")
-        self._orphans[parent_id].append(local_id)
+        self._orphans[parent_id][local_id] = None
 
     def _untrack_orphan(self, obj: Object, parent_id: int):
         """Remove obj from parent_id's list of orphans if present"""
         if parent_id not in self._orphans:
             return False
-        orphan_list = self._orphans[parent_id]
+        orphans = self._orphans[parent_id]
         removed = False
-        if obj.LocalID in orphan_list:
-            orphan_list.remove(obj.LocalID)
+        if obj.LocalID in orphans:
+            del orphans[obj.LocalID]
             removed = True
-        # List is empty now, get rid of it.
-        if not orphan_list:
+        # No orphans left, get rid of it.
+        if not orphans:
             del self._orphans[parent_id]
         return removed
 
     def register_future(self, local_id: int, future_type: ObjectUpdateType) -> asyncio.Future[Object]:
         fut = asyncio.Future()
-        fut_key = (local_id, future_type)
-        local_futs = self._object_futures.get(fut_key, [])
+        local_futs = self._object_futures.setdefault(local_id, {}).setdefault(future_type, [])
         local_futs.append(fut)
-        self._object_futures[fut_key] = local_futs
-        fut.add_done_callback(local_futs.remove)
+        fut.add_done_callback(functools.partial(self._forget_future, local_id, future_type))
         return fut
 
+    def _forget_future(self, local_id: int, future_type: ObjectUpdateType, fut: asyncio.Future):
+        local_futs = self._object_futures.get(local_id)
+        if not local_futs:
+            return
+        type_futs = local_futs.get(future_type)
+        if type_futs and fut in type_futs:
+            type_futs.remove(fut)
+            if not type_futs:
+                del local_futs[future_type]
+        if not local_futs:
+            del self._object_futures[local_id]
+
     def resolve_futures(self, obj: Object, update_type: ObjectUpdateType):
-        futures = self._object_futures.get((obj.LocalID, update_type), [])
+        futures = self._object_futures.get(obj.LocalID, {}).get(update_type, [])
         for fut in futures[:]:
             fut.set_result(obj)
 
     def cancel_futures(self, local_id: int):
         # Object went away, so need to kill any pending futures.
-        for fut_key, futs in self._object_futures.items():
-            if fut_key[0] == local_id:
-                for fut in futs:
-                    fut.cancel()
-                break
+        for futs in tuple(self._object_futures.get(local_id, {}).values()):
+            for fut in futs[:]:
+                fut.cancel()
 
 
 class LocationType(enum.IntEnum):
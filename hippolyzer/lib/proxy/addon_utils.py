@@ -20,6 +20,7 @@ from hippolyzer.lib.base.network.transport import UDPPacket, Direction
 from hippolyzer.lib.proxy.task_scheduler import TaskLifeScope
 from hippolyzer.lib.base.templates import ChatSourceType, ChatType
 if TYPE_CHECKING:
+    from hippolyzer.lib.client.object_manager import ObjectEvent
     from hippolyzer.lib.proxy.sessions import SessionManager, Session
     from hippolyzer.lib.proxy.region import ProxiedRegion
 
@@ -173,8 +174,20 @@ class BaseAddon(metaclass=MetaBaseAddon):
 
     def handle_object_updated(self, session: Session, region: ProxiedRegion,
                               obj: Object, updated_props: Set[str], msg: Optional[Message]):
+        """
+        Called for each object updated by a message
+
+        Only called once the whole message has been handled, so other objects
+        from the same message will already reflect their updates.
+        """
         pass
 
+    def handle_objects_updated(self, session: Session, region: ProxiedRegion,
+                               events: Sequence[ObjectEvent], msg: Optional[Message]):
+        """Called once with all objects updated by a message, override to handle them in bulk"""
+        for event in events:
+            self.handle_object_updated(session, region, event.object, event.updated, msg)
+
     def handle_object_killed(self, session: Session, region: ProxiedRegion, obj: Object):
         pass
 
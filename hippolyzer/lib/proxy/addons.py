@@ -19,7 +19,7 @@ import outleap
 
 from hippolyzer.lib.base.datatypes import UUID
 from hippolyzer.lib.base.helpers import get_mtime
-from hippolyzer.lib.base.message.message import Message
+from hippolyzer.lib.base.message.message import Message, maybe_reload_templates
 from hippolyzer.lib.base.network.transport import UDPPacket
 from hippolyzer.lib.client.rlv import RLVParser
 from hippolyzer.lib.proxy import addon_ctx
@@ -28,6 +28,7 @@ from hippolyzer.lib.proxy.task_scheduler import TaskLifeScope, TaskScheduler
 if TYPE_CHECKING:
     from hippolyzer.lib.proxy.commands import CommandDetails, WrappedCommandCallable
     from hippolyzer.lib.proxy.http_flow import HippoHTTPFlow
+    from hippolyzer.lib.client.object_manager import ObjectEvent
     from hippolyzer.lib.proxy.object_manager import Object
     from hippolyzer.lib.proxy.region import ProxiedRegion
     from hippolyzer.lib.proxy.sessions import Session, SessionManager
@@ -280,6 +281,10 @@ class AddonManager:
             return
         cls.LAST_RELOAD = time.time()
 
+        # Piggyback on the addon reload check rather than checking on every message
+        if cls.SESSION_MANAGER and cls.SESSION_MANAGER.settings.HOT_RELOAD_TEMPLATES:
+            maybe_reload_templates()
+
         cls._check_hotreloads()
 
         load_exception: Optional[Exception] = None
@@ -567,6 +572,21 @@ class AddonManager:
         with addon_ctx.push(session, region):
             return cls._call_all_addon_hooks("handle_object_updated", session, region, obj, updated_props, msg)
 
+    @classmethod
+    def handle_objects_updated(cls, session: Session, region: ProxiedRegion,
+                               events: Sequence[ObjectEvent], msg: Optional[Message]):
+        with addon_ctx.push(session, region):
+            for addon in cls._get_all_addon_objects():
+                if getattr(addon, "handle_objects_updated", None) is not None:
+                    cls._try_call_hook(addon, "handle_objects_updated", session, region, events, msg)
+                    continue
+                if getattr(addon, "handle_object_updated", None) is None:
+                    continue
+                # Addon modules that only know how to handle objects one at a time
+                for event in events:
+                    cls._try_call_hook(addon, "handle_object_updated", session, region,
+                                       event.object, event.updated, msg)
+
     @classmethod
     def handle_object_killed(cls, session: Session, region: ProxiedRegion, obj: Object):
         with addon_ctx.push(session, region):
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import bisect
 import enum
+import os
 import typing
 from weakref import ref
 from typing import *
@@ -9,6 +11,8 @@ if TYPE_CHECKING:
     from hippolyzer.lib.proxy.region import ProxiedRegion
     from hippolyzer.lib.proxy.sessions import Session, SessionManager
 
+_T = TypeVar("_T")
+
 
 def is_asset_server_cap_name(cap_name):
     return cap_name and (
@@ -91,3 +95,71 @@ class CapData(NamedTuple):
     @property
     def asset_server_cap(self) -> bool:
         return is_asset_server_cap_name(self.cap_name)
+
+
+class CapsURLIndex(Generic[_T]):
+    """
+    Maps cap URLs to values, finding the entry for the longest cap URL that a URL starts with
+
+    Cap URLs are kept sorted so lookups are O(log n) in the number of cap URLs
+    rather than a `startswith()` check against each of them. Multiple values may
+    be registered under the same cap URL, the most recently added one wins.
+    """
+    def __init__(self):
+        self._urls: List[str] = []
+        self._values: Dict[str, List[_T]] = {}
+
+    def add(self, cap_url: str, value: _T):
+        values = self._values.get(cap_url)
+        if values is None:
+            bisect.insort(self._urls, cap_url)
+            values = self._values[cap_url] = []
+        values.append(value)
+
+    def remove(self, cap_url: str, value: _T):
+        values = self._values[cap_url]
+        # Undo the most recent registration of this value
+        for i in range(len(values) - 1, -1, -1):
+            if values[i] == value:
+                del values[i]
+                break
+        else:
+            raise ValueError(f"{value!r} not registered for {cap_url!r}")
+        if not values:
+            del self._values[cap_url]
+            del self._urls[bisect.bisect_left(self._urls, cap_url)]
+
+    def lookup(self, url: str, predicate: Optional[Callable[[_T], bool]] = None) -> Optional[_T]:
+        """
+        Find the value for the longest cap URL that `url` starts with
+
+        If `predicate` is given, values it rejects are skipped over as if they
+        had never been registered.
+        """
+        urls = self._urls
+        while True:
+            # The greatest cap URL sorting at or before `url` is the longest prefix
+            # of `url`, if any of them are.
+            idx = bisect.bisect_right(urls, url) - 1
+            if idx < 0:
+                return None
+            cap_url = urls[idx]
+            if url.startswith(cap_url):
+                values = self._values[cap_url]
+                if predicate is None:
+                    return values[-1]
+                for value in reversed(values):
+                    if predicate(value):
+                        return value
+                # Nothing shorter than an empty cap URL to fall back to
+                if not cap_url:
+                    return None
+                # Any shorter cap URL that `url` starts with is a prefix of this one too
+                url = cap_url[:-1]
+            else:
+                # Any cap URL that `url` starts with must be a prefix of what they
+                # have in common, and that's strictly shorter than `url`.
+                url = os.path.commonprefix((url, cap_url))
+
+    def __len__(self):
+        return len(self._urls)
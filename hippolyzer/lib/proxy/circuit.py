@@ -1,30 +1,27 @@
 from __future__ import annotations
 
+import bisect
 import logging
 from collections import deque
 from typing import *
 
 from hippolyzer.lib.base.message.circuit import Circuit
 from hippolyzer.lib.base.message.message import Message
-from hippolyzer.lib.base.message.msgtypes import PacketFlags
 from hippolyzer.lib.base.network.transport import Direction
 
 LLUDP_LOGGING_HOOK = Optional[Callable[[Message], Any]]
 
 
 class ProxiedCircuit(Circuit):
-    def __init__(self, near_host, far_host, transport, logging_hook: LLUDP_LOGGING_HOOK = None):
-        super().__init__(near_host, far_host, transport)
+    def __init__(self, near_host, far_host, transport, logging_hook: LLUDP_LOGGING_HOOK = None,
+                 batch_sends: bool = False, coalesce_acks: bool = False):
+        super().__init__(near_host, far_host, transport, batch_sends=batch_sends, coalesce_acks=coalesce_acks)
         self.in_injections = InjectionTracker(0)
         self.out_injections = InjectionTracker(0)
         self.logging_hook: LLUDP_LOGGING_HOOK = logging_hook
 
     def _send_prepared_message(self, message: Message, transport=None):
-        try:
-            serialized = self.serializer.serialize(message)
-        except:
-            logging.exception(f"Failed to serialize: {message.to_dict()!r}")
-            raise
+        serialized = self._serialize_prepared_message(message)
         if self.logging_hook and message.synthetic:
             self.logging_hook(message)
         return self.send_datagram(serialized, message.direction, transport=transport)
@@ -71,10 +68,8 @@ class ProxiedCircuit(Circuit):
             elif message.name == "StartPingCheck":
                 self._rewrite_start_ping_check(message, fwd_injections)
 
-        if message.acks:
-            message.send_flags |= PacketFlags.ACK
-        else:
-            message.send_flags &= ~PacketFlags.ACK
+        # Already in the ID space of the receiving end, so only attach after rewriting.
+        self._finalize_acks(message)
         return True
 
     def _rewrite_packet_ack(self, message: Message, reverse_injections):
@@ -137,44 +132,72 @@ class InjectionTracker:
         self._packet_id_base = last_seen_id
         self._injection_base = 0
         self._maxlen = maxlen
-        self.injections: deque[int] = deque(maxlen=maxlen)
-        self.dropped: deque[int] = deque(maxlen=maxlen)
+        # Injected IDs are always newer than any ID seen before them, so this is
+        # always sorted. Evicted IDs are only snipped off the head in bulk, anything
+        # before `_injections_head` is no longer tracked.
+        self._injections: List[int] = []
+        self._injections_head = 0
+        # `injected_id - total_injections_before_it` for each injected ID. Used to
+        # bisect for the number of injections that come before an effective ID.
+        self._injection_slots: List[int] = []
+        self._injections_set: Set[int] = set()
+        self._num_injections = 0
+        self._dropped: deque[int] = deque()
+        self._dropped_set: Set[int] = set()
+
+    @property
+    def injections(self) -> Sequence[int]:
+        """Injected packet IDs that are still being tracked, oldest first"""
+        return tuple(self._injections[self._injections_head:])
+
+    @property
+    def dropped(self) -> Sequence[int]:
+        """Dropped packet IDs that are still being tracked, oldest first"""
+        return tuple(self._dropped)
 
     def gen_injectable_id(self) -> int:
         new_id = self._packet_id_base + 1
-        if len(self.injections) == self.injections.maxlen:
+        if len(self._injections_set) == self._maxlen:
             # ID is about to fall off, old enough we can just add
             # it to the base for all Packet ID corrections.
             self._injection_base += 1
-        self.injections.append(new_id)
+            self._injections_set.discard(self._injections[self._injections_head])
+            self._injections_head += 1
+            if self._injections_head >= self._maxlen:
+                del self._injections[:self._injections_head]
+                del self._injection_slots[:self._injections_head]
+                self._injections_head = 0
+        self._injections.append(new_id)
+        self._injection_slots.append(new_id - self._num_injections)
+        self._injections_set.add(new_id)
+        self._num_injections += 1
         self.track_seen(new_id)
         return new_id
 
     def was_injected(self, packet_id: int):
-        return packet_id in self.injections
+        return packet_id in self._injections_set
 
     def was_dropped(self, packet_id: int):
-        return packet_id in self.dropped
+        return packet_id in self._dropped_set
 
     def get_effective_id(self, orig_id: int):
-        new_id = orig_id + self._injection_base
-        for packet_id in self.injections:
-            if new_id < packet_id and new_id not in self.injections:
-                break
-            new_id += 1
+        # Effective ID gets bumped by one for every injected ID at or below it. Since
+        # `_injection_slots` is non-decreasing, we can bisect for the first injection
+        # that comes after the effective ID. Evicted injections are already accounted
+        # for by `_injection_base`, so they cancel out of the slot comparison.
+        head = self._injections_head
+        num_before = bisect.bisect_right(self._injection_slots, orig_id, lo=head) - head
+        new_id = orig_id + self._injection_base + num_before
         if orig_id != new_id:
             logging.debug("Effective corrected %d -> %d" % (orig_id, new_id))
         return new_id
 
     def get_original_id(self, effective_id: int):
-        if effective_id in self.injections:
+        if effective_id in self._injections_set:
             raise ValueError(f"No original ID for injected packet {effective_id}!")
 
-        new_id = effective_id
-        for packet_id in reversed(self.injections):
-            if packet_id > new_id:
-                break
-            new_id -= 1
+        head = self._injections_head
+        new_id = effective_id - (bisect.bisect_left(self._injections, effective_id, lo=head) - head)
         new_id -= self._injection_base
         if effective_id != new_id:
             logging.debug("Orig corrected %d -> %d" % (effective_id, new_id))
@@ -191,8 +214,12 @@ class InjectionTracker:
             logging.warning(f"Received VERY old packet ID {orig_id}, likely generated invalid ID.")
 
     def mark_dropped(self, packet_id: int):
-        if packet_id not in self.dropped:
-            self.dropped.append(packet_id)
+        if packet_id in self._dropped_set:
+            return
+        if len(self._dropped) == self._maxlen:
+            self._dropped_set.discard(self._dropped.popleft())
+        self._dropped.append(packet_id)
+        self._dropped_set.add(packet_id)
 
     def __repr__(self):
         return f"{self.__class__.__name__}(inject_base={self._injection_base}," \
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 import multiprocessing
 import queue
@@ -17,6 +16,7 @@ from hippolyzer.lib.base import llsd
 from hippolyzer.lib.base.datatypes import UUID
 from hippolyzer.lib.base.message.llsd_msg_serializer import LLSDMessageSerializer
 from hippolyzer.lib.base.message.message import Message
+from hippolyzer.lib.base.multiprocessing_utils import wait_for_queue
 from hippolyzer.lib.base.network.transport import Direction
 from hippolyzer.lib.proxy.addons import AddonManager
 from hippolyzer.lib.proxy.http_flow import HippoHTTPFlow
@@ -37,6 +37,26 @@ apply_security_monkeypatches()
 LOG = logging.getLogger(__name__)
 
 
+def _copy_llsd_containers(val: Any) -> Any:
+    # LLSD scalars are all immutable, so only the containers need copying.
+    if isinstance(val, dict):
+        return {k: _copy_llsd_containers(v) for k, v in val.items()}
+    if isinstance(val, list):
+        return [_copy_llsd_containers(v) for v in val]
+    return val
+
+
+def _llsd_strictly_equal(a: Any, b: Any) -> bool:
+    # Like `==`, but `1`, `1.0` and `True` serialize differently so they aren't equal here.
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_llsd_strictly_equal(v, b[k]) for k, v in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_llsd_strictly_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
 class MITMProxyEventManager:
     """
     Handles HTTP request and response events from the mitmproxy process
@@ -69,7 +89,9 @@ class MITMProxyEventManager:
         try:
             event_type, flow_state = self.from_proxy_queue.get(False)
         except queue.Empty:
-            await asyncio.sleep(0.001)
+            # Wake up as soon as mitmproxy hands us a flow, only timing out
+            # so `run()` gets a chance to notice the shutdown signal.
+            await wait_for_queue(self.from_proxy_queue, timeout=0.1)
             return
 
         flow = HippoHTTPFlow.from_state(flow_state, self.session_manager)
@@ -159,7 +181,7 @@ class MITMProxyEventManager:
                 LOG.warning("Had to serve a cached EventQueueGet due to client desync")
                 flow.response = mitmproxy.http.Response.make(
                     200,
-                    llsd.format_xml(cached_resp),
+                    cached_resp,
                     {
                         "Content-Type": "application/llsd+xml",
                         # So we can differentiate these in the log
@@ -295,24 +317,7 @@ class MITMProxyEventManager:
                     parsed[cap_name] = region.cap_urls[cap_name]
                 flow.response.content = llsd.format_xml(parsed)
             elif cap_data.cap_name == "EventQueueGet":
-                parsed_eq_resp = llsd.parse_xml(flow.response.content)
-                if parsed_eq_resp:
-                    old_events = parsed_eq_resp["events"]
-                    new_events = []
-                    for event in old_events:
-                        if not self._handle_eq_event(cap_data.session(), region, event):
-                            new_events.append(event)
-                    # Add on any fake events that've been queued by addons
-                    eq_manager = cap_data.region().eq_manager
-                    new_events.extend(eq_manager.take_injected_events())
-                    parsed_eq_resp["events"] = new_events
-                    # Empty event list is an error, need to return undef instead.
-                    if old_events and not new_events:
-                        parsed_eq_resp = None
-                    # HACK: see note in above request handler for EventQueueGet
-                    req_ack_id = llsd.parse_xml(flow.request.content)["ack"]
-                    eq_manager.cache_last_poll_response(req_ack_id, parsed_eq_resp)
-                flow.response.content = llsd.format_xml(parsed_eq_resp)
+                self._handle_eq_response(flow, session, region)
             elif cap_data.cap_name in self.UPLOAD_CREATING_CAPS:
                 if not region:
                     return
@@ -322,6 +327,34 @@ class MITMProxyEventManager:
         except:
             LOG.exception("OOPS, blew up in HTTP proxy!")
 
+    def _handle_eq_response(self, flow: HippoHTTPFlow, session: Session, region: ProxiedRegion):
+        parsed_eq_resp = llsd.parse_xml(flow.response.content)
+        if not parsed_eq_resp:
+            return
+        old_events = parsed_eq_resp["events"]
+        # Handlers are allowed to change events in-place, keep a copy to compare against
+        # so we know whether we need to re-serialize. Much cheaper than `format_xml()`.
+        orig_events = _copy_llsd_containers(old_events)
+        new_events = []
+        for event in old_events:
+            if not self._handle_eq_event(session, region, event):
+                new_events.append(event)
+        # Add on any fake events that've been queued by addons
+        eq_manager = region.eq_manager
+        new_events.extend(eq_manager.take_injected_events())
+
+        if not _llsd_strictly_equal(new_events, orig_events):
+            parsed_eq_resp["events"] = new_events
+            # Empty event list is an error, need to return undef instead.
+            if old_events and not new_events:
+                parsed_eq_resp = None
+            flow.response.content = llsd.format_xml(parsed_eq_resp)
+        # Otherwise the body is passed through untouched.
+
+        # HACK: see note in above request handler for EventQueueGet
+        req_ack_id = llsd.parse_xml(flow.request.content)["ack"]
+        eq_manager.cache_last_poll_response(req_ack_id, flow.response.content if parsed_eq_resp else None)
+
     def _handle_login_flow(self, flow: HippoHTTPFlow):
         resp = xmlrpc.client.loads(flow.response.content)[0][0]  # type: ignore
         sess = self.session_manager.create_session(resp)
@@ -10,6 +10,7 @@ import mitmproxy.http
 from mitmproxy.http import HTTPFlow
 
 from hippolyzer.lib.proxy.caps import CapData
+from hippolyzer.lib.proxy.http_proxy import load_shared_flow_bodies
 
 if TYPE_CHECKING:
     from hippolyzer.lib.proxy.sessions import SessionManager
@@ -22,12 +23,15 @@ class HippoHTTPFlow:
     Hides the nastiness of writing to flow.metadata so we can pass
     state back and forth between the two proxies
     """
-    __slots__ = ("flow", "callback_queue", "resumed", "taken")
+    __slots__ = ("flow", "callback_queue", "resumed", "taken", "_received_bodies")
 
     def __init__(self, flow: HTTPFlow, callback_queue: Optional[multiprocessing.Queue] = None):
         self.flow: HTTPFlow = flow
         self.resumed = False
         self.taken = False
+        # Bodies as they were when we got the flow from mitmproxy, only these need
+        # to be sent back if something replaced them.
+        self._received_bodies: Tuple[Optional[bytes], Optional[bytes]] = (None, None)
         self.callback_queue = weakref.ref(callback_queue) if callback_queue else None
         meta = self.flow.metadata
         meta.setdefault("can_stream", True)
@@ -109,7 +113,7 @@ class HippoHTTPFlow:
         assert not self.resumed
         self.taken = False
         self.resumed = True
-        self.callback_queue().put(("callback", self.flow.id, self.get_state()))
+        self.callback_queue().put(("callback", self.flow.id, self.get_state(elide_unchanged_bodies=True)))
 
     def preempt(self):
         # Must be some flow that we previously resumed, we're racing
@@ -121,7 +125,7 @@ class HippoHTTPFlow:
     def is_replay(self) -> bool:
         return bool(self.flow.is_replay)
 
-    def get_state(self) -> Dict:
+    def get_state(self, elide_unchanged_bodies: bool = False) -> Dict:
         flow = self.flow
         # Not serializable, so we have to pop it off to send across the wire.
         cap_data: Optional[CapData] = flow.metadata.pop("cap_data", None)
@@ -132,10 +136,21 @@ class HippoHTTPFlow:
         state = self.flow.get_state()
         # Shove it back on
         flow.metadata["cap_data"] = cap_data
+        if elide_unchanged_bodies:
+            # mitmproxy's side still has its own copy of any bodies we didn't replace,
+            # no sense in pickling them all over again.
+            elided = []
+            for part, received_body in zip(("request", "response"), self._received_bodies):
+                message = getattr(flow, part)
+                if received_body is not None and message is not None and message.raw_content is received_body:
+                    state[part]["content"] = None
+                    elided.append(part)
+            state["metadata"]["elided_bodies"] = elided
         return state
 
     @classmethod
     def from_state(cls, flow_state: Dict, session_manager: Optional[SessionManager]) -> HippoHTTPFlow:
+        load_shared_flow_bodies(flow_state)
         flow: Optional[HTTPFlow] = HTTPFlow.from_state(flow_state)
         assert flow is not None
         cap_data_ser = flow.metadata.get("cap_data_ser")
@@ -146,7 +161,12 @@ class HippoHTTPFlow:
             flow.metadata["cap_data"] = CapData.deserialize(cap_data_ser, session_manager)
         else:
             flow.metadata["cap_data"] = None
-        return cls(flow, callback_queue)
+        hippo_flow = cls(flow, callback_queue)
+        hippo_flow._received_bodies = (
+            flow.request.raw_content,
+            flow.response.raw_content if flow.response else None,
+        )
+        return hippo_flow
 
     def copy(self) -> HippoHTTPFlow:
         # HACK: flow.copy() expects the flow to be fully JSON serializable, but
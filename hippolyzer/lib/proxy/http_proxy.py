@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import multiprocessing
 import os
@@ -8,6 +7,8 @@ import queue
 import typing
 import uuid
 import weakref
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from typing import Iterable
 
 import mitmproxy.certs
@@ -25,7 +26,7 @@ from mitmproxy.proxy.layers import tls
 import OpenSSL
 
 from hippolyzer.lib.base.helpers import get_resource_filename, create_logged_task
-from hippolyzer.lib.base.multiprocessing_utils import ParentProcessWatcher
+from hippolyzer.lib.base.multiprocessing_utils import ParentProcessWatcher, wait_for_queue
 from hippolyzer.lib.proxy.caps import SerializedCapData
 
 
@@ -95,12 +96,84 @@ class SLTlsConfig(mitmproxy.addons.tlsconfig.TlsConfig):
         OpenSSL.SSL._lib.X509_VERIFY_PARAM_set_hostflags(param, flags)  # noqa
 
 
+# Bodies at least this large get handed across the process boundary through shared memory
+SHARED_BODY_MIN_SIZE = 64 * 1024
+
+
 class HTTPFlowContext:
-    def __init__(self):
+    def __init__(self, share_large_bodies: bool = False):
         self.from_proxy_queue = multiprocessing.Queue()
         self.to_proxy_queue = multiprocessing.Queue()
         self.shutdown_signal = multiprocessing.Event()
         self.mitmproxy_ready = multiprocessing.Event()
+        self.share_large_bodies = share_large_bodies
+
+
+def _create_untracked_shared_memory(size: int) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        return SharedMemory(create=True, size=size, track=False)
+    shm = SharedMemory(create=True, size=size)
+    # The consuming process is the one that unlinks the segment, so our resource tracker
+    # shouldn't think we leaked it. Only POSIX registers shared memory with the tracker.
+    if os.name == "posix":
+        resource_tracker.unregister(shm._name, "shared_memory")  # noqa
+    return shm
+
+
+def _unlink_untracked_shared_memory(shm: SharedMemory):
+    try:
+        if sys.version_info < (3, 13) and os.name == "posix":
+            # `unlink()` would also unregister it from a resource tracker that was never tracking it
+            import _posixshmem
+            _posixshmem.shm_unlink(shm._name)  # noqa
+        else:
+            shm.unlink()
+    except FileNotFoundError:
+        # The consuming process already got to it
+        pass
+
+
+def share_flow_bodies(flow_state: typing.Dict) -> typing.List[SharedMemory]:
+    """
+    Move large bodies in `flow_state` into shared memory so they don't have to be pickled
+
+    The segments must be kept alive until the other end calls `load_shared_flow_bodies()`,
+    but the creator should still unlink them once it's done in case the other end never did.
+    """
+    shared_bodies = {}
+    segments = []
+    for part in ("request", "response"):
+        msg_state = flow_state.get(part)
+        content = msg_state and msg_state["content"]
+        if not content or len(content) < SHARED_BODY_MIN_SIZE:
+            continue
+        shm = _create_untracked_shared_memory(len(content))
+        shm.buf[:len(content)] = content
+        msg_state["content"] = None
+        shared_bodies[part] = (shm.name, len(content))
+        segments.append(shm)
+    if shared_bodies:
+        flow_state["metadata"]["shared_bodies"] = shared_bodies
+    return segments
+
+
+def load_shared_flow_bodies(flow_state: typing.Dict):
+    """Put any bodies that were moved into shared memory back into `flow_state`, freeing the segments"""
+    shared_bodies = flow_state["metadata"].pop("shared_bodies", None)
+    if not shared_bodies:
+        return
+    for part, (name, size) in shared_bodies.items():
+        try:
+            shm = SharedMemory(name=name)
+        except FileNotFoundError:
+            # mitmproxy already gave up on the flow and freed it, nobody's waiting on this body.
+            logging.warning(f"Shared {part} body for flow {flow_state['id']} already freed")
+            continue
+        try:
+            flow_state[part]["content"] = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+            shm.unlink()
 
 
 class IPCInterceptionAddon:
@@ -115,6 +188,9 @@ class IPCInterceptionAddon:
         self.from_proxy_queue: multiprocessing.Queue = flow_context.from_proxy_queue
         self.to_proxy_queue: multiprocessing.Queue = flow_context.to_proxy_queue
         self.shutdown_signal: multiprocessing.Event = flow_context.shutdown_signal
+        self.share_large_bodies = flow_context.share_large_bodies
+        # Shared memory segments holding bodies for flows that haven't come back yet
+        self.shared_segments: typing.Dict[str, typing.List[SharedMemory]] = {}
 
     def running(self):
         # register to pump the events or something here
@@ -131,15 +207,19 @@ class IPCInterceptionAddon:
                 try:
                     event_type, flow_id, flow_state = self.to_proxy_queue.get(False)
                 except queue.Empty:
-                    await asyncio.sleep(0.001)
+                    # Only time out so we periodically check whether we need to shut down
+                    await wait_for_queue(self.to_proxy_queue, timeout=0.1)
                     continue
                 if event_type == "callback":
+                    self._free_shared_segments(flow_id)
                     orig_flow = self.flows[flow_id]
+                    self._restore_elided_bodies(orig_flow, flow_state)
                     orig_flow.set_state(flow_state)
                 elif event_type == "preempt":
                     orig_flow = self.flows.get(flow_id)
                     if orig_flow:
                         orig_flow.intercept()
+                        self._restore_elided_bodies(orig_flow, flow_state)
                         orig_flow.set_state(flow_state)
                 elif event_type == "replay":
                     flow: HTTPFlow = HTTPFlow.from_state(flow_state)
@@ -155,8 +235,24 @@ class IPCInterceptionAddon:
             finally:
                 if orig_flow is not None:
                     orig_flow.resume()
+        for flow_id in tuple(self.shared_segments):
+            self._free_shared_segments(flow_id)
         mitmproxy.ctx.master.shutdown()
 
+    def _free_shared_segments(self, flow_id: str):
+        # Don't rely on the main process having unlinked these, it may have
+        # died or dropped the flow before it got around to loading the bodies.
+        for shm in self.shared_segments.pop(flow_id, ()):
+            shm.close()
+            _unlink_untracked_shared_memory(shm)
+
+    @staticmethod
+    def _restore_elided_bodies(flow: HTTPFlow, flow_state: typing.Dict):
+        # The main process didn't change these bodies so it didn't bother sending them back,
+        # put back the copies we already have.
+        for part in flow_state["metadata"].pop("elided_bodies", ()):
+            flow_state[part]["content"] = getattr(flow, part).raw_content
+
     def request(self, flow: HTTPFlow):
         # This should only appear in the UA of the integrated browser
         from_browser = "Mozilla" in flow.request.headers.get("User-Agent", "")
@@ -175,7 +271,19 @@ class IPCInterceptionAddon:
     def _queue_flow_interception(self, event_type: str, flow: HTTPFlow):
         flow.intercept()
         self.flows[flow.id] = flow
-        self.from_proxy_queue.put((event_type, flow.get_state()), True)
+        flow_state = flow.get_state()
+        if self.share_large_bodies:
+            self._free_shared_segments(flow.id)
+            segments = share_flow_bodies(flow_state)
+            if segments:
+                self.shared_segments[flow.id] = segments
+                # Don't keep these around for the life of the process if the flow never gets resumed
+                weakref.finalize(flow, self._free_shared_segments, flow.id)
+        self.from_proxy_queue.put((event_type, flow_state), True)
+
+    def error(self, flow: HTTPFlow):
+        # Killed or aborted by the client, we're not getting a callback for this one.
+        self._free_shared_segments(flow.id)
 
     def responseheaders(self, flow: HTTPFlow):
         # The response was injected earlier in an earlier handler,
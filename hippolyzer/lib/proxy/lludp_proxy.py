@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import weakref
 from typing import Optional, Tuple
@@ -36,18 +35,6 @@ class InterceptingLLUDPProxyProtocol(UDPProxyProtocol):
         )
         self.message_xml = MessageDotXML()
         self.session: Optional[Session] = None
-        loop = asyncio.get_event_loop_policy().get_event_loop()
-        self.resend_task = loop.create_task(self.attempt_resends())
-
-    async def attempt_resends(self):
-        while True:
-            await asyncio.sleep(0.1)
-            if self.session is None:
-                continue
-            for region in self.session.regions:
-                if not region.circuit or not region.circuit.is_alive:
-                    continue
-                region.circuit.resend_unacked()
 
     def _ensure_message_allowed(self, msg: Message):
         if not self.message_xml.validate_udp_msg(msg.name):
@@ -174,4 +161,3 @@ class InterceptingLLUDPProxyProtocol(UDPProxyProtocol):
             AddonManager.handle_session_closed(self.session)
             self.session_manager.close_session(self.session)
         self.session = None
-        self.resend_task.cancel()
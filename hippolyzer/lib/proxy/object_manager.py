@@ -11,7 +11,7 @@ from hippolyzer.lib.base.templates import PCode
 from hippolyzer.lib.client.namecache import NameCache
 from hippolyzer.lib.client.object_manager import (
     ClientObjectManager,
-    ObjectUpdateType, ClientWorldObjectManager,
+    ObjectUpdateType, ClientWorldObjectManager, ObjectEvent,
 )
 
 from hippolyzer.lib.base.objects import Object
@@ -154,7 +154,16 @@ class ProxyWorldObjectManager(ClientWorldObjectManager):
                     # have no way to get a sitting agent's true region location, even if it's ourselves.
                     region.objects.queued_cache_misses.add(obj.ParentID)
                     region.objects.request_missed_cached_objects_soon()
-        AddonManager.handle_object_updated(self._session, region, obj, updated_props, msg)
+
+    def _dispatch_object_batch(self, events: List[ObjectEvent], msg: Optional[Message]):
+        super()._dispatch_object_batch(events, msg)
+        # Addon hooks are per-region, and objects may have changed regions mid-message.
+        events_by_region: Dict[int, List[ObjectEvent]] = {}
+        for event in events:
+            events_by_region.setdefault(event.object.RegionHandle, []).append(event)
+        for handle, region_events in events_by_region.items():
+            region = self._session.region_by_handle(handle)
+            AddonManager.handle_objects_updated(self._session, region, region_events, msg)
 
     def _run_kill_object_hooks(self, obj: Object):
         super()._run_kill_object_hooks(obj)
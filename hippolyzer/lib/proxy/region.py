@@ -16,7 +16,7 @@ from hippolyzer.lib.base.message.message_handler import MessageHandler
 from hippolyzer.lib.client.state import BaseClientRegion
 from hippolyzer.lib.proxy.caps_client import ProxyCapsClient
 from hippolyzer.lib.proxy.circuit import ProxiedCircuit
-from hippolyzer.lib.proxy.caps import CapType
+from hippolyzer.lib.proxy.caps import CapData, CapType, CapsURLIndex, is_asset_server_cap_name
 from hippolyzer.lib.proxy.object_manager import ProxyObjectManager
 from hippolyzer.lib.base.transfer_manager import TransferManager
 from hippolyzer.lib.base.xfer_manager import XferManager
@@ -55,10 +55,10 @@ class ProxiedRegion(BaseClientRegion):
         self.circuit_addr = circuit_addr
         self.caps = CapsMultiDict()
         # Reverse lookup for URL -> cap data
-        self._caps_url_lookup: Dict[str, Tuple[CapType, str]] = {}
-        if seed_cap:
-            self.caps["Seed"] = (CapType.NORMAL, seed_cap)
+        self._caps_url_lookup: CapsURLIndex[Tuple[str, str, CapType]] = CapsURLIndex()
         self.session: Callable[[], Session] = weakref.ref(session)
+        if seed_cap:
+            self._add_cap("Seed", CapType.NORMAL, seed_cap)
         self.message_handler: MessageHandler[Message, str] = MessageHandler()
         self.http_message_handler: MessageHandler[HippoHTTPFlow, str] = MessageHandler()
         self.eq_manager = EventQueueManager(self)
@@ -69,7 +69,6 @@ class ProxiedRegion(BaseClientRegion):
         self.transfer_manager = TransferManager(proxify(self), session.agent_id, session.id)
         self.asset_uploader = ProxyAssetUploader(proxify(self))
         self.parcel_manager = ProxyParcelManager(proxify(self))
-        self._recalc_caps()
 
     @property
     def cap_urls(self) -> multidict.MultiDict[str]:
@@ -78,14 +77,45 @@ class ProxiedRegion(BaseClientRegion):
     def update_caps(self, caps: Mapping[str, str]):
         for cap_name, cap_url in caps.items():
             if isinstance(cap_url, str) and cap_url.startswith('http'):
-                self.caps.add(cap_name, (CapType.NORMAL, cap_url))
-                self._recalc_caps()
+                self._add_cap(cap_name, CapType.NORMAL, cap_url)
 
-    def _recalc_caps(self):
-        self._caps_url_lookup.clear()
-        for name, cap_info in self.caps.items():
-            cap_type, cap_url = cap_info
-            self._caps_url_lookup[cap_url] = (cap_type, name)
+    def _add_cap(self, name: str, cap_type: CapType, cap_url: str):
+        self.caps.add(name, (cap_type, cap_url))
+        self._caps_url_lookup.add(cap_url, (name, cap_url, cap_type))
+        cap_url_index = self._get_cap_url_index()
+        if cap_url_index is not None:
+            cap_url_index.add(cap_url, self._make_cap_data(name, cap_type, cap_url))
+
+    def _remove_cap(self, name: str, cap_type: CapType, cap_url: str):
+        caps = self.caps.popall(name)
+        caps.remove((cap_type, cap_url))
+        self.caps.extend((name, x) for x in caps)
+        self._caps_url_lookup.remove(cap_url, (name, cap_url, cap_type))
+        cap_url_index = self._get_cap_url_index()
+        if cap_url_index is not None:
+            cap_url_index.remove(cap_url, self._make_cap_data(name, cap_type, cap_url))
+
+    def _get_cap_url_index(self) -> Optional[CapsURLIndex[CapData]]:
+        session = self.session()
+        if session is None or session.session_manager is None:
+            return None
+        return session.session_manager.cap_url_index
+
+    def _make_cap_data(self, name: str, cap_type: CapType, cap_url: str) -> CapData:
+        # GetMesh and friends can't be tied to a specific session or region
+        # (at least on agni) unless we go through a proxy wrapper, since every
+        # region just points at the global asset CDN.
+        if is_asset_server_cap_name(name) and cap_type != CapType.WRAPPER:
+            return CapData(name, None, None, cap_url, cap_type)
+        return CapData(name, weakref.ref(self), self.session, cap_url, cap_type)
+
+    def unindex_caps(self):
+        """Remove all of this region's caps from the session manager's cap URL index"""
+        cap_url_index = self._get_cap_url_index()
+        if cap_url_index is None:
+            return
+        for name, (cap_type, cap_url) in self.caps.items():
+            cap_url_index.remove(cap_url, self._make_cap_data(name, cap_type, cap_url))
 
     def register_wrapper_cap(self, name: str):
         """
@@ -120,21 +150,17 @@ class ProxiedRegion(BaseClientRegion):
         return cap_url
 
     def register_cap(self, name: str, cap_url: str, cap_type: CapType = CapType.NORMAL):
-        self.caps.add(name, (cap_type, cap_url))
-        self._recalc_caps()
+        self._add_cap(name, cap_type, cap_url)
 
     def resolve_cap(self, url: str, consume=True) -> Optional[Tuple[str, str, CapType]]:
-        for cap_url in self._caps_url_lookup.keys():
-            if url.startswith(cap_url):
-                cap_type, name = self._caps_url_lookup[cap_url]
-                if cap_type == CapType.TEMPORARY and consume:
-                    # Resolving a temporary cap pops it out of the dict
-                    temporary_caps = self.caps.popall(name)
-                    temporary_caps.remove((cap_type, cap_url))
-                    self.caps.extend((name, x) for x in temporary_caps)
-                    self._recalc_caps()
-                return name, cap_url, cap_type
-        return None
+        resolved_cap = self._caps_url_lookup.lookup(url)
+        if resolved_cap is None:
+            return None
+        name, cap_url, cap_type = resolved_cap
+        if cap_type == CapType.TEMPORARY and consume:
+            # Resolving a temporary cap pops it out of the dict
+            self._remove_cap(name, cap_type, cap_url)
+        return resolved_cap
 
     def mark_dead(self):
         super().mark_dead()
@@ -147,7 +173,7 @@ class EventQueueManager:
         self._queued_events = []
         self._region = weakref.proxy(region)
         self._last_ack: Optional[int] = None
-        self._last_payload: Optional[Any] = None
+        self._last_payload: Optional[bytes] = None
         self.llsd_message_serializer = LLSDMessageSerializer()
 
     def inject_message(self, message: Message):
@@ -174,11 +200,12 @@ class EventQueueManager:
         self._queued_events = []
         return events
 
-    def cache_last_poll_response(self, req_ack: int, payload: Any):
+    def cache_last_poll_response(self, req_ack: int, payload: Optional[bytes]):
+        """Cache the serialized body of the last EventQueueGet response sent to the client"""
         self._last_ack = req_ack
         self._last_payload = payload
 
-    def get_cached_poll_response(self, req_ack: Optional[int]) -> Optional[Any]:
+    def get_cached_poll_response(self, req_ack: Optional[int]) -> Optional[bytes]:
         if self._last_ack == req_ack:
             return self._last_payload
         return None
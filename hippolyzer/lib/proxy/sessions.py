@@ -7,7 +7,6 @@ import functools
 import logging
 import multiprocessing
 from typing import *
-from weakref import ref
 
 from outleap import LEAPClient
 
@@ -20,7 +19,7 @@ from hippolyzer.lib.proxy.addons import AddonManager
 from hippolyzer.lib.proxy.circuit import ProxiedCircuit
 from hippolyzer.lib.proxy.http_asset_repo import HTTPAssetRepo
 from hippolyzer.lib.proxy.http_proxy import HTTPFlowContext
-from hippolyzer.lib.proxy.caps import is_asset_server_cap_name, CapData, CapType
+from hippolyzer.lib.proxy.caps import CapData, CapType, CapsURLIndex
 from hippolyzer.lib.proxy.inventory_manager import ProxyInventoryManager
 from hippolyzer.lib.proxy.namecache import ProxyNameCache
 from hippolyzer.lib.proxy.object_manager import ProxyWorldObjectManager
@@ -88,7 +87,10 @@ class Session(BaseClientSession):
                             region,
                         )
                     region.circuit = ProxiedCircuit(
-                        near_addr, circuit_addr, transport, logging_hook=logging_hook)
+                        near_addr, circuit_addr, transport, logging_hook=logging_hook,
+                        batch_sends=self.session_manager.settings.BATCH_UDP_SENDS,
+                        coalesce_acks=self.session_manager.settings.COALESCE_ACKS,
+                    )
                     AddonManager.handle_circuit_created(self, region)
                     return True
                 if region.circuit and region.circuit.is_alive:
@@ -98,22 +100,10 @@ class Session(BaseClientSession):
         return False
 
     def resolve_cap(self, url: str) -> Optional[CapData]:
-        for cap_name, cap_url in self.global_caps.items():
-            if url.startswith(cap_url):
-                return CapData(
-                    cap_name, None, None, cap_url
-                )
-        for region in self.regions:
-            resolved_cap = region.resolve_cap(url)
-            if resolved_cap:
-                cap_name, base_url, cap_type = resolved_cap
-                # GetMesh and friends can't be tied to a specific session or region
-                # (at least on agni) unless we go through a proxy wrapper, since every
-                # region just points at the global asset CDN.
-                if is_asset_server_cap_name(cap_name) and cap_type != CapType.WRAPPER:
-                    return CapData(cap_name, None, None, base_url, cap_type)
-                return CapData(cap_name, ref(region), ref(self), base_url, cap_type)
-        return None
+        """Resolve a cap URL, ignoring caps that belong to other sessions"""
+        return self.session_manager.lookup_cap(
+            url, lambda cap_data: cap_data.session is None or cap_data.session() is self
+        )
 
 
 class SessionManager(BaseClientSessionManager):
@@ -122,15 +112,19 @@ class SessionManager(BaseClientSessionManager):
         self.settings: ProxySettings = settings
         self.sessions: List[Session] = []
         self.shutdown_signal = multiprocessing.Event()
-        self.flow_context = HTTPFlowContext()
+        self.flow_context = HTTPFlowContext(share_large_bodies=settings.SHARE_LARGE_HTTP_BODIES)
         self.asset_repo = HTTPAssetRepo()
         self.message_logger: Optional[BaseMessageLogger] = None
         self.addon_ctx: Dict[str, Dict[str, Any]] = collections.defaultdict(dict)
         self.name_cache = ProxyNameCache()
         self.pending_leap_clients: List[LEAPClient] = []
+        # Every cap URL across all sessions and regions, so we don't have to check each of them in turn
+        self.cap_url_index: CapsURLIndex[CapData] = CapsURLIndex()
 
     def create_session(self, login_data) -> Session:
         session = Session.from_login_data(login_data, self)
+        for cap_name, cap_url in session.global_caps.items():
+            self.cap_url_index.add(cap_url, CapData(cap_name, None, None, cap_url))
         self.name_cache.create_subscriptions(
             session.message_handler,
             session.http_message_handler,
@@ -161,14 +155,28 @@ class SessionManager(BaseClientSessionManager):
         session.objects.clear()
         if session.leap_client:
             session.leap_client.disconnect()
+        for cap_name, cap_url in session.global_caps.items():
+            self.cap_url_index.remove(cap_url, CapData(cap_name, None, None, cap_url))
+        for region in session.regions:
+            region.unindex_caps()
+            # Stop any pending resends, nothing should go out for this session anymore.
+            if region.circuit:
+                region.circuit.disconnect()
         self.sessions.remove(session)
 
-    def resolve_cap(self, url: str) -> Optional["CapData"]:
-        for session in self.sessions:
-            cap_data = session.resolve_cap(url)
-            if cap_data:
-                return cap_data
-        return CapData()
+    def resolve_cap(self, url: str) -> "CapData":
+        return self.lookup_cap(url) or CapData()
+
+    def lookup_cap(self, url: str, predicate: Optional[Callable[[CapData], bool]] = None) -> Optional[CapData]:
+        cap_data = self.cap_url_index.lookup(url, predicate)
+        if cap_data is None:
+            return None
+        if cap_data.type == CapType.TEMPORARY:
+            # Let the region consume the temporary cap, it'll drop it from the index.
+            region = cap_data.region and cap_data.region()
+            if region:
+                region.resolve_cap(url)
+        return cap_data
 
     async def leap_client_connected(self, leap_client: LEAPClient):
         self.pending_leap_clients.append(leap_client)
@@ -36,3 +36,8 @@ class ProxySettings(Settings):
     ADDON_SCRIPTS: List[str] = SettingDescriptor(list)
     FILTERS: Dict[str, str] = SettingDescriptor(dict)
     SSL_INSECURE: bool = SettingDescriptor(False)
+    # Whether large HTTP bodies should be handed over from mitmproxy's process through
+    # shared memory rather than being pickled along with the rest of the flow
+    SHARE_LARGE_HTTP_BODIES: bool = SettingDescriptor(False)
+    # Whether to periodically check if the message templates module changed and reload it
+    HOT_RELOAD_TEMPLATES: bool = SettingDescriptor(True)
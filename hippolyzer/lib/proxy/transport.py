@@ -1,5 +1,6 @@
 import socket
 import struct
+from typing import *
 
 from hippolyzer.lib.base.network.transport import SocketUDPTransport, UDPPacket
 
@@ -18,3 +19,9 @@ class SOCKS5UDPTransport(SocketUDPTransport):
 
     def send_packet(self, packet: UDPPacket) -> None:
         self.transport.sendto(self.serialize(packet), packet.dst_addr)
+
+    def send_packets(self, packets: Sequence[UDPPacket]) -> None:
+        sendto = self.transport.sendto
+        serialize = self.serialize
+        for packet in packets:
+            sendto(serialize(packet), packet.dst_addr)
@@ -18,6 +18,7 @@ You should have received a copy of the GNU Lesser General Public License
 along with this program; if not, write to the Free Software Foundation,
 Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import datetime
 import pickle
 import unittest
 import uuid
@@ -152,6 +153,34 @@ class TestDatatypes(unittest.TestCase):
     def test_str_llsd_serialization(self):
         self.assertEqual(b"'foo\\nbar'", llsd.format_notation("foo\nbar"))
 
+    def test_fast_notation_parsing(self):
+        cases = (
+            llsd.format_notation({
+                "foo": [1, 1.5, "bar'\n\\baz", None, True, False, {}, []],
+                "id": UUID.random(),
+                "date": datetime.datetime(2020, 1, 2, 3, 4, 5),
+                "bin": llsd.binary(b"\x00\xff"),
+                "uni": "ünï",
+            }),
+            b"{'a':i-1,'b':s(3)\"abc\",'c':b(2)\"xy\",'d':b16\"FF00\",'t':T,'f':false,'x':'\\x41\\q'}",
+            b'[r1e5, r-2.5,i3 ,l"http://example.com/", "double \\"quoted\\""]',
+        )
+        for case in cases:
+            expected = llsd.parse_notation(case)
+            val = llsd.parse_notation_fast(case)
+            self.assertEqual(expected, val)
+            self.assertEqual(repr(expected), repr(val))
+
+        for bad in (b"{'a'i1}", b"[i1", b"x", b"'unterminated"):
+            with self.assertRaises(llsd.LLSDParseError):
+                llsd.parse_notation_fast(bad)
+
+    def test_binary_parse_many(self):
+        vals = [{"foo": 1}, [UUID.random()], "bar"]
+        data = b"\n".join(llsd.format_binary(x, with_header=False) for x in vals)
+        self.assertEqual(vals, list(llsd.HippoLLSDBinaryParser().parse_many(data)))
+        self.assertEqual(vals[:1], list(llsd.HippoLLSDBinaryParser().parse_many(llsd.format_binary(vals[0]))))
+
     def test_int_enum_llsd_serialization(self):
         class SomeIntEnum(IntEnum):
             FOO = 4
@@ -3,7 +3,7 @@ import datetime as dt
 import unittest
 
 from hippolyzer.lib.base.datatypes import *
-from hippolyzer.lib.base.inventory import InventoryModel, SaleType, InventoryItem
+from hippolyzer.lib.base.inventory import InventoryModel, SaleType, InventoryItem, InventoryCategory
 from hippolyzer.lib.base.message.message import Block, Message
 from hippolyzer.lib.base.wearables import Wearable, VISUAL_PARAMS
 
@@ -153,6 +153,45 @@ class TestLegacyInv(unittest.TestCase):
         self.assertEqual(self.model, item.model)
         self.assertEqual(1, len(self.model.root.children))
 
+    def test_children_index_tracks_moves(self):
+        root = self.model.root
+        item = root.children[0]
+        subcat = root.get_or_create_subcategory("Sub")
+        self.assertEqual((item, subcat), root.children)
+        item.parent_id = subcat.node_id
+        self.assertEqual((subcat,), root.children)
+        self.assertEqual((item,), subcat.children)
+        self.assertEqual([subcat, item], root.descendents)
+        # Updating through the model should move it too
+        item_copy = copy.copy(item)
+        item_copy.parent_id = root.node_id
+        self.assertEqual((item,), subcat.children)
+        self.model.update(item_copy, update_fields={"parent_id"})
+        self.assertEqual((subcat, item), root.children)
+        self.assertEqual((), subcat.children)
+        self.assertEqual([root, subcat, item], root.unlink())
+        self.assertEqual((), self.model.get_children(root.node_id))
+
+    def test_kind_indices_track_changes(self):
+        root = self.model.root
+        item = root.children[0]
+        self.assertEqual((), self.model.dirty_categories)
+        subcat = root.get_or_create_subcategory("Sub")
+        self.assertEqual((root, subcat), self.model.all_containers)
+        self.assertEqual((item,), self.model.all_items)
+        subcat.version = InventoryCategory.VERSION_NONE
+        self.assertEqual((subcat,), self.model.dirty_categories)
+        # Updating through the model should be reflected too
+        subcat_copy = copy.copy(subcat)
+        subcat_copy.version = 2
+        self.assertEqual((subcat,), self.model.dirty_categories)
+        self.model.update(subcat_copy)
+        self.assertEqual((), self.model.dirty_categories)
+        subcat.version = InventoryCategory.VERSION_NONE
+        self.model.unlink(subcat)
+        self.assertEqual((), self.model.dirty_categories)
+        self.assertEqual((root,), self.model.all_containers)
+
     def test_eq_excludes_model(self):
         item = tuple(self.model.ordered_nodes)[1]
         item_copy = copy.copy(item)
@@ -22,9 +22,11 @@ import asyncio
 import copy
 import pickle
 import unittest
+import unittest.mock
 import weakref
 from uuid import UUID
 
+from hippolyzer.lib.base.datatypes import Vector3
 from hippolyzer.lib.base.message.message import Message, Block
 from hippolyzer.lib.base.message.message_formatting import HumanMessageSerializer
 from hippolyzer.lib.base.message.message_handler import MessageHandler
@@ -62,6 +64,53 @@ class TestMessage(unittest.TestCase):
         assert msg.blocks['CircuitCode'][0].vars['Code'] == 531, \
             "Incorrect data in block Code"
 
+    def test_build_no_template_reload_check(self):
+        # Checking for template changes means a syscall, shouldn't happen per-message
+        with unittest.mock.patch("os.stat") as stat_mock:
+            Message('TestPacket', Block('CircuitCode', ID=1234, Code=531))
+            self.deserial.deserialize(self.serial.serialize(self.chat_msg))
+        stat_mock.assert_not_called()
+
+    def test_take_parsed(self):
+        msg = Message('TestPacket', Block('CircuitCode', ID=1234, Code=531, Pos=Vector3(1, 2, 3)), packet_id=5)
+        msg.meta["foo"] = [1]
+        taken = msg.take()
+        self.assertTrue(msg.queued)
+        self.assertEqual(msg, taken)
+        self.assertIsNone(taken.packet_id)
+        taken["CircuitCode"]["ID"] = 1
+        taken["CircuitCode"]["Pos"].X = 5.0
+        taken.meta["foo"].append(2)
+        taken.add_block(Block('CircuitCode', ID=5, Code=5))
+        self.assertEqual(1234, msg["CircuitCode"]["ID"])
+        self.assertEqual(Vector3(1, 2, 3), msg["CircuitCode"]["Pos"])
+        self.assertEqual([1], msg.meta["foo"])
+        self.assertEqual(1, len(msg["CircuitCode"]))
+
+    def test_take_unparsed(self):
+        msg = self.deserial.deserialize(self.serial.serialize(self.chat_msg))
+        taken = msg.take()
+        # Shouldn't have needed to parse either of them
+        self.assertIsNotNone(msg.raw_body)
+        self.assertIsNotNone(taken.raw_body)
+        self.assertEqual(self.chat_msg, taken)
+        taken["ChatData"]["Channel"] = 2
+        self.assertEqual(0, msg["ChatData"]["Channel"])
+
+    def test_take_subclass(self):
+        class SlottedMessage(Message):
+            __slots__ = ("extra_info",)
+
+        msg = SlottedMessage('TestPacket', Block('CircuitCode', ID=1234, Code=531), packet_id=5)
+        msg.extra_info = "foo"
+        msg.sender = ("127.0.0.1", 1)
+        taken = msg.take()
+        self.assertIsInstance(taken, SlottedMessage)
+        self.assertEqual("foo", taken.extra_info)
+        # Base class slots should still get copied
+        self.assertEqual(("127.0.0.1", 1), taken.sender)
+        self.assertEqual(1234, taken["CircuitCode"]["ID"])
+
     def test_build_multiple(self):
         msg = Message('TestPacket',
                       Block('CircuitCode', ID=1234, Code=789),
@@ -20,6 +20,8 @@ Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 import logging
+import random
+import timeit
 import unittest
 import binascii
 
@@ -121,3 +123,119 @@ class TestPacketDecode(unittest.TestCase):
         logging.debug("Parsed blocks: %r " % (list(parsed.blocks.keys()),))
         self.assertEqual("UnknownMessage:240", parsed.name)
         self.assertEqual(message, serializer.serialize(parsed))
+
+    def test_compiled_decoder_matches(self):
+        compiled_settings = Settings()
+        compiled_settings.ENABLE_DEFERRED_PACKET_PARSING = False
+        compiled_settings.ENABLE_COMPILED_MESSAGE_DECODERS = True
+        deserializer = UDPMessageDeserializer(settings=self.settings)
+        compiled_deserializer = UDPMessageDeserializer(settings=compiled_settings)
+        for message in (AGENT_DATA_UPDATE, AGENT_ANIMATION, OBJECT_UPDATE, COARSE_LOCATION_UPDATE):
+            expected = deserializer.deserialize(message)
+            parsed = compiled_deserializer.deserialize(message)
+            self.assertEqual(expected, parsed)
+            # Types of the values should match exactly too, not just compare equal
+            self.assertEqual(repr(expected), repr(parsed))
+
+
+def _reference_zero_code_expand(msg_buf: bytes):
+    # The original byte-at-a-time implementation, used to check the fast one
+    decode_buf = bytearray()
+    in_zero = False
+    for c in msg_buf:
+        if len(decode_buf) > 0x3000:
+            raise ValueError("Unreasonably large zerocoded message")
+
+        if c == 0x00:
+            decode_buf.append(0x00)
+            if in_zero:
+                decode_buf.extend(b"\x00" * 255)
+            in_zero = True
+        else:
+            if in_zero:
+                decode_buf.extend(b"\x00" * (c - 1))
+                in_zero = False
+            else:
+                decode_buf.append(c)
+    return decode_buf
+
+
+def _reference_zero_code_compress(data: bytes):
+    compressed_buff = bytearray()
+    zero_count = 0
+
+    def _terminate_zeros():
+        nonlocal zero_count
+        if zero_count:
+            compressed_buff.append(zero_count)
+            zero_count = 0
+
+    for char in data:
+        if char == 0x00:
+            zero_count += 1
+            if zero_count == 1:
+                compressed_buff.append(0x00)
+            elif zero_count == 255:
+                _terminate_zeros()
+        else:
+            _terminate_zeros()
+            compressed_buff.append(char)
+    _terminate_zeros()
+    return compressed_buff
+
+
+class TestZeroCoding(unittest.TestCase):
+    def setUp(self):
+        # Snip off the packet header, the body is what gets zerocoded
+        self.payload = OBJECT_UPDATE[6:]
+        self.expanded = UDPMessageDeserializer.zero_code_expand(self.payload)
+
+    def _assert_same_expansion(self, val: bytes):
+        try:
+            expected = _reference_zero_code_expand(val)
+        except ValueError:
+            with self.assertRaises(ValueError):
+                UDPMessageDeserializer.zero_code_expand(val)
+            return
+        self.assertEqual(expected, UDPMessageDeserializer.zero_code_expand(val), val)
+
+    def test_object_update_roundtrips(self):
+        self.assertEqual(_reference_zero_code_expand(self.payload), self.expanded)
+        self.assertEqual(self.payload, UDPMessageSerializer.zero_code_compress(self.expanded))
+
+    def test_matches_reference(self):
+        rand = random.Random(1234)
+        for _ in range(2000):
+            val = bytes(rand.choice((0, 0, 0, 1, 2, 0xFF, rand.randrange(256))) for _ in range(rand.randrange(20)))
+            self._assert_same_expansion(val)
+            self.assertEqual(_reference_zero_code_compress(val), UDPMessageSerializer.zero_code_compress(val))
+
+    def test_expansion_guard(self):
+        cases = (
+            # Expands to just under the limit, then a trailing byte is allowed to push past it
+            b"\x00" * 48 + b"\x01",
+            b"\x00" * 48 + b"\xff",
+            b"\x00" * 48 + b"\xff\x01",
+            b"\x00" * 48 + b"\xff\x00\xff",
+            b"\x00" * 49,
+            b"\x00" * 50,
+            b"\x00" * 49 + b"\x01\x02",
+            b"\x01" * 0x3000 + b"\x02\x03",
+            b"\x01" * 0x3001 + b"\x02",
+            b"\x01" * 0x3002 + b"\x02",
+        )
+        for case in cases:
+            self._assert_same_expansion(case)
+
+    def test_zero_coding_benchmark(self):
+        # Just logs the timings for comparison against the byte-at-a-time loops,
+        # wall-clock timings are too noisy to assert on.
+        def _time(func, val):
+            return min(timeit.repeat(lambda: func(val), number=500, repeat=5))
+
+        expand_time = _time(UDPMessageDeserializer.zero_code_expand, self.payload)
+        reference_expand_time = _time(_reference_zero_code_expand, self.payload)
+        compress_time = _time(UDPMessageSerializer.zero_code_compress, self.expanded)
+        reference_compress_time = _time(_reference_zero_code_compress, self.expanded)
+        logging.info(f"zero_code_expand: {expand_time:.5f}s vs {reference_expand_time:.5f}s, "
+                     f"zero_code_compress: {compress_time:.5f}s vs {reference_compress_time:.5f}s")
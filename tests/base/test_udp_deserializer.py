@@ -89,3 +89,22 @@ class TestDeserializer(unittest.TestCase):
         position = TemplateDataPacker.unpack(unhexlify(hex_string)[16:16 + 12], MsgType.MVT_LLVector3)
         self.assertEqual(position, (128.00155639648438, 127.99840545654297, 28.399967193603516))
         self.assertIsInstance(position, Vector3)
+
+    def test_compiled_decoder(self):
+        self.settings.ENABLE_COMPILED_MESSAGE_DECODERS = True
+        msg = Message(
+            'EnableSimulator',
+            Block('SimulatorInfo', Handle=123456789, IP="127.0.0.1", Port=12043),
+        )
+        packet = self.deserializer.deserialize(UDPMessageSerializer().serialize(msg))
+        self.assertEqual(msg, packet)
+        self.assertEqual(packet["SimulatorInfo"]["Port"], 12043)
+
+    def test_compiled_decoder_truncated(self):
+        self.settings.ENABLE_COMPILED_MESSAGE_DECODERS = True
+        msg = Message('ChatFromViewer',
+                      Block('AgentData', AgentID=UUID(int=1), SessionID=UUID(int=2)),
+                      Block('ChatData', Message='Hi', Type=1, Channel=0))
+        packed_data = UDPMessageSerializer().serialize(msg)
+        with self.assertRaises(ValueError):
+            self.deserializer.deserialize(packed_data[:-2])
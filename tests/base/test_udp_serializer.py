@@ -23,11 +23,14 @@ Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 import unittest
 
 from hippolyzer.lib.base.datatypes import *
+from hippolyzer.lib.base.message.compiled_template import CompiledBlockEncoder, CompiledTemplateEncoder
+from hippolyzer.lib.base.message.message import Block, Message
 from hippolyzer.lib.base.message.msgtypes import MsgType
 from hippolyzer.lib.base.settings import Settings
 from hippolyzer.lib.base.message.udpdeserializer import UDPMessageDeserializer
 from hippolyzer.lib.base.message.udpserializer import UDPMessageSerializer
 from hippolyzer.lib.base.message.data_packer import TemplateDataPacker
+from hippolyzer.lib.base.serialization import BufferWriter
 
 
 class TestSerializer(unittest.TestCase):
@@ -107,3 +110,36 @@ class TestSerializer(unittest.TestCase):
         val = b"\x01" + (b"\x00" * 255 * 2) + b"\x00\x00\x01"
         compressed = self.serializer.zero_code_compress(val)
         self.assertEqual(b"\x01\x00\xFF\x00\xFF\x00\x02\x01", compressed)
+
+    def test_compiled_encoder_matches(self):
+        msg = Message(
+            'EnableSimulator',
+            Block('SimulatorInfo', Handle=123456789, IP="127.0.0.1", Port=12043),
+        )
+        current_template = self.serializer.template_dict[msg.name]
+        expected = BufferWriter("<")
+        for block in msg["SimulatorInfo"]:
+            for tmpl_var in current_template.get_block("SimulatorInfo").variables:
+                expected.write_bytes(TemplateDataPacker.pack(block[tmpl_var.name], tmpl_var.type))
+        encoder = CompiledTemplateEncoder.for_template(current_template)
+        writer = BufferWriter("<")
+        self.assertTrue(encoder.blocks["SimulatorInfo"].encode(writer, msg["SimulatorInfo"]))
+        self.assertEqual(expected.buffer, writer.buffer)
+
+    def test_compiled_encoder_falls_back(self):
+        template_block = self.serializer.template_dict["ChatFromViewer"].get_block("ChatData")
+        encoder = CompiledBlockEncoder(template_block)
+        writer = BufferWriter("<")
+        blocks = [
+            Block("ChatData", Message="foo", Type=1, Channel=RawBytes(b"\x00" * 4)),
+            Block("ChatData", Message="foo", Type=1, fill_missing=True),
+            Block("ChatData", Message="foo", Type=1, Channel="bad"),
+        ]
+        for block in blocks:
+            self.assertFalse(encoder.encode(writer, [block]))
+        # Nothing should have been written if we couldn't use the compiled encoder
+        self.assertEqual(b"", writer.buffer)
+
+        msg = Message("ChatFromViewer", Block("AgentData", AgentID=UUID(), SessionID=UUID()), blocks[0])
+        parsed = self.deserializer.deserialize(self.serializer.serialize(msg))
+        self.assertEqual(0, parsed["ChatData"]["Channel"])
@@ -1,6 +1,14 @@
+import dataclasses
+import datetime as dt
+import gzip
+import tempfile
 import unittest
+from pathlib import Path
 
+from hippolyzer.lib.base import llsd
 from hippolyzer.lib.base.datatypes import UUID
+from hippolyzer.lib.base.inventory import InventoryCategory, InventoryItem, InventoryPermissions, InventorySaleInfo
+from hippolyzer.lib.base.templates import AssetType, FolderType, InventoryType, SaleType
 from hippolyzer.lib.client.inventory_manager import InventoryManager
 from tests.client import MockClientRegion
 
@@ -59,3 +67,207 @@ class TestParcelOverlay(unittest.IsolatedAsyncioTestCase):
         self.inv_manager.process_aisv3_response(CREATE_FOLDER_PAYLOAD)
         self.assertIsNotNone(self.model.get_category(UUID(int=1)))
         self.assertIsNotNone(self.model.get_category(UUID(int=2)))
+
+    def _make_cache_nodes(self):
+        cat = InventoryCategory(
+            cat_id=UUID(int=1),
+            parent_id=UUID.ZERO,
+            type=AssetType.CATEGORY,
+            pref_type=FolderType.ROOT_INVENTORY,
+            name="My 'Inventory'",
+            owner_id=UUID(int=9),
+            version=27,
+        )
+        item = InventoryItem(
+            item_id=UUID(int=3),
+            parent_id=UUID(int=1),
+            permissions=InventoryPermissions(
+                base_mask=0x7fffffff,
+                owner_mask=0x7fffffff,
+                group_mask=0,
+                everyone_mask=0,
+                next_owner_mask=0x82000,
+                creator_id=UUID(int=9),
+                owner_id=UUID(int=9),
+                last_owner_id=UUID(int=9),
+                group_id=UUID.ZERO,
+            ),
+            asset_id=UUID(int=4),
+            type=AssetType.NOTECARD,
+            inv_type=InventoryType.NOTECARD,
+            flags=0x80000000,
+            sale_info=InventorySaleInfo(sale_type=SaleType.NOT, sale_price=10),
+            name="Some\nNotecard",
+            desc="ünïcode",
+            metadata={"experience": UUID(int=5)},
+        )
+        return cat, item
+
+    def _write_cache(self, path: Path, data: bytes):
+        with gzip.open(path, "wb") as f:
+            f.write(data)
+
+    def test_parse_cache(self):
+        cat, item = self._make_cache_nodes()
+        header = {"inv_cache_version": 3}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            notation_path = Path(tmp_dir) / "notation.inv.llsd.gz"
+            self._write_cache(notation_path, b"".join(
+                llsd.format_notation(x) + b"\n" for x in (header, cat.to_llsd(), item.to_llsd())
+            ))
+            binary_path = Path(tmp_dir) / "binary.inv.llsd.gz"
+            self._write_cache(binary_path, b"".join(
+                llsd.format_binary(x, with_header=False) for x in (header, cat.to_llsd(), item.to_llsd())
+            ))
+            # Notation with whitespace after the opening brace shouldn't be mistaken for binary
+            spaced_path = Path(tmp_dir) / "spaced.inv.llsd.gz"
+            self._write_cache(spaced_path, b"{ 'inv_cache_version':i3}\n" + b"".join(
+                llsd.format_notation(x) + b"\n" for x in (cat.to_llsd(), item.to_llsd())
+            ))
+            for path in (notation_path, binary_path, spaced_path):
+                self.assertEqual(([cat], [item]), self.inv_manager._parse_cache(path))
+
+    def test_parse_cache_empty(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "empty.inv.llsd.gz"
+            self._write_cache(path, b"")
+            self.assertEqual(([], []), self.inv_manager._parse_cache(path))
+
+    def test_parse_cache_bad_version(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "notation.inv.llsd.gz"
+            self._write_cache(path, llsd.format_notation({"inv_cache_version": 1}) + b"\n")
+            with self.assertRaises(ValueError):
+                self.inv_manager._parse_cache(path)
+
+    def test_parse_cache_workers(self):
+        cat, item = self._make_cache_nodes()
+        header = {"inv_cache_version": 3}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "notation.inv.llsd.gz"
+            self._write_cache(path, b"".join(
+                llsd.format_notation(x) + b"\n" for x in (header, cat.to_llsd(), item.to_llsd(), cat.to_llsd())
+            ))
+            self.assertEqual(
+                self.inv_manager._parse_cache(path),
+                self.inv_manager._parse_cache(path, parse_workers=2),
+            )
+
+    async def test_complete_inventory(self):
+        root_id, dirty_id, new_id = UUID(int=1), UUID(int=2), UUID(int=3)
+        for cat_id, parent_id in ((root_id, UUID.ZERO), (dirty_id, root_id)):
+            self.model.add(InventoryCategory(
+                cat_id=cat_id,
+                parent_id=parent_id,
+                name="Folder",
+                version=InventoryCategory.VERSION_NONE,
+                type=AssetType.CATEGORY,
+                pref_type=FolderType.NONE,
+                owner_id=UUID.ZERO,
+            ))
+        # Only found out about through the root folder's response
+        new_cats = {root_id: [{
+            "category_id": new_id,
+            "parent_id": root_id,
+            "name": "New Folder",
+            "version": 1,
+            "type_default": -1,
+            "agent_id": UUID.ZERO,
+        }]}
+        fetched_batches = []
+
+        async def _fake_fetch_folders(folders):
+            fetched_batches.append(list(folders))
+            return self.inv_manager.process_fetch_descendents_response({"folders": [
+                {"folder_id": folder_id, "version": 5, "categories": new_cats.get(folder_id, [])}
+                for folder_id in folders
+            ]})
+
+        self.inv_manager.fetch_folders = _fake_fetch_folders
+        self.assertEqual(3, await self.inv_manager.complete_inventory(batch_size=1))
+        self.assertEqual([[root_id], [dirty_id], [new_id]], fetched_batches)
+        self.assertFalse(any(self.model.dirty_categories))
+
+    def test_snapshot_round_trip(self):
+        cat, item = self._make_cache_nodes()
+        stale_cat = InventoryCategory(
+            cat_id=UUID(int=2),
+            parent_id=cat.cat_id,
+            type=AssetType.CATEGORY,
+            pref_type=FolderType.NONE,
+            name="Stale",
+            owner_id=UUID(int=9),
+            version=3,
+        )
+        stale_item = dataclasses.replace(item, item_id=UUID(int=6), parent_id=stale_cat.cat_id)
+        for node in (cat, stale_cat, item, stale_item):
+            self.model.add(node)
+
+        self.session.login_data = {"inventory-skeleton": [
+            {"folder_id": str(cat.cat_id), "parent_id": str(UUID.ZERO), "name": cat.name,
+             "type_default": FolderType.ROOT_INVENTORY, "version": cat.version},
+            # Changed since the snapshot was taken
+            {"folder_id": str(stale_cat.cat_id), "parent_id": str(cat.cat_id), "name": stale_cat.name,
+             "type_default": FolderType.NONE, "version": stale_cat.version + 1},
+        ]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "inv.snapshot"
+            self.inv_manager.save_snapshot(path)
+            new_manager = InventoryManager(self.session)
+            new_manager.load_snapshot(path)
+        new_model = new_manager.model
+        self.assertEqual(cat, new_model.get_category(cat.cat_id))
+        self.assertEqual(item, new_model.get_item(item.item_id))
+        self.assertEqual({stale_cat.cat_id, item.item_id}, {x.node_id for x in new_model[cat.cat_id].children})
+        self.assertEqual((new_model.get_category(stale_cat.cat_id),), tuple(new_model.dirty_categories))
+        self.assertIsNone(new_model.get(stale_item.item_id))
+
+    def test_snapshot_optional_fields(self):
+        cat, item = self._make_cache_nodes()
+        cat.metadata = {"foo": 1}
+        cat.owner_id = None
+        other_item = InventoryItem(
+            item_id=UUID(int=6),
+            parent_id=cat.cat_id,
+            permissions=dataclasses.replace(item.permissions, base_mask=-1, is_owner_group=0),
+            shadow_id=UUID(int=7),
+            name=item.name,
+            thumbnail={"asset_id": UUID(int=8)},
+            creation_date=dt.datetime(2024, 1, 2, tzinfo=dt.timezone.utc),
+        )
+        for node in (cat, item, other_item):
+            self.model.add(node)
+        self.session.login_data = {"inventory-skeleton": [
+            {"folder_id": str(cat.cat_id), "parent_id": str(UUID.ZERO), "name": cat.name,
+             "type_default": FolderType.ROOT_INVENTORY, "version": cat.version},
+        ]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "inv.snapshot"
+            self.inv_manager.save_snapshot(path)
+            new_manager = InventoryManager(self.session)
+            new_manager.load_snapshot(path)
+        new_model = new_manager.model
+        self.assertEqual(cat, new_model.get_category(cat.cat_id))
+        self.assertEqual(item, new_model.get_item(item.item_id))
+        # S32 masks from LLSD come back as U32s
+        other_item.permissions.base_mask = 0xFFffFFff
+        self.assertEqual(other_item, new_model.get_item(other_item.item_id))
+
+    def test_snapshot_wrong_agent(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "inv.snapshot"
+            self.inv_manager.save_snapshot(path)
+            self.session.agent_id = UUID(int=1)
+            with self.assertRaises(ValueError):
+                self.inv_manager.load_snapshot(path)
+
+    def test_snapshot_corrupt(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "inv.snapshot"
+            self.model.add(self._make_cache_nodes()[0])
+            self.inv_manager.save_snapshot(path)
+            snapshot = path.read_bytes()
+            for bad_snapshot in (b"", snapshot[:-1], snapshot + b"\0", b"X" + snapshot[1:]):
+                path.write_bytes(bad_snapshot)
+                with self.assertRaises(ValueError):
+                    self.inv_manager.load_snapshot(path)
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import gc
 import math
 import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
 from urllib.parse import urlparse
 
 import aioresponses
@@ -11,12 +13,16 @@ from mitmproxy.http import HTTPFlow, Headers
 from yarl import URL
 
 from hippolyzer.apps.proxy import run_http_proxy_process
+from hippolyzer.lib.base import llsd
 from hippolyzer.lib.base.datatypes import Vector3
 from hippolyzer.lib.base.helpers import create_logged_task
+from hippolyzer.lib.base.multiprocessing_utils import wait_for_queue
 from hippolyzer.lib.proxy.addon_utils import BaseAddon
 from hippolyzer.lib.proxy.addons import AddonManager
-from hippolyzer.lib.proxy.http_event_manager import MITMProxyEventManager
+from hippolyzer.lib.proxy.http_event_manager import MITMProxyEventManager, _llsd_strictly_equal
 from hippolyzer.lib.proxy.http_flow import HippoHTTPFlow
+from hippolyzer.lib.proxy.http_proxy import IPCInterceptionAddon, SHARED_BODY_MIN_SIZE, share_flow_bodies, \
+    load_shared_flow_bodies
 from hippolyzer.lib.proxy.caps import SerializedCapData
 from hippolyzer.lib.proxy.sessions import SessionManager
 from hippolyzer.lib.proxy.test_utils import BaseProxyTest
@@ -71,6 +77,161 @@ class HTTPIntegrationTests(BaseProxyTest):
         # The response sent back to mitmproxy should have been our modified version
         self.assertEqual(True, mitm_flow.metadata["touched_addon"])
 
+    async def test_http_flow_wakes_waiting_pump(self):
+        # Start waiting on an empty queue, putting the flow should be what wakes the
+        # waiter up, rather than it timing out.
+        wait_task = create_logged_task(
+            wait_for_queue(self.flow_context.from_proxy_queue, timeout=10.0), "Wait for queue"
+        )
+        await asyncio.sleep(0.01)
+        fake_flow = tflow.tflow(req=tutils.treq(host="example.com"))
+        fake_flow.metadata["cap_data_ser"] = SerializedCapData()
+        self.flow_context.from_proxy_queue.put(("request", fake_flow.get_state()), True)
+        self.assertTrue(await wait_task)
+        await self.http_event_manager.pump_proxy_event()
+        flow_state = self.flow_context.to_proxy_queue.get(True, 1.0)[2]
+        mitm_flow: HTTPFlow = HTTPFlow.from_state(flow_state)
+        self.assertEqual(True, mitm_flow.metadata["touched_addon"])
+
+    async def test_http_flow_shared_bodies(self):
+        body = b"a" * SHARED_BODY_MIN_SIZE
+        fake_flow = tflow.tflow(req=tutils.treq(host="example.com"), resp=tutils.tresp(content=body))
+        fake_flow.metadata["cap_data_ser"] = SerializedCapData()
+        flow_state = fake_flow.get_state()
+        segments = share_flow_bodies(flow_state)
+        self.assertEqual(1, len(segments))
+        self.assertIsNone(flow_state["response"]["content"])
+        self.flow_context.from_proxy_queue.put(("response", flow_state), True)
+        await self._pump_one_event()
+        for shm in segments:
+            shm.close()
+        # The main process should have freed the segment once it pulled the body out
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=segments[0].name)
+
+        flow_state = self.flow_context.to_proxy_queue.get(True)[2]
+        # Nothing touched the bodies, so they shouldn't have been sent back
+        self.assertEqual(["request", "response"], flow_state["metadata"]["elided_bodies"])
+        self.assertIsNone(flow_state["response"]["content"])
+        IPCInterceptionAddon._restore_elided_bodies(fake_flow, flow_state)
+        mitm_flow: HTTPFlow = HTTPFlow.from_state(flow_state)
+        self.assertEqual(body, mitm_flow.response.content)
+        self.assertEqual(True, mitm_flow.metadata["touched_addon"])
+
+    async def test_http_flow_shared_bodies_freed_by_creator(self):
+        addon = IPCInterceptionAddon(self.flow_context)
+        body = b"a" * SHARED_BODY_MIN_SIZE
+        fake_flow = tflow.tflow(req=tutils.treq(host="example.com"), resp=tutils.tresp(content=body))
+        segments = share_flow_bodies(fake_flow.get_state())
+        addon.shared_segments[fake_flow.id] = segments
+        # Nothing ever loaded the bodies, the creator still needs to get rid of them
+        addon._free_shared_segments(fake_flow.id)
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=segments[0].name)
+        # Freeing the same flow again shouldn't be a problem
+        addon.shared_segments[fake_flow.id] = segments
+        addon._free_shared_segments(fake_flow.id)
+
+    async def test_http_flow_shared_bodies_freed_with_flow(self):
+        self.flow_context.share_large_bodies = True
+        addon = IPCInterceptionAddon(self.flow_context)
+        body = b"a" * SHARED_BODY_MIN_SIZE
+        errored_flow = tflow.tflow(req=tutils.treq(host="example.com"), resp=tutils.tresp(content=body))
+        addon.response(errored_flow)
+        flow_state = self.flow_context.from_proxy_queue.get(True, 1.0)[1]
+        # Client aborted the request, nothing is going to resume this
+        addon.error(errored_flow)
+        self.assertNotIn(errored_flow.id, addon.shared_segments)
+        # Loading a body that's already been freed should leave it out rather than blowing up
+        load_shared_flow_bodies(flow_state)
+        self.assertIsNone(flow_state["response"]["content"])
+
+        dropped_flow = tflow.tflow(req=tutils.treq(host="example.com"), resp=tutils.tresp(content=body))
+        addon.response(dropped_flow)
+        flow_state = self.flow_context.from_proxy_queue.get(True, 1.0)[1]
+        self.assertIn(dropped_flow.id, addon.shared_segments)
+        # mitmproxy let go of the flow without it ever being resumed
+        dropped_flow_id = dropped_flow.id
+        del dropped_flow
+        gc.collect()
+        self.assertNotIn(dropped_flow_id, addon.shared_segments)
+        load_shared_flow_bodies(flow_state)
+
+    async def test_http_flow_changed_body_sent_back(self):
+        class BodyChangingAddon(BaseAddon):
+            def handle_http_response(self, session_manager: SessionManager, flow: HippoHTTPFlow):
+                flow.response.content = b"changed"
+
+        AddonManager.init([], self.session_manager, [BodyChangingAddon()])
+        fake_flow = tflow.tflow(req=tutils.treq(host="example.com"), resp=tutils.tresp())
+        fake_flow.metadata["cap_data_ser"] = SerializedCapData()
+        self.flow_context.from_proxy_queue.put(("response", fake_flow.get_state()), True)
+        await self._pump_one_event()
+        flow_state = self.flow_context.to_proxy_queue.get(True)[2]
+        self.assertEqual(["request"], flow_state["metadata"]["elided_bodies"])
+        self.assertEqual(b"changed", flow_state["response"]["content"])
+
+    async def _pump_eq_response(self, eq_body: bytes) -> HTTPFlow:
+        self.session.main_region.update_caps({"EventQueueGet": "http://eq.example.com/"})
+        fake_flow = tflow.tflow(
+            req=tutils.treq(host="eq.example.com", path="/", content=llsd.format_xml({"ack": 1, "done": False})),
+            resp=tutils.tresp(content=eq_body),
+        )
+        fake_flow.metadata["cap_data_ser"] = SerializedCapData(
+            "EventQueueGet",
+            region_addr=str(self.session.main_region.circuit_addr),
+            session_id=str(self.session.id),
+        )
+        fake_flow.metadata["from_browser"] = False
+        self.flow_context.from_proxy_queue.put(("response", fake_flow.get_state()), True)
+        await self._pump_one_event()
+        flow_state = self.flow_context.to_proxy_queue.get(True)[2]
+        IPCInterceptionAddon._restore_elided_bodies(fake_flow, flow_state)
+        return HTTPFlow.from_state(flow_state)
+
+    async def test_eq_response_passed_through(self):
+        eq_body = llsd.format_xml({"id": 1, "events": [
+            {"message": "FakeEvent", "body": {"Foo": [{"Bar": 1}]}},
+        ]}) + b"\n"
+        mitm_flow = await self._pump_eq_response(eq_body)
+        # Nothing changed, so the exact bytes we got should go to the client
+        self.assertEqual(eq_body, mitm_flow.response.content)
+        self.assertEqual(eq_body, self.session.main_region.eq_manager.get_cached_poll_response(1))
+
+    async def test_eq_response_reserialized_when_changed(self):
+        class EventDroppingAddon(BaseAddon):
+            def handle_eq_event(self, session, region, event: dict):
+                if event["message"] == "DropMe":
+                    return True
+                event["body"]["Foo"][0]["Bar"] = 2
+
+        AddonManager.init([], self.session_manager, [EventDroppingAddon()])
+        eq_body = llsd.format_xml({"id": 1, "events": [
+            {"message": "DropMe", "body": {"Foo": [{"Bar": 1}]}},
+            {"message": "FakeEvent", "body": {"Foo": [{"Bar": 1}]}},
+        ]})
+        mitm_flow = await self._pump_eq_response(eq_body)
+        self.assertEqual(
+            [{"message": "FakeEvent", "body": {"Foo": [{"Bar": 2}]}}],
+            llsd.parse_xml(mitm_flow.response.content)["events"],
+        )
+
+    async def test_eq_response_reserialized_when_type_changed(self):
+        class TypeChangingAddon(BaseAddon):
+            def handle_eq_event(self, session, region, event: dict):
+                # Compares equal to the original `1`, but serializes differently
+                event["body"]["Foo"][0]["Bar"] = 1.0
+
+        AddonManager.init([], self.session_manager, [TypeChangingAddon()])
+        eq_body = llsd.format_xml({"id": 1, "events": [
+            {"message": "FakeEvent", "body": {"Foo": [{"Bar": 1}]}},
+        ]})
+        mitm_flow = await self._pump_eq_response(eq_body)
+        self.assertNotEqual(eq_body, mitm_flow.response.content)
+        body = llsd.parse_xml(mitm_flow.response.content)["events"][0]["body"]["Foo"][0]
+        self.assertIs(float, type(body["Bar"]))
+        self.assertFalse(_llsd_strictly_equal([{"Baz": True}], [{"Baz": 1}]))
+
     async def test_firestorm_bridge_avatar_z_pos(self):
         # Simulate an avatar with a non-finite Z pos in a coarselocation
         self.session.main_region.objects.state.coarse_locations.update({
@@ -10,6 +10,7 @@ import lazy_object_proxy
 
 from hippolyzer.lib.base.datatypes import UUID
 from hippolyzer.lib.base.message.message import Block, Message
+from hippolyzer.lib.base.message.msgtypes import PacketFlags
 from hippolyzer.lib.base.message.udpdeserializer import UDPMessageDeserializer
 from hippolyzer.lib.base.objects import Object
 from hippolyzer.lib.proxy.addon_utils import BaseAddon
@@ -108,6 +109,16 @@ class LLUDPIntegrationTests(BaseProxyTest):
         # Packet got forwarded through
         self.assertEqual(len(self.transport.packets), 1)
 
+    async def test_close_stops_resends(self):
+        await self.test_session_claiming()
+        circuit = self.session.region_by_circuit_addr(self.region_addr).circuit
+        circuit.send_reliable(Message("ChatFromViewer", flags=PacketFlags.RELIABLE, direction=Direction.OUT))
+        self.assertIsNotNone(circuit._resend_handle)
+        self.protocol.close()
+        # Nothing should be trying to resend over the closed transport
+        self.assertIsNone(circuit._resend_handle)
+        self.assertFalse(circuit.is_alive)
+
     async def test_bad_session_unclaimed(self):
         # Need a UseCircuitCode to claim a pending session
         msg = Message(
@@ -1,6 +1,7 @@
 from mitmproxy.test import tflow, tutils
 
-from hippolyzer.lib.proxy.caps import CapType
+from hippolyzer.lib.base.datatypes import UUID
+from hippolyzer.lib.proxy.caps import CapType, CapsURLIndex
 from hippolyzer.lib.proxy.http_flow import HippoHTTPFlow
 from hippolyzer.lib.proxy.message_logger import HTTPMessageLogEntry
 from hippolyzer.lib.proxy.test_utils import BaseProxyTest
@@ -96,3 +97,83 @@ content-length: 33\r
         # The second temp cap with the same name should still be in there
         cap_data = self.session_manager.resolve_cap("http://not2.example.com")
         self.assertEqual(cap_data.cap_name, "TempExample")
+
+    async def test_cap_resolution_across_sessions(self):
+        second_session = self.session_manager.create_session({
+            "session_id": UUID.random(),
+            "secure_session_id": UUID.random(),
+            "agent_id": UUID.random(),
+            "circuit_code": 5678,
+            "sim_ip": "127.0.0.1",
+            "sim_port": 5,
+            "region_x": 0,
+            "region_y": 456,
+            "seed_capability": "https://test.localhost:4/foobar",
+            "map-server-url": "http://map.example.com/",
+        })
+        second_region = second_session.regions[0]
+        # Longest matching cap URL wins, even though the first session's Seed is a prefix
+        cap_data = self.session_manager.resolve_cap("https://test.localhost:4/foobar/baz")
+        self.assertEqual("Seed", cap_data.cap_name)
+        self.assertEqual(second_region, cap_data.region())
+        self.assertEqual(second_session, cap_data.session())
+        cap_data = self.session_manager.resolve_cap("https://test.localhost:4/foo/baz")
+        self.assertEqual(self.session, cap_data.session())
+        self.assertEqual("MapImageService", self.session_manager.resolve_cap("http://map.example.com/1.jpg").cap_name)
+        # Resolving through a session should skip over other sessions' caps
+        cap_data = self.session.resolve_cap("https://test.localhost:4/foobar/baz")
+        self.assertEqual("Seed", cap_data.cap_name)
+        self.assertEqual(self.session, cap_data.session())
+        self.assertEqual(second_session, second_session.resolve_cap("https://test.localhost:4/foobar/baz").session())
+        self.assertIsNone(second_session.resolve_cap("https://test.localhost:4/foo/baz"))
+        # Asset server caps don't belong to any session
+        cap_data = second_session.resolve_cap("http://assets.example.com/foo")
+        self.assertEqual("ViewerAsset", cap_data.cap_name)
+        self.assertIsNone(cap_data.session)
+
+        # Closing the session should drop all of its caps
+        self.session_manager.close_session(second_session)
+        cap_data = self.session_manager.resolve_cap("https://test.localhost:4/foobar/baz")
+        self.assertEqual(self.session, cap_data.session())
+        self.assertIsNone(self.session_manager.resolve_cap("http://map.example.com/1.jpg").cap_name)
+
+    def test_caps_url_index(self):
+        index = CapsURLIndex()
+        index.add("http://example.com/a", 1)
+        index.add("http://example.com/ab", 2)
+        index.add("http://example.com/abc/d", 3)
+        self.assertEqual(1, index.lookup("http://example.com/a/z"))
+        self.assertEqual(2, index.lookup("http://example.com/abc/e"))
+        self.assertEqual(3, index.lookup("http://example.com/abc/d?x=y"))
+        self.assertIsNone(index.lookup("http://example.com/"))
+        # Later registrations for the same URL shadow earlier ones until removed
+        index.add("http://example.com/a", 4)
+        self.assertEqual(4, index.lookup("http://example.com/a"))
+        index.remove("http://example.com/a", 4)
+        self.assertEqual(1, index.lookup("http://example.com/a"))
+        index.remove("http://example.com/ab", 2)
+        self.assertEqual(1, index.lookup("http://example.com/abc/e"))
+        self.assertEqual(2, len(index))
+        # Rejected values fall back to shorter matching cap URLs
+        index.add("http://example.com/a", 5)
+        self.assertEqual(5, index.lookup("http://example.com/abc/d", lambda x: x != 3))
+        self.assertEqual(1, index.lookup("http://example.com/abc/d", lambda x: x not in (3, 5)))
+        self.assertIsNone(index.lookup("http://example.com/abc/d", lambda x: False))
+        # Empty cap URLs match everything, but there's nothing to fall back to after them
+        index.add("", 6)
+        self.assertEqual(6, index.lookup("http://other.example.com/"))
+        self.assertIsNone(index.lookup("http://example.com/abc/d", lambda x: False))
+
+    async def test_region_cap_shadowing(self):
+        self.region.register_cap("TempExample", "http://example.com", CapType.TEMPORARY)
+        self.assertEqual(
+            ("TempExample", "http://example.com", CapType.TEMPORARY),
+            self.region.resolve_cap("http://example.com/foo", consume=False),
+        )
+        # Consuming the temporary cap should uncover the one it was shadowing
+        self.region.resolve_cap("http://example.com/foo")
+        self.assertEqual(
+            ("FakeCap", "http://example.com", CapType.NORMAL),
+            self.region.resolve_cap("http://example.com/foo"),
+        )
+        self.assertEqual("FakeCap", self.session_manager.resolve_cap("http://example.com/foo").cap_name)
@@ -1,9 +1,14 @@
+import asyncio
 import unittest
+import unittest.mock
 
+from hippolyzer.lib.base.datatypes import UUID
+from hippolyzer.lib.base.message.circuit import Circuit, MTU_BYTES
 from hippolyzer.lib.base.message.message import Block, Message
 from hippolyzer.lib.base.message.msgtypes import PacketFlags
 from hippolyzer.lib.proxy.circuit import ProxiedCircuit, InjectionTracker
 from hippolyzer.lib.base.network.transport import Direction
+from hippolyzer.lib.base.test_utils import MockTransport
 
 
 class MockedProxyCircuit(ProxiedCircuit):
@@ -74,6 +79,35 @@ class PacketIDTests(unittest.IsolatedAsyncioTestCase):
         # Make sure we're still able to get the original ID
         self.assertEqual(self.circuit.out_injections.get_original_id(15), 3)
 
+    async def test_original_id_with_later_injections(self):
+        self._send_message(Message('ChatFromViewer', packet_id=1))
+        self._send_message(Message('ChatFromViewer'))
+        self._send_message(Message('ChatFromViewer', packet_id=2))
+        self._send_message(Message('ChatFromViewer', packet_id=3))
+        self._send_message(Message('ChatFromViewer'))
+        # Mapping back to the original ID should still account for earlier injections
+        # when there are injections after the effective ID
+        self.assertEqual(self.circuit.out_injections.get_original_id(3), 2)
+        self.assertEqual(self.circuit.out_injections.get_original_id(4), 3)
+        self.assertEqual(self.circuit.out_injections.get_effective_id(4), 6)
+
+    def test_effective_ids_roundtrip(self):
+        tracker = InjectionTracker(0, maxlen=10)
+        orig_id = 0
+        injected = set()
+        for i in range(100):
+            if i % 3 == 0:
+                injected.add(tracker.gen_injectable_id())
+                continue
+            orig_id += 1
+            effective_id = tracker.get_effective_id(orig_id)
+            tracker.track_seen(effective_id)
+            self.assertNotIn(effective_id, injected)
+            self.assertEqual(orig_id, tracker.get_original_id(effective_id))
+        self.assertEqual(len(injected), 34)
+        self.assertEqual(10, sum(tracker.was_injected(x) for x in injected))
+        self.assertEqual(sorted(injected)[-10:], list(tracker.injections))
+
     async def test_inject_hole_in_sequence(self):
         self._send_message(Message('ChatFromViewer', packet_id=1))
         self._send_message(Message('ChatFromViewer'))
@@ -197,6 +231,7 @@ class PacketIDTests(unittest.IsolatedAsyncioTestCase):
             (1, "ChatFromViewer", Direction.OUT, False, ()),
             (3, "ChatFromViewer", Direction.OUT, False, ()),
         ])
+        self.assertEqual((2,), self.circuit.out_injections.dropped)
 
     async def test_dropped_proxied_message_acks_sent(self):
         self._send_message(Message('ChatFromViewer', packet_id=1))
@@ -220,6 +255,50 @@ class PacketIDTests(unittest.IsolatedAsyncioTestCase):
         # We injected an incoming packet, so "4" is really "3"
         self.assertEqual(self.circuit.sent_msgs[4]["Packets"][0]["ID"], 3)
 
+    async def test_dropped_proxied_message_acks_coalesced(self):
+        self.circuit.coalesce_acks = True
+        self._send_message(Message('ChatFromViewer', packet_id=1))
+        self._send_message(Message('ChatFromSimulator', packet_id=1), outgoing=False)
+        self.circuit.drop_message(Message('ChatFromViewer', packet_id=2, flags=PacketFlags.RELIABLE, acks=(1,)))
+        self.circuit.drop_message(Message('ChatFromViewer', packet_id=3, flags=PacketFlags.RELIABLE))
+        # The dropped message's embedded ACKs still have to go out immediately using
+        # its packet ID, but the ACKs for the dropped packets themselves are held onto.
+        self.assertSequenceEqual(self.circuit.sent_simple, [
+            (1, "ChatFromViewer", Direction.OUT, False, ()),
+            (1, "ChatFromSimulator", Direction.IN, False, ()),
+            (2, "PacketAck", Direction.OUT, True, ()),
+        ])
+        self.assertEqual([1], [b["ID"] for b in self.circuit.sent_msgs[2]["Packets"]])
+        # ACKs for the dropped packets should ride along on the next incoming message
+        self._send_message(Message('ChatFromSimulator', packet_id=2), outgoing=False)
+        self.circuit.drop_message(Message('ChatFromViewer', packet_id=4, flags=PacketFlags.RELIABLE))
+        self.assertSequenceEqual(self.circuit.sent_simple[3:], [
+            (2, "ChatFromSimulator", Direction.IN, False, (2, 3)),
+        ])
+        self.assertTrue(self.circuit.sent_msgs[-1].has_acks)
+        # Anything left over gets flushed together in a single PacketAck
+        self.circuit.flush_acks()
+        self.assertSequenceEqual(self.circuit.sent_simple[4:], [
+            (3, "PacketAck", Direction.IN, True, ()),
+        ])
+        self.assertEqual([4], [b["ID"] for b in self.circuit.sent_msgs[4]["Packets"]])
+
+    async def test_coalesced_acks_flushed_after_delay(self):
+        self.circuit.coalesce_acks = True
+        self.circuit.ack_flush_delay = 0.0
+        self.circuit.send_acks(list(range(300)), Direction.IN)
+        self.assertEqual([], self.circuit.sent_msgs)
+        await asyncio.sleep(0.001)
+        # Too many for one PacketAck, the first should be full and as many of the rest
+        # in the trailer as fit within the MTU.
+        self.assertEqual(2, len(self.circuit.sent_msgs))
+        ack_msg = self.circuit.sent_msgs[0]
+        self.assertEqual(list(range(255)), [b["ID"] for b in ack_msg["Packets"]])
+        self.assertEqual(tuple(range(255, 297)), ack_msg.acks)
+        ack_msg.send_flags |= PacketFlags.ACK
+        self.assertLessEqual(len(self.circuit.serializer.serialize(ack_msg)), MTU_BYTES)
+        self.assertEqual([297, 298, 299], [b["ID"] for b in self.circuit.sent_msgs[1]["Packets"]])
+
     async def test_resending_or_dropping(self):
         self.circuit.send(Message('ChatFromViewer', packet_id=1))
         to_drop = Message('ChatFromViewer', packet_id=2, flags=PacketFlags.RELIABLE)
@@ -265,6 +344,32 @@ class PacketIDTests(unittest.IsolatedAsyncioTestCase):
         # Should have used up all the retry attempts and been kicked out of the retry queue
         self.assertEqual(set(), set(self.circuit.unacked_reliable))
 
+    async def test_reliable_resend_timer(self):
+        self.circuit.resend_every = 0.01
+        msg = Message('ChatFromViewer', flags=PacketFlags.RELIABLE)
+        self.circuit.send_reliable(msg)
+        # Should get resent without anyone having to poll the circuit
+        await asyncio.sleep(0.05)
+        self.assertLess(self.circuit.unacked_reliable[(Direction.OUT, 1)].tries_left, 10)
+        self.circuit.collect_acks(Message("PacketAck", Block("Packets", ID=msg.packet_id), direction=Direction.IN))
+        await asyncio.sleep(0.05)
+        # Nothing left to resend, so nothing should be waiting to fire
+        self.assertIsNone(self.circuit._resend_handle)
+        self.assertEqual([], self.circuit._resend_queue)
+
+    async def test_reliable_resend_timer_paused_while_dead(self):
+        self.circuit.resend_every = 0.01
+        self.circuit.is_alive = False
+        self.circuit.send_reliable(Message('ChatFromViewer', flags=PacketFlags.RELIABLE))
+        self.assertIsNone(self.circuit._resend_handle)
+        # Should start resending once the circuit comes back
+        self.circuit.is_alive = True
+        self.assertIsNotNone(self.circuit._resend_handle)
+        await asyncio.sleep(0.05)
+        self.assertLess(self.circuit.unacked_reliable[(Direction.OUT, 1)].tries_left, 10)
+        self.circuit.disconnect()
+        self.assertIsNone(self.circuit._resend_handle)
+
     async def test_reliable_ack_collection(self):
         msg = Message('ChatFromViewer', flags=PacketFlags.RELIABLE)
         fut = self.circuit.send_reliable(msg)
@@ -280,6 +385,64 @@ class PacketIDTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(0, len(self.circuit.unacked_reliable))
         self.assertTrue(fut.done())
 
+    async def test_acked_not_resent(self):
+        msg = Message('ChatFromViewer', flags=PacketFlags.RELIABLE)
+        self.circuit.send_reliable(msg)
+        self.circuit.send_reliable(Message('ChatFromViewer', flags=PacketFlags.RELIABLE))
+        self.circuit.collect_acks(Message("PacketAck", Block("Packets", ID=msg.packet_id), direction=Direction.IN))
+        self.circuit.resend_every = 0.0
+        self.circuit.resend_unacked()
+        # Only the unacked message should have been resent
+        self.assertSequenceEqual(self.circuit.sent_simple, [
+            (1, "ChatFromViewer", Direction.OUT, True, ()),
+            (2, "ChatFromViewer", Direction.OUT, True, ()),
+            (2, "ChatFromViewer", Direction.OUT, True, ()),
+        ])
+        # Stale entry for the acked message should have been dropped from the resend queue
+        self.assertEqual(1, len(self.circuit._resend_queue))
+
+    async def test_track_reliable(self):
+        circuit = Circuit(None, ("127.0.0.1", 1), reliable_window=3)
+        self.assertTrue(circuit.track_reliable(1))
+        self.assertFalse(circuit.track_reliable(1))
+        for packet_id in (2, 3, 4):
+            self.assertTrue(circuit.track_reliable(packet_id))
+        # 1 should have fallen out of the window
+        self.assertTrue(circuit.track_reliable(1))
+        self.assertFalse(circuit.track_reliable(4))
+        self.assertEqual([3, 4, 1], list(circuit.seen_reliable))
+
+    async def test_batch_sends(self):
+        transport = MockTransport()
+        circuit = Circuit(("127.0.0.1", 0), ("127.0.0.1", 1), transport, batch_sends=True)
+        with unittest.mock.patch.object(transport, "send_packets", wraps=transport.send_packets) as send_mock:
+            for _ in range(3):
+                circuit.send(Message('ChatFromViewer', Block('AgentData', AgentID=UUID(), SessionID=UUID())))
+            # Nothing goes out until the next event loop tick
+            self.assertEqual([], transport.packets)
+            await asyncio.sleep(0)
+            self.assertEqual(3, len(transport.packets))
+            send_mock.assert_called_once()
+            # Disconnecting should flush anything still queued
+            circuit.send(Message('ChatFromViewer', Block('AgentData', AgentID=UUID(), SessionID=UUID())))
+            circuit.disconnect()
+            self.assertEqual(4, len(transport.packets))
+            self.assertEqual(2, send_mock.call_count)
+
+    async def test_coalesced_acks_serialized_once(self):
+        transport = MockTransport()
+        circuit = Circuit(("127.0.0.1", 0), ("127.0.0.1", 1), transport, coalesce_acks=True)
+        circuit.send_acks([1, 2])
+        msg = Message('ChatFromViewer', Block('AgentData', AgentID=UUID(), SessionID=UUID()), acks=(5,))
+        with unittest.mock.patch.object(
+                circuit.serializer, "serialize", wraps=circuit.serializer.serialize) as serialize_mock:
+            circuit.send(msg)
+            serialize_mock.assert_called_once()
+        self.assertEqual((5, 1, 2), msg.acks)
+        # The ACK trailer tacked onto the serialized message should match a full serialization
+        self.assertEqual(circuit.serializer.serialize(msg), transport.packets[0][0])
+        circuit.disconnect()
+
     async def test_start_ping_check(self):
         # Should not break if no unacked
         self._send_message(Message(
@@ -12,7 +12,7 @@ from hippolyzer.lib.base.message.udpdeserializer import UDPMessageDeserializer
 from hippolyzer.lib.base.message.udpserializer import UDPMessageSerializer
 from hippolyzer.lib.base.objects import Object, normalize_object_update_compressed_data
 from hippolyzer.lib.base.templates import ExtraParamType, PCode, JUST_CREATED_FLAGS
-from hippolyzer.lib.client.object_manager import ObjectUpdateType
+from hippolyzer.lib.client.object_manager import ObjectEvent, ObjectUpdateType
 from hippolyzer.lib.proxy.addons import AddonManager
 from hippolyzer.lib.proxy.addon_utils import BaseAddon
 from hippolyzer.lib.proxy.region import ProxiedRegion
@@ -233,6 +233,15 @@ class RegionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncioT
         self.assertEqual(2, len(self.region_object_manager))
         self.assertIsNotNone(self.region_object_manager.lookup_localid(2))
 
+    def test_killing_children_keeps_link_order(self):
+        parent = self._create_object(local_id=1)
+        for local_id in range(2, 7):
+            self._create_object(local_id=local_id, parent_id=parent.LocalID)
+        self._kill_object(6)
+        self._kill_object(3)
+        self.assertSequenceEqual([2, 4, 5], parent.ChildIDs)
+        self.assertSequenceEqual([2, 4, 5], [x.LocalID for x in parent.Children])
+
     def test_attachment_orphan_parent_tracking(self):
         """
         Test that multi-level parenting trees handle orphaning correctly.
@@ -292,6 +301,30 @@ class RegionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncioT
         self.assertEqual(2, len(events))
         self.assertEqual({"Position", "TextureEntry"}, events[1][2])
 
+    def test_lazy_object_updates(self):
+        self.session_manager.settings.LAZY_OBJECT_UPDATES = True
+        obj = self._create_object(local_id=1)
+        self.assertIsNotNone(obj.RawUpdateVars)
+        # Same update again, nothing should have changed, and nothing should be decoded
+        msg = self._create_object_update(local_id=obj.LocalID, full_id=obj.FullID)
+        with mock.patch.object(Block, "deserialize_var", autospec=True, side_effect=Block.deserialize_var) as deser:
+            self.message_handler.handle(msg)
+            deserialized = {call.args[1] for call in deser.call_args_list}
+        self.assertEqual({"ClickAction", "UpdateFlags", "State"}, deserialized)
+        msg = self._create_object_update(local_id=obj.LocalID, full_id=obj.FullID, pos=(2.0, 2.0, 2.0))
+        self.message_handler.handle(msg)
+        events = self.object_addon.events
+        self.assertEqual(2, len(events))
+        # Unlike the non-lazy case, the TextureEntry isn't reported as updated
+        self.assertEqual({"Position"}, events[1][2])
+
+        # Other kinds of updates make us forget the raw vars
+        self.message_handler.handle(self._create_object_update_cached(obj.LocalID, crc=obj.CRC))
+        self.assertIsNone(obj.RawUpdateVars)
+        msg = self._create_object_update(local_id=obj.LocalID, full_id=obj.FullID, pos=(2.0, 2.0, 2.0))
+        self.message_handler.handle(msg)
+        self.assertIsNotNone(obj.RawUpdateVars)
+
     def test_region_position(self):
         parent = self._create_object(pos=(0.0, 1.0, 0.0))
         child = self._create_object(parent_id=parent.LocalID, pos=(0.0, 1, 0.0))
@@ -496,6 +529,14 @@ class RegionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncioT
         self._kill_object(1238)
         self.assertTrue(fut.cancelled())
 
+        # All kinds of futures for the object should be cancelled
+        obj = self._create_object(1239)
+        update_fut = self.region_object_manager.request_objects(1239)[0]
+        props_fut = self.region_object_manager.request_object_properties(obj)[0]
+        self._kill_object(1239)
+        self.assertTrue(update_fut.cancelled())
+        self.assertTrue(props_fut.cancelled())
+
         # Object manager being cleared due to region death should cancel
         self.assertFalse(pending_2.cancelled())
         self.region_object_manager.clear()
@@ -577,6 +618,24 @@ class SessionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncio
         self.assertEqual(1, len(av_list))
         self.assertEqual(obj, av_list[0].Object)
 
+    def test_addon_batch_hook_grouped_by_region(self):
+        objs = [self._create_object(region_handle=handle) for handle in (123, 124, 123, 124)]
+        batches = []
+
+        class BatchTrackingAddon(BaseAddon):
+            def handle_objects_updated(self, session, region, events, msg: Optional[Message]):
+                batches.append((region.handle, [x.object.LocalID for x in events]))
+
+        AddonManager.init([], None, [BatchTrackingAddon()])
+        # Objects from different regions interleaved in the same batch
+        self.session.objects._dispatch_object_batch(
+            [ObjectEvent(obj, set(), ObjectUpdateType.UPDATE) for obj in objs], None
+        )
+        self.assertEqual([
+            (123, [objs[0].LocalID, objs[2].LocalID]),
+            (124, [objs[1].LocalID, objs[3].LocalID]),
+        ], batches)
+
     def test_avatars_preference(self):
         # If we have a coarselocation for an avatar in one region and
         # an actual object in another, we should always prefer the
@@ -598,6 +657,40 @@ class SessionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncio
         self.assertEqual(2, len(av_list))
         self.assertTrue(all(a.Object for a in av_list))
 
+    def test_coarse_locations_per_region(self):
+        av_1_id, av_2_id = UUID.random(), UUID.random()
+        first_handler = WrappingMessageHandler(self.region)
+        second_handler = WrappingMessageHandler(self.second_region)
+        first_handler.handle(Message(
+            "CoarseLocationUpdate",
+            Block("AgentData", AgentID=av_1_id),
+            Block("Location", X=1, Y=2, Z=3),
+        ))
+        second_handler.handle(Message(
+            "CoarseLocationUpdate",
+            Block("AgentData", AgentID=av_2_id),
+            Block("Location", X=2, Y=3, Z=4),
+        ))
+        av_1 = self.session.objects.lookup_avatar(av_1_id)
+        # Updates from one region shouldn't touch avatars in another
+        second_handler.handle(Message(
+            "CoarseLocationUpdate",
+            Block("AgentData", AgentID=av_2_id),
+            Block("Location", X=3, Y=4, Z=5),
+        ))
+        self.assertIs(av_1, self.session.objects.lookup_avatar(av_1_id))
+        self.assertEqual(123, av_1.RegionHandle)
+        self.assertEqual(Vector3(3, 4, 20), self.session.objects.lookup_avatar(av_2_id).CoarseLocation)
+        # Avatar left the region
+        av_3_id = UUID.random()
+        first_handler.handle(Message(
+            "CoarseLocationUpdate",
+            Block("AgentData", AgentID=av_3_id),
+            Block("Location", X=1, Y=2, Z=3),
+        ))
+        self.assertFalse(av_1.Valid)
+        self.assertEqual({av_2_id, av_3_id}, {x.FullID for x in self.session.objects.all_avatars})
+
     def test_lookup_avatar(self):
         av_1 = self._create_object(pcode=PCode.AVATAR)
         av_obj = self.session.objects.lookup_avatar(av_1.FullID)
@@ -675,6 +768,35 @@ class SessionObjectManagerTests(ObjectManagerTestMixin, unittest.IsolatedAsyncio
             evt = await asyncio.wait_for(get_events(), 1.0)
             self.assertEqual(999, evt.object.LocalID)
 
+    async def test_handle_object_batch_event(self):
+        msg = self._create_object_update(local_id=998)
+        msg["ObjectData"].append(self._create_object_update(local_id=999)["ObjectData"][0])
+        with self.session.objects.events.subscribe_async(
+            message_names=(ObjectUpdateType.BATCH,),
+        ) as get_events:
+            self.message_handler.handle(msg)
+            evt = await asyncio.wait_for(get_events(), 1.0)
+            self.assertIs(msg, evt.message)
+            self.assertEqual([998, 999], [x.object.LocalID for x in evt.events])
+
+    def test_addon_batch_hook(self):
+        class BatchTrackingAddon(BaseAddon):
+            def __init__(self):
+                super().__init__()
+                self.batches = []
+
+            def handle_objects_updated(self, session, region, events, msg: Optional[Message]):
+                self.batches.append([x.object.LocalID for x in events])
+
+        batch_addon = BatchTrackingAddon()
+        AddonManager.init([], None, [self.object_addon, batch_addon])
+        msg = self._create_object_update(local_id=998)
+        msg["ObjectData"].append(self._create_object_update(local_id=999)["ObjectData"][0])
+        self.message_handler.handle(msg)
+        self.assertEqual([[998, 999]], batch_addon.batches)
+        # Addons that didn't opt in still get called per object
+        self.assertEqual([998, 999], [x[1].LocalID for x in self.object_addon.events])
+
     async def test_handle_object_update_predicate(self):
         with self.session.objects.events.subscribe_async(
             message_names=(ObjectUpdateType.UPDATE,),